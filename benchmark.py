@@ -0,0 +1,746 @@
+"""
+Benchmarks for the Best Buy classes.
+
+The suite measures the store hot paths on synthetic catalogs and carts and
+reports operations per second and peak memory. Results can be saved as a
+JSON baseline and later runs compared against it.
+
+Run: python benchmark.py [--max-size N] [--save FILE] [--compare FILE] [--extras]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bundles
+import catalog_file
+import columnar_store
+from cart import Cart
+import ingest
+import persistence
+import products
+import promotion_rules
+import promotions
+import sharded_store
+import store
+
+
+def bytes_per_object(factory, count=100_000):
+    """
+    Measure the memory used by objects created by the factory.
+    Memory of the names and of the list holding the objects is not included.
+    :param factory: function which takes an index and returns a new object
+    :param count: how many objects to create
+    :return: average bytes per object
+    """
+    names = [f"Product {i}" for i in range(count)]
+    tracemalloc.start()
+    objects = [factory(name, i) for i, name in enumerate(names)]
+    memory_used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    list_size = objects.__sizeof__()
+    return (memory_used - list_size) / count
+
+
+def bench_product_memory(count=100_000):
+    """
+    Print the memory used per product for each of the product classes.
+    """
+    factories = {
+        "ImmaterialProduct": lambda name, i: products.ImmaterialProduct(name, i),
+        "Product": lambda name, i: products.Product(name, i, 10),
+        "LimitedImmaterialProduct":
+            lambda name, i: products.LimitedImmaterialProduct(name, i, 2),
+        "LimitedProduct": lambda name, i: products.LimitedProduct(name, i, 10, 2),
+    }
+    print(f"Memory per product ({count} products)")
+    for class_name, factory in factories.items():
+        print(f"   {class_name:.<30} {bytes_per_object(factory, count):8.1f} bytes")
+
+
+def bench_columnar_store(count=100_000):
+    """
+    Print the memory per product and the speed of totals, active filtering,
+    get_all_products and bulk restocks of Store against ColumnarStore.
+    Memory of the names is not included: both stores hold the same strings.
+    """
+    print(f"Columnar store ({count} products)")
+    names = [f"Product {i}" for i in range(count)]
+    stores = {}
+    for label, store_class in (("Store", store.Store),
+                               ("ColumnarStore", columnar_store.ColumnarStore)):
+        tracemalloc.start()
+        best_buy = store_class([products.Product(name, price=i % 1000 + 1, quantity=10)
+                                for i, name in enumerate(names)])
+        memory_used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stores[label] = best_buy
+        print(f"   {label + ' memory':.<30} {memory_used / count:10.1f} bytes per product")
+    for label, best_buy in stores.items():
+        all_products = best_buy.get_all_products()
+        timings = []
+        for operation in (best_buy.get_total_quantity, best_buy.get_product_type_quantity,
+                          best_buy.get_all_products):
+            start_time = time.perf_counter()
+            operation()
+            timings.append(time.perf_counter() - start_time)
+        # Deactivate every tenth product so the active products must be found again
+        for product in all_products[::10]:
+            product.set_quantity(0)
+        start_time = time.perf_counter()
+        best_buy.get_all_products()
+        timings.append(time.perf_counter() - start_time)
+        items = [(product, 1) for product in all_products]
+        start_time = time.perf_counter()
+        if isinstance(best_buy, columnar_store.ColumnarStore):
+            best_buy.restock(items)
+        else:
+            for product, quantity in items:
+                product.set_quantity(product.get_quantity() + quantity)
+        timings.append(time.perf_counter() - start_time)
+        print(f"   {label:.<30} total {timings[0] * 1000:7.2f} ms, types "
+              f"{timings[1] * 1000:7.2f} ms, all products {timings[2] * 1000:7.2f} ms, "
+              f"after a change {timings[3] * 1000:7.2f} ms, restock {timings[4] * 1000:7.2f} ms")
+
+
+def make_store(product_count, quantity=1000):
+    """
+    Create a store with product_count physical products.
+    """
+    return store.Store([products.Product(f"Product {i}", price=i % 1000 + 1, quantity=quantity)
+                        for i in range(product_count)])
+
+
+def bench_parallel_orders(order_count=20_000, thread_counts=(1, 2, 4, 8)):
+    """
+    Print the throughput of Store.order_in_parallel with different thread counts
+    and check that no product has been oversold.
+    """
+    print(f"Parallel orders ({order_count} orders of 3 lines)")
+    for thread_count in thread_counts:
+        # Not enough stock for all the orders
+        best_buy = make_store(100, quantity=500)
+        all_products = best_buy.get_all_products()
+        shopping_lists = [[(all_products[i % 100], 1), (all_products[(i * 7) % 100], 2),
+                           (all_products[(i * 13) % 100], 1)] for i in range(order_count)]
+        start_time = time.perf_counter()
+        results = best_buy.order_in_parallel(shopping_lists, max_workers=thread_count)
+        elapsed = time.perf_counter() - start_time
+        oversold = any(product.get_quantity() < 0 for product in all_products)
+        accepted = sum(1 for price, _ in results if price is not None)
+        print(f"   {thread_count:3} threads: {order_count / elapsed:10.0f} orders/s, "
+              f"{accepted} accepted, oversold: {oversold}")
+
+
+def bench_order_many(order_count=200_000, product_count=1000):
+    """
+    Print the throughput of Store.order_many against calling Store.order for
+    every shopping list, for a batch where no product runs out and for one
+    where the popular products run out.
+    """
+    print(f"Order batches ({order_count} orders, {product_count} products)")
+    for label, quantity in (("enough stock", order_count), ("products run out", 150)):
+        rates = []
+        for use_batch in (False, True):
+            best_buy = store.Store([products.Product(f"Product {i}", price=i + 1,
+                                                     quantity=quantity)
+                                    for i in range(product_count)])
+            all_products = best_buy.get_all_products()
+            shopping_lists = [[(all_products[i % 50], 1), (all_products[i % product_count], 2)]
+                              for i in range(order_count)]
+            start_time = time.perf_counter()
+            if use_batch:
+                results = best_buy.order_many(shopping_lists)
+            else:
+                results = [best_buy.order(shopping_list) for shopping_list in shopping_lists]
+            rates.append(order_count / (time.perf_counter() - start_time))
+        accepted = sum(price is not None for price, _ in results)
+        print(f"   {label:.<25} order {rates[0]:10.0f} orders/s, "
+              f"order_many {rates[1]:10.0f} orders/s, {accepted} accepted")
+
+
+def bench_sharded_orders(order_count=200_000, product_count=10_000, shard_counts=(1, 2, 4, 8)):
+    """
+    Print the throughput of ShardedStore.order_many with different numbers of
+    shards, against one Store in this process. Orders are by product name.
+    """
+    print(f"Sharded orders ({order_count} orders of 1 line, {os.cpu_count()} CPUs)")
+    orders = [[(f"Product {(i * 7919) % product_count}", 1)] for i in range(order_count)]
+    best_buy = make_store(product_count, quantity=order_count)
+    start_time = time.perf_counter()
+    best_buy.order_many(best_buy.resolve_shopping_list(items)[0] for items in orders)
+    elapsed = time.perf_counter() - start_time
+    print(f"   one Store......... {order_count / elapsed:10.0f} orders/s")
+    for shard_count in shard_counts:
+        sharded = sharded_store.ShardedStore(make_store(product_count, quantity=order_count)
+                                             .list_of_products, shard_count=shard_count)
+        start_time = time.perf_counter()
+        sharded.order_many(orders)
+        elapsed = time.perf_counter() - start_time
+        assert sharded.get_total_quantity() == best_buy.get_total_quantity()
+        sharded.close()
+        print(f"   {shard_count:3} shards........ {order_count / elapsed:10.0f} orders/s")
+
+
+def bench_purchase_checks(count=200_000):
+    """
+    Print the speed of precheck_purchase against the compiled purchase checks.
+    """
+    print(f"Purchase checks ({count} lines)")
+    for product in (products.ImmaterialProduct("Service", 10),
+                    products.Product("Product", 10, 10 ** 9),
+                    products.LimitedImmaterialProduct("Shipping", 10, maximum=10),
+                    products.LimitedProduct("Coffee", 10, 10 ** 9, maximum=10)):
+        lines = [(product, 1)] * count
+        start_time = time.perf_counter()
+        for line_product, quantity in lines:
+            line_product.precheck_purchase(quantity)
+        precheck_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        products.purchase_errors(lines)
+        compiled_time = time.perf_counter() - start_time
+        print(f"   {type(product).__name__:.<26} precheck_purchase {count / precheck_time:10.0f} "
+              f"lines/s, compiled {count / compiled_time:10.0f} lines/s")
+
+
+def bench_cart_building(line_counts=(100, 1000, 3000)):
+    """
+    Print the time to build an order line by line by validating the whole
+    list after each line, like main.get_order used to, against a Cart.
+    """
+    print("Building an order line by line")
+    for line_count in line_counts:
+        best_buy, shopping_list = _setup_cart(line_count)
+        start_time = time.perf_counter()
+        order_list = []
+        for line in shopping_list:
+            order_list.append(line)
+            best_buy.validate_shopping_list(order_list)
+            order_list = best_buy.merge_shopping_list_items(order_list)
+        list_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        _fill_cart((best_buy, shopping_list))
+        cart_time = time.perf_counter() - start_time
+        print(f"   {line_count:6} lines: validate whole list {list_time * 1000:10.2f} ms, "
+              f"Cart {cart_time * 1000:8.2f} ms")
+
+
+def bench_name_search(product_count=1_000_000, repeat=200):
+    """
+    Print the time to build the name search indexes and the latency of queries.
+    """
+    words = ["Google", "Pixel", "MacBook", "Air", "Bose", "Earbuds", "Windows", "License",
+             "Rare", "Coffee", "Service", "Contract", "Shipping", "Pro", "Max", "Mini"]
+    best_buy = store.Store([products.Product(
+        f"{words[i % 16]} {words[(i // 16) % 16]} {words[(i // 256) % 16]} {i}",
+        price=i % 1000 + 1, quantity=10) for i in range(product_count)])
+    print(f"Name search ({product_count} products)")
+    start_time = time.perf_counter()
+    best_buy.search("warm up")
+    best_buy.search_prefix("warm up")
+    print(f"   build indexes............ {time.perf_counter() - start_time:10.2f} s")
+    for query, prefix in (("pixel", False), ("goo pix mac", False), ("12345", False),
+                          ("Bose Air", True), ("nothing like this", False)):
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            found = (best_buy.search_prefix(query) if prefix else best_buy.search(query))
+        elapsed = (time.perf_counter() - start_time) / repeat
+        kind = "prefix" if prefix else "words"
+        print(f"   {kind} {query!r:.<20} {elapsed * 1e6:10.1f} us, {len(found)} found")
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        best_buy.add_product(products.Product(f"New product {i}", price=1, quantity=1))
+        best_buy.search("new")
+    elapsed = (time.perf_counter() - start_time) / repeat
+    print(f"   add product and search... {elapsed * 1e6:10.1f} us")
+
+
+def bench_price_queries(product_count=200_000, repeat=200):
+    """
+    Print the latency of price queries with the price index against sorting
+    the products for every query, and the cost of keeping the index up to date.
+    """
+    best_buy = store.Store([products.Product(f"Product {i}", price=(i * 7919) % 100_000 + 1,
+                                             quantity=10)
+                            for i in range(product_count)])
+    print(f"Price queries ({product_count} products)")
+    start_time = time.perf_counter()
+    best_buy.get_cheapest_products(1)
+    print(f"   build index.............. {(time.perf_counter() - start_time) * 1e3:10.1f} ms")
+    start_time = time.perf_counter()
+    for _ in range(5):
+        found = [product for product in sorted(best_buy.get_all_products())
+                 if 40_000 <= product.get_price() <= 40_100]
+    sorted_time = (time.perf_counter() - start_time) / 5
+    print(f"   sort and filter.......... {sorted_time * 1e6:10.1f} us, {len(found)} found")
+    for label, query in (("between 40000 and 40100",
+                          lambda: best_buy.get_products_between(40_000, 40_100)),
+                         ("cheapest 20", lambda: best_buy.get_cheapest_products(20)),
+                         ("most expensive 20",
+                          lambda: best_buy.get_most_expensive_products(20))):
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            found = query()
+        elapsed = (time.perf_counter() - start_time) / repeat
+        print(f"   {label:.<25} {elapsed * 1e6:10.1f} us, {len(found)} found")
+    all_products = best_buy.list_of_products
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        all_products[i].set_price(all_products[i].get_price() + 1)
+    elapsed = (time.perf_counter() - start_time) / repeat
+    print(f"   price change............. {elapsed * 1e6:10.1f} us")
+
+
+def bench_promotion_rules(rule_counts=(2, 10, 100, 1000, 10_000), repeat=100_000):
+    """
+    Print the cost of pricing a product through PromotionRules as the number
+    of rules grows. Two rules apply to the product, the others to other products.
+    """
+    print("Promotion rules")
+    for rule_count in rule_counts:
+        rules = promotion_rules.PromotionRules("Sale")
+        rules.add_rule(promotions.PercentDiscount("10% off", percent=10))
+        rules.add_rule(promotions.SecondHalfPrice("Second Half price!"),
+                       names=["Google Pixel 7"], priority=5)
+        rules.add_rules([promotion_rules.PromotionRule(
+            promotions.ThirdOneFree("Third One Free!"), names=[f"Product {i}"], priority=i % 10)
+            for i in range(rule_count - 2)])
+        pixel = products.Product("Google Pixel 7", price=500, quantity=10)
+        start_time = time.perf_counter()
+        rules.get_plan(pixel.name)
+        compile_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        for quantity in range(repeat):
+            rules.apply_promotion(pixel, quantity % 10 + 1)
+        elapsed = (time.perf_counter() - start_time) / repeat
+        print(f"   {len(rules.get_rules()):>6} rules: compile {compile_time * 1e6:8.1f} us, "
+              f"price {elapsed * 1e9:8.1f} ns")
+
+
+def bench_bundle_promotions(line_count=3000, rule_count=300, repeat=20):
+    """
+    Print the time to price an order of many lines with many basket promotions.
+    """
+    all_products = [products.Product(f"Product {i}", price=i % 1000 + 1, quantity=1_000_000)
+                    for i in range(line_count)]
+    bundle_promotions = bundles.BundlePromotions()
+    for i in range(rule_count):
+        names = [f"Product {(i * 10 + j) % line_count}" for j in range(20)]
+        if i % 3 == 0:
+            bundle_promotions.add(bundles.BuyAndGet(f"Deal {i}", buy_names=names[:10],
+                                                    get_names=names[10:], percent=20,
+                                                    priority=i % 5))
+        elif i % 3 == 1:
+            bundle_promotions.add(bundles.MixAndMatch(f"Deal {i}", names=names, quantity=3,
+                                                      price=1000, priority=i % 5))
+        else:
+            bundle_promotions.add(bundles.OrderDiscount(f"Deal {i}", minimum_total=i * 1000,
+                                                        amount=i))
+    best_buy = store.Store(all_products)
+    shopping_list = [(product, i % 5 + 1) for i, product in enumerate(all_products)]
+    line_prices = [product.name_and_price(quantity)[1] for product, quantity in shopping_list]
+    print(f"Basket promotions ({line_count} lines, {rule_count} rules)")
+    for label, promotions_of_store in (("without", None), ("with", bundle_promotions)):
+        best_buy.set_bundle_promotions(promotions_of_store)
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            price = best_buy.get_order_price(shopping_list, line_prices)
+        elapsed = (time.perf_counter() - start_time) / repeat
+        print(f"   {label + ' promotions':.<25} {elapsed * 1e3:10.2f} ms, price {price:.0f}")
+
+
+def bench_batch_pricing(count=200_000):
+    """
+    Print the speed of Promotion.apply_promotion against apply_promotion_batch.
+    """
+    all_products = [products.Product(f"Product {i}", price=i % 1000 + 1, quantity=100)
+                    for i in range(count)]
+    prices = [product.get_price() for product in all_products]
+    quantities = [i % 10 + 1 for i in range(count)]
+    print(f"Promotion pricing ({count} lines)")
+    for promotion in (promotions.SecondHalfPrice("Second Half price!"),
+                      promotions.ThirdOneFree("Third One Free!"),
+                      promotions.PercentDiscount("30% off!", percent=30)):
+        start_time = time.perf_counter()
+        scalar = [promotion.apply_promotion(product, quantity)
+                  for product, quantity in zip(all_products, quantities)]
+        scalar_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        batch = promotion.apply_promotion_batch(prices, quantities)
+        batch_time = time.perf_counter() - start_time
+        print(f"   {type(promotion).__name__:.<20} scalar {count / scalar_time:12.0f} lines/s, "
+              f"batch {count / batch_time:12.0f} lines/s, same: {scalar == batch}")
+
+
+def bench_exact_pricing(count=200_000):
+    """
+    Print the speed of float promotion pricing against exact pricing in whole
+    minor units, for single lines, batches and the total of one big order.
+    """
+    prices = [i % 100_000 + 1 for i in range(count)]
+    quantities = [i % 10 + 1 for i in range(count)]
+    print(f"Exact pricing ({count} lines)")
+    for promotion in (promotions.SecondHalfPrice("Second Half price!"),
+                      promotions.ThirdOneFree("Third One Free!"),
+                      promotions.PercentDiscount("17% off!", percent=17)):
+        timings = []
+        for batch in (promotion.apply_promotion_batch, promotion.apply_promotion_batch_exact):
+            start_time = time.perf_counter()
+            batch(prices, quantities)
+            timings.append(count / (time.perf_counter() - start_time))
+        print(f"   {type(promotion).__name__:.<20} batch float {timings[0]:12.0f} lines/s, "
+              f"exact {timings[1]:12.0f} lines/s")
+    all_products = [products.Product(f"Product {i}", price=i % 100_000 + 1, quantity=10 ** 12)
+                    for i in range(count)]
+    for product in all_products:
+        product.set_promotion(promotions.PercentDiscount("17% off!", percent=17))
+    best_buy = store.Store(all_products)
+    shopping_list = list(zip(all_products, quantities))
+    for exact in (False, True):
+        if exact:
+            products.pricing_mode.use_exact()
+        start_time = time.perf_counter()
+        price, _ = best_buy.order(shopping_list)
+        elapsed = time.perf_counter() - start_time
+        print(f"   Store.order {'exact' if exact else 'float'}........ "
+              f"{count / elapsed:12.0f} lines/s, total {price!r}")
+    products.pricing_mode.use_float()
+
+
+def bench_persistence(order_count=1_000_000, product_count=1000):
+    """
+    Print the write throughput of PersistentStore and the time to recover it.
+    """
+    print(f"Write-ahead log ({order_count} orders, {product_count} products)")
+    with tempfile.TemporaryDirectory() as directory:
+        best_buy = persistence.PersistentStore(
+            directory, [products.Product(f"Product {i}", price=i + 1, quantity=order_count)
+                        for i in range(product_count)],
+            snapshot_interval=order_count + 1)
+        all_products = best_buy.get_all_products()
+        shopping_lists = [[(all_products[i % product_count], 1)] for i in range(order_count)]
+        start_time = time.perf_counter()
+        best_buy.order_many(shopping_lists)
+        best_buy.sync()
+        elapsed = time.perf_counter() - start_time
+        print(f"   logged orders............... {order_count / elapsed:10.0f} orders/s")
+        best_buy.close()
+        start_time = time.perf_counter()
+        recovered = persistence.PersistentStore(directory)
+        elapsed = time.perf_counter() - start_time
+        print(f"   recovery.................... {elapsed:10.2f} s "
+              f"({order_count / elapsed:.0f} log entries/s)")
+        assert recovered.get_total_quantity() == best_buy.get_total_quantity()
+        recovered.close()
+
+
+def bench_catalog_open(sizes=(1000, 100_000, 1_000_000)):
+    """
+    Print the time to build a Store from product objects against the time to
+    open the same catalog from a catalog file.
+    """
+    print("Store start up")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = f"{directory}/catalog-{size}.bin"
+            start_time = time.perf_counter()
+            best_buy = make_store(size)
+            build_time = time.perf_counter() - start_time
+            catalog_file.write_catalog(path, best_buy.list_of_products)
+            start_time = time.perf_counter()
+            mapped = catalog_file.open_catalog(path)
+            first_product = mapped.product_at(size - 1)
+            open_time = time.perf_counter() - start_time
+            assert first_product.name == f"Product {size - 1}"
+            print(f"   {size:9} products: build {build_time * 1000:10.2f} ms, "
+                  f"open catalog {open_time * 1000:8.3f} ms")
+
+
+def bench_ingest(order_count=500_000, product_count=1000):
+    """
+    Print the throughput of streaming order ingestion and its peak memory use.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "orders.jsonl")
+        output_path = os.path.join(directory, "results.jsonl")
+        with open(input_path, "w", encoding="utf-8") as input_stream:
+            for i in range(order_count):
+                items = [[f"Product {(i * 7 + line) % product_count}", line + 1]
+                         for line in range(i % 4 + 1)]
+                input_stream.write(json.dumps({"id": i, "items": items}) + "\n")
+        input_size = os.path.getsize(input_path)
+        print(f"Order ingestion ({order_count} orders, {input_size / 1e6:.0f} MB)")
+        for measure_memory in (False, True):
+            best_buy = make_store(product_count, quantity=order_count)
+            if measure_memory:
+                tracemalloc.start()
+            start_time = time.perf_counter()
+            with open(input_path, encoding="utf-8") as input_stream, \
+                    open(output_path, "w", encoding="utf-8") as output_stream:
+                ingest.ingest(best_buy, input_stream, output_stream)
+            elapsed = time.perf_counter() - start_time
+            if measure_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"   peak memory while ingesting... {peak / 1e6:8.2f} MB")
+            else:
+                print(f"   throughput.................... {order_count / elapsed:8.0f} orders/s, "
+                      f"{input_size / elapsed / 1e6:.1f} MB/s")
+
+
+CATALOG_SIZES = (10, 1000, 100_000, 1_000_000)
+CART_SIZES = (1, 100, 10_000, 100_000)
+CART_CATALOG_SIZE = 1000
+# Repeat short operations until they have run for about this many seconds
+MIN_DURATION = 0.2
+
+
+def synthetic_products(count, quantity=1000):
+    """
+    Return count products of all the product classes.
+    """
+    product_list = []
+    for i in range(count):
+        name = f"Product {i}"
+        price = i % 1000 + 1
+        kind = i % 10
+        if kind == 7:
+            product_list.append(products.ImmaterialProduct(name, price))
+        elif kind == 8:
+            product_list.append(products.LimitedImmaterialProduct(name, price, maximum=count))
+        elif kind == 9:
+            product_list.append(products.LimitedProduct(name, price, quantity, maximum=quantity))
+        else:
+            product_list.append(products.Product(name, price, quantity))
+    return product_list
+
+
+def synthetic_cart(all_products, line_count):
+    """
+    Return a shopping list of line_count lines. Products repeat when there are
+    more lines than products, which is what merge_shopping_list_items is for.
+    LimitedProducts can only be bought one at a time, so they are left out:
+    repeated, they would make every big cart fail validation.
+    """
+    cart_products = [product for product in all_products
+                     if not isinstance(product, products.LimitedProduct)]
+    return [(cart_products[(i * 7) % len(cart_products)], 1) for i in range(line_count)]
+
+
+def cart_store():
+    """
+    Return a store with so much stock that orders never run out of it.
+    """
+    return store.Store(synthetic_products(CART_CATALOG_SIZE, quantity=10 ** 15))
+
+
+def _setup_cart(size):
+    best_buy = cart_store()
+    return best_buy, synthetic_cart(best_buy.list_of_products, size)
+
+
+def _fill_cart(state):
+    best_buy, shopping_list = state
+    cart = Cart(best_buy)
+    for product, quantity in shopping_list:
+        cart.add(product, quantity)
+
+
+def _setup_two_stores(size):
+    return (store.Store(synthetic_products(size // 2)),
+            store.Store(synthetic_products(size - size // 2)))
+
+
+def _setup_regional_stores(size):
+    # Four regional stores selling the same catalog
+    return [store.Store(synthetic_products(size // 4)) for _ in range(4)]
+
+
+def _setup_catalog_store(size):
+    best_buy = store.Store(synthetic_products(size))
+    # A tenth of the catalog is inactive, like discontinued products
+    for product in best_buy.list_of_products[::10]:
+        product.deactivate()
+    return best_buy
+
+
+def _setup_promotion_lines(size):
+    all_products = synthetic_products(min(size, CART_CATALOG_SIZE))
+    return [(all_products[i % len(all_products)], i % 10 + 1) for i in range(size)]
+
+
+def _add_products(product_list):
+    best_buy = store.Store([])
+    for product in product_list:
+        best_buy.add_product(product)
+
+
+def _promotion_case(promotion):
+    def run(lines):
+        for product, quantity in lines:
+            promotion.apply_promotion(product, quantity)
+    return f"{type(promotion).__name__}.apply_promotion", CART_SIZES, _setup_promotion_lines, run
+
+
+def suite_cases():
+    """
+    Return the benchmark cases of the suite.
+    A case is a tuple (name, sizes, setup, run). setup(size) returns the state
+    and run(state) does the measured work once. Runs must not use up the state.
+    """
+    return [
+        ("Store.add_product", CATALOG_SIZES, synthetic_products, _add_products),
+        ("Store.__add__", CATALOG_SIZES, _setup_two_stores, lambda stores: stores[0] + stores[1]),
+        ("Store.merge_stores", CATALOG_SIZES, _setup_regional_stores,
+         lambda stores: store.Store.merge_stores(*stores)),
+        ("Store.get_all_products", CATALOG_SIZES, _setup_catalog_store,
+         lambda best_buy: best_buy.get_all_products()),
+        ("Store.validate_shopping_list", CART_SIZES, _setup_cart,
+         lambda state: state[0].validate_shopping_list(state[1])),
+        ("Store.merge_shopping_list_items", CART_SIZES, _setup_cart,
+         lambda state: state[0].merge_shopping_list_items(state[1])),
+        ("Store.order", CART_SIZES, _setup_cart, lambda state: state[0].order(state[1])),
+        ("Cart.add", CART_SIZES, _setup_cart, _fill_cart),
+        _promotion_case(promotions.SecondHalfPrice("Second Half price!")),
+        _promotion_case(promotions.ThirdOneFree("Third One Free!")),
+        _promotion_case(promotions.PercentDiscount("30% off!", percent=30)),
+    ]
+
+
+def measure(setup, run, size):
+    """
+    Measure one case at one size.
+    After a warm up run, the run is repeated until it has taken MIN_DURATION
+    seconds, then run once more under tracemalloc for the peak memory.
+    :return: tuple (runs per second, peak memory in bytes)
+    """
+    state = setup(size)
+    # One warm up run fills caches, like in a store which has been running for a while
+    run(state)
+    runs = 0
+    start_time = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < MIN_DURATION:
+        run(state)
+        runs += 1
+        elapsed = time.perf_counter() - start_time
+    tracemalloc.start()
+    run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return runs / elapsed, peak
+
+
+def run_suite(max_size=1_000_000, case_filter=None):
+    """
+    Run the benchmark suite and print the results.
+    :param max_size: sizes above this are skipped
+    :param case_filter: only run cases whose name contains this text
+    :return: list of result dicts
+    """
+    results = []
+    print(f"{'case':<42} {'size':>9} {'ops/s':>12} {'items/s':>14} {'peak memory':>14}")
+    for name, sizes, setup, run in suite_cases():
+        if case_filter and case_filter not in name:
+            continue
+        for size in sizes:
+            if size > max_size:
+                continue
+            ops_per_second, peak = measure(setup, run, size)
+            results.append({"case": name, "size": size, "ops_per_second": ops_per_second,
+                            "items_per_second": ops_per_second * size,
+                            "peak_memory_bytes": peak})
+            print(f"{name:<42} {size:>9} {ops_per_second:>12.1f} "
+                  f"{ops_per_second * size:>14.0f} {peak / 1e6:>11.2f} MB")
+    return results
+
+
+def save_baseline(path, results):
+    """
+    Save the results as a JSON baseline.
+    """
+    with open(path, "w", encoding="utf-8") as baseline_file:
+        json.dump({"python": sys.version, "platform": platform.platform(),
+                   "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results},
+                  baseline_file, indent=1)
+
+
+def compare_to_baseline(path, results, tolerance=0.2):
+    """
+    Print how the results compare to a saved baseline.
+    :param tolerance: a case more than this much slower than the baseline is a regression
+    :return: list of (case, size) which regressed
+    """
+    with open(path, encoding="utf-8") as baseline_file:
+        baseline = {(result["case"], result["size"]): result
+                    for result in json.load(baseline_file)["results"]}
+    regressions = []
+    print(f"\nCompared to {path}")
+    for result in results:
+        old = baseline.get((result["case"], result["size"]))
+        if old is None:
+            continue
+        speed = result["ops_per_second"] / old["ops_per_second"]
+        memory = result["peak_memory_bytes"] / max(old["peak_memory_bytes"], 1)
+        regressed = speed < 1 - tolerance
+        if regressed:
+            regressions.append((result["case"], result["size"]))
+        print(f"{result['case']:<42} {result['size']:>9} speed x{speed:6.2f} "
+              f"memory x{memory:6.2f}{'   REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def run_extras():
+    """
+    Run the benchmarks of individual features.
+    """
+    bench_product_memory()
+    bench_columnar_store()
+    bench_parallel_orders()
+    bench_order_many()
+    bench_sharded_orders()
+    bench_purchase_checks()
+    bench_cart_building()
+    bench_name_search()
+    bench_price_queries()
+    bench_promotion_rules()
+    bench_bundle_promotions()
+    bench_batch_pricing()
+    bench_exact_pricing()
+    bench_persistence()
+    bench_catalog_open()
+    bench_ingest()
+
+
+def main():
+    """
+    Run the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the Best Buy store.")
+    parser.add_argument("--max-size", type=int, default=1_000_000,
+                        help="skip catalog and cart sizes above this")
+    parser.add_argument("--case", help="only run cases whose name contains this text")
+    parser.add_argument("--save", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", help="compare the results to a JSON baseline")
+    parser.add_argument("--extras", action="store_true",
+                        help="also run the benchmarks of individual features")
+    arguments = parser.parse_args()
+    results = run_suite(arguments.max_size, arguments.case)
+    if arguments.save:
+        save_baseline(arguments.save, results)
+    regressions = []
+    if arguments.compare:
+        regressions = compare_to_baseline(arguments.compare, results)
+    if arguments.extras:
+        run_extras()
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
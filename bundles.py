@@ -0,0 +1,339 @@
+"""
+Basket promotions for the Best Buy store.
+
+The promotions of the promotions module price one product at a time.
+Basket promotions look at the whole order once the prices of its lines are
+known, and lower the price of the order:
+
+    BuyAndGet      buy some products, get other products at a percent off
+    MixAndMatch    any n products of a group for a fixed price
+    OrderDiscount  an amount or a percent off orders above a total
+
+    bundle_promotions = BundlePromotions()
+    bundle_promotions.add(BuyAndGet("Mac and earbuds", buy_names=["MacBook Air M2"],
+                                    get_names=["Bose QuietComfort Earbuds"], percent=20))
+    best_buy.set_bundle_promotions(bundle_promotions)
+
+The lines of the order are merged by product into pools of units with the
+same unit price. Each unit is used by one deal at most. Deals are applied
+in priority order, and each deal takes units from the pools sorted by unit
+price, so no combinations are tried and the cost grows with the number of
+products the deals name. Order discounts are applied last, to the price
+left after the other deals, and only the largest one is used.
+"""
+
+from abc import ABC, abstractmethod
+from fractions import Fraction
+
+import products
+import promotions
+
+
+def _unit_price(pool):
+    return pool[0]
+
+
+def _count(pools):
+    """
+    Return the number of units left in the pools.
+    """
+    return sum(pool[1] for pool in pools)
+
+
+def _take(pools, count):
+    """
+    Take count units from the pools in list order.
+    :return: the value of the units taken
+    """
+    value = 0
+    for pool in pools:
+        if count == 0:
+            break
+        taken = min(count, pool[1])
+        pool[1] -= taken
+        count -= taken
+        value += pool[0] * taken
+    return value
+
+
+class Basket:
+    """
+    Units of an order grouped by product name, for basket promotions.
+    """
+    def __init__(self, shopping_list, line_prices, exact=False):
+        """
+        Merge the lines of an order by product.
+        :param shopping_list: A list of tuples (product, quantity)
+        :param line_prices: the price of each line
+        :param exact: keep unit prices as exact fractions
+        """
+        merged = {}
+        for (product, quantity), price in zip(shopping_list, line_prices):
+            line = merged.get(product)
+            if line is None:
+                merged[product] = [quantity, price]
+            else:
+                line[0] += quantity
+                line[1] += price
+        # product name -> pools [unit price, units left], one per product
+        self._pools = {}
+        for product, (quantity, price) in merged.items():
+            if quantity > 0:
+                unit_price = Fraction(price) / quantity if exact else price / quantity
+                self._pools.setdefault(product.name, []).append([unit_price, quantity])
+
+    def names(self):
+        """
+        Return the product names in the basket.
+        """
+        return self._pools.keys()
+
+    def pools(self, names):
+        """
+        Return the pools of the products with the names which have units left.
+        """
+        if len(names) < len(self._pools):
+            found = [pool for name in names for pool in self._pools.get(name, ())]
+        else:
+            found = [pool for name, pools in self._pools.items() if name in names
+                     for pool in pools]
+        return [pool for pool in found if pool[1] > 0]
+
+
+class BundlePromotion(ABC):
+    """
+    Abstract base class for promotions on the units of a basket.
+    """
+    def __init__(self, name, names, priority=0):
+        """
+        :param name: name of the promotion
+        :param names: names of the products the promotion looks at
+        :param priority: promotions with a higher priority take their units first
+        """
+        self.name = name
+        self.names = frozenset(names)
+        self.priority = priority
+
+    @abstractmethod
+    def apply(self, basket):
+        """
+        Take the units of the deal from the basket.
+        :param basket: instance of Basket
+        :return: the discount
+        """
+
+    def __str__(self):
+        return self.name
+
+
+class BuyAndGet(BundlePromotion):
+    """
+    For every buy_quantity units bought from one group, get_quantity units
+    from another group are percent off. The most expensive units of the get
+    group are discounted, and the cheapest units of the buy group are used.
+    The groups may overlap.
+    """
+    def __init__(self, name, buy_names, get_names, percent, buy_quantity=1, get_quantity=1,
+                 priority=0):
+        if buy_quantity <= 0 or get_quantity <= 0:
+            raise ValueError("Quantities of a deal must be positive")
+        self.buy_names = frozenset(buy_names)
+        self.get_names = frozenset(get_names)
+        super().__init__(name, self.buy_names | self.get_names, priority)
+        self.percent = percent
+        # The percent is read as written, like PercentDiscount does
+        self._part = Fraction(str(percent)) / 100
+        self.buy_quantity = buy_quantity
+        self.get_quantity = get_quantity
+
+    @staticmethod
+    def _units_left(pools, taken_pools, taken_count):
+        """
+        Return the units left in pools after taken_count units are taken
+        from taken_pools in list order.
+        """
+        taken = {}
+        for pool in taken_pools:
+            if taken_count == 0:
+                break
+            taken[id(pool)] = min(taken_count, pool[1])
+            taken_count -= taken[id(pool)]
+        return sum(pool[1] - taken.get(id(pool), 0) for pool in pools)
+
+    def apply(self, basket):
+        get_pools = sorted(basket.pools(self.get_names), key=_unit_price, reverse=True)
+        buy_pools = sorted(basket.pools(self.buy_names), key=_unit_price)
+        deals = min(_count(get_pools) // self.get_quantity,
+                    _count(buy_pools) // self.buy_quantity)
+        if self.buy_names & self.get_names:
+            # Units taken as gifts cannot be bought, so find the most deals
+            # which leave enough units to buy. Fewer deals never need more.
+            lowest, highest = 0, deals
+            while lowest < highest:
+                middle = (lowest + highest + 1) // 2
+                if (self._units_left(buy_pools, get_pools, middle * self.get_quantity)
+                        >= middle * self.buy_quantity):
+                    lowest = middle
+                else:
+                    highest = middle - 1
+            deals = lowest
+        if deals == 0:
+            return 0
+        value = _take(get_pools, deals * self.get_quantity)
+        _take(buy_pools, deals * self.buy_quantity)
+        return value * self._part
+
+
+class MixAndMatch(BundlePromotion):
+    """
+    Any quantity units of the group cost price together. Sets are made of
+    the most expensive units first, as long as a set saves money.
+    """
+    def __init__(self, name, names, quantity, price, priority=0):
+        if quantity <= 0:
+            raise ValueError("Quantity of a deal must be positive")
+        super().__init__(name, names, priority)
+        self.quantity = quantity
+        self.price = price
+
+    def apply(self, basket):
+        quantity = self.quantity
+        discount = 0
+        # Units of the set being filled: value, units still needed and (pool, units) taken
+        set_value = 0
+        needed = quantity
+        set_units = []
+        for pool in sorted(basket.pools(self.names), key=_unit_price, reverse=True):
+            unit_price, available = pool
+            while available:
+                if needed == quantity and available >= quantity:
+                    # Whole sets from this pool alone
+                    saving = unit_price * quantity - self.price
+                    if saving <= 0:
+                        return discount
+                    sets = available // quantity
+                    pool[1] -= sets * quantity
+                    available -= sets * quantity
+                    discount += sets * saving
+                    continue
+                taken = min(needed, available)
+                set_units.append((pool, taken))
+                set_value += unit_price * taken
+                needed -= taken
+                available -= taken
+                if needed == 0:
+                    # Later sets are made of cheaper units, so they save less
+                    if set_value - self.price <= 0:
+                        return discount
+                    for set_pool, units in set_units:
+                        set_pool[1] -= units
+                    discount += set_value - self.price
+                    set_value = 0
+                    needed = quantity
+                    set_units = []
+        return discount
+
+
+class OrderDiscount:
+    """
+    An amount plus a percent off the price of orders of at least minimum_total.
+    """
+    def __init__(self, name, minimum_total, amount=0, percent=0):
+        self.name = name
+        self.minimum_total = minimum_total
+        self.amount = amount
+        self.percent = percent
+        self._part = Fraction(str(percent)) / 100
+
+    def get_discount(self, total):
+        """
+        Return the discount of an order priced total, never more than total.
+        """
+        if total < self.minimum_total:
+            return 0
+        return min(total, self.amount + total * self._part)
+
+    def __str__(self):
+        return self.name
+
+
+class BundlePromotions:
+    """
+    The basket promotions of a store.
+    """
+    def __init__(self, bundle_promotions=()):
+        """
+        :param bundle_promotions: instances of BundlePromotion or OrderDiscount
+        """
+        self._promotions = []
+        # promotion -> rank, highest priority first, then in the order added
+        self._ranks = {}
+        # product name -> bundle promotions which look at it
+        self._by_name = {}
+        self._order_discounts = []
+        for promotion in bundle_promotions:
+            self.add(promotion)
+
+    def get_promotions(self):
+        """
+        Return the basket promotions in the order they were added.
+        """
+        return list(self._promotions)
+
+    def add(self, promotion):
+        """
+        Add a basket promotion.
+        :param promotion: instance of BundlePromotion or OrderDiscount
+        """
+        if not isinstance(promotion, (BundlePromotion, OrderDiscount)):
+            raise TypeError("promotion must be of type BundlePromotion or OrderDiscount")
+        self._promotions.append(promotion)
+        self._index()
+
+    def remove(self, promotion):
+        """
+        Remove a basket promotion.
+        """
+        if promotion in self._promotions:
+            self._promotions.remove(promotion)
+            self._index()
+
+    def _index(self):
+        """
+        Rebuild the indexes of the promotions.
+        """
+        bundle_promotions = sorted(
+            (promotion for promotion in self._promotions
+             if isinstance(promotion, BundlePromotion)),
+            key=lambda promotion: -promotion.priority)
+        self._ranks = {promotion: rank for rank, promotion in enumerate(bundle_promotions)}
+        self._by_name = {}
+        for promotion in bundle_promotions:
+            for name in promotion.names:
+                self._by_name.setdefault(name, []).append(promotion)
+        self._order_discounts = [promotion for promotion in self._promotions
+                                 if isinstance(promotion, OrderDiscount)]
+
+    def get_price(self, shopping_list, line_prices):
+        """
+        Return the price of an order after the basket promotions.
+        :param shopping_list: A list of tuples (product, quantity)
+        :param line_prices: the price of each line with the product promotions applied
+        :return: the price. In exact pricing mode it is an integer rounded
+                 with the rounding policy of the pricing mode.
+        """
+        exact = products.pricing_mode.exact
+        basket = Basket(shopping_list, line_prices, exact)
+        # Only the promotions which name a product of the basket can apply
+        matching = {promotion for name in basket.names()
+                    for promotion in self._by_name.get(name, ())}
+        price = sum(line_prices)
+        for promotion in sorted(matching, key=self._ranks.__getitem__):
+            price -= promotion.apply(basket)
+        price -= max((order_discount.get_discount(price)
+                      for order_discount in self._order_discounts), default=0)
+        if exact:
+            price = Fraction(price)
+            return promotions.divide_rounded(price.numerator, price.denominator,
+                                             products.pricing_mode.rounding)
+        return float(price) if isinstance(price, Fraction) else price
@@ -0,0 +1,185 @@
+"""
+Shopping cart for the Best Buy store.
+
+A Cart is bound to one Store. It keeps one line per product with the merged
+quantity and the price of the line, and a running total. Adding or removing
+a line checks that line only, so building a cart of k lines costs O(k)
+instead of validating the whole list again after every change.
+"""
+
+import products
+
+
+class Cart:
+    """
+    Shopping cart bound to a store.
+    """
+    def __init__(self, best_buy):
+        """
+        Initialize an empty cart.
+        :param best_buy: instance of the class Store
+        """
+        self.best_buy = best_buy
+        # product -> merged quantity, in the order the products were first added
+        self._quantities = {}
+        # product -> price of the merged quantity
+        self._prices = {}
+        self._total_price = 0
+        # Products of the cart whose promotion prices cannot be cached, for
+        # example promotion rules with date windows. They are priced every time.
+        self._uncacheable = set()
+        # Store version and pricing mode version at which the line prices were computed
+        self._priced_version = self._price_version()
+        # Store version at which all the lines were known to be valid, None if unknown
+        self._validated_version = best_buy.get_version()
+
+    def __len__(self):
+        return len(self._quantities)
+
+    def __contains__(self, product):
+        return product in self._quantities
+
+    def items(self):
+        """
+        Return the lines of the cart.
+        :return: A list of tuples (product, quantity). Each product only once.
+        """
+        return list(self._quantities.items())
+
+    def get_quantity(self, product):
+        """
+        Return the quantity of the product in the cart, 0 if it is not in the cart.
+        """
+        return self._quantities.get(product, 0)
+
+    def _price_version(self):
+        """
+        Return what the line prices depend on: the store version, which
+        changes with prices and promotions, and the pricing mode version.
+        """
+        return self.best_buy.get_version(), products.pricing_mode.version
+
+    def get_total_price(self):
+        """
+        Return the price of the cart. Lines are priced again only if the store
+        or the pricing mode has changed since they were priced. The basket
+        promotions of the store are applied to the whole cart. Lines with a
+        promotion which cannot be cached are priced every time.
+        """
+        if self._priced_version != self._price_version():
+            self._prices = {product: product.name_and_price(quantity)[1]
+                            for product, quantity in self._quantities.items()}
+            self._total_price = sum(self._prices.values())
+            self._uncacheable = {product for product in self._quantities
+                                 if self._is_uncacheable(product)}
+            self._priced_version = self._price_version()
+        else:
+            for product in self._uncacheable:
+                price = product.name_and_price(self._quantities[product])[1]
+                self._total_price += price - self._prices[product]
+                self._prices[product] = price
+        if self.best_buy.get_bundle_promotions() is not None and self._quantities:
+            return self.best_buy.get_order_price(self.items(), list(self._prices.values()))
+        return self._total_price
+
+    @staticmethod
+    def _is_uncacheable(product):
+        """
+        Test if the price of the product may change without the store being told.
+        """
+        return product._promotion is not None and not product._promotion.cacheable
+
+    def _set_line(self, product, quantity):
+        """
+        Set the quantity of a line which has been checked, remove it if quantity is 0.
+        """
+        if quantity == 0:
+            del self._quantities[product]
+            self._total_price -= self._prices.pop(product)
+            self._uncacheable.discard(product)
+        else:
+            self._quantities[product] = quantity
+            if self._is_uncacheable(product):
+                self._uncacheable.add(product)
+            price = product.name_and_price(quantity)[1]
+            self._total_price += price - self._prices.get(product, 0)
+            self._prices[product] = price
+        if not self._quantities:
+            self._total_price = 0
+        # The other lines are still known to be valid only if the store has not
+        # changed since they were checked
+        version = self.best_buy.get_version()
+        if self._validated_version != version:
+            other_lines = len(self._quantities) - (1 if quantity > 0 else 0)
+            self._validated_version = version if other_lines == 0 else None
+
+    def _check_line(self, product, quantity):
+        """
+        Check the format of a line and that the store can deliver the quantity.
+        :return: (True/False, message) like Store.validate_shopping_list
+        """
+        validation_result, message = self.best_buy.validate_shopping_list_format(
+            [(product, quantity)])
+        if validation_result is False:
+            return validation_result, message
+        return self.best_buy.validate_merged_shopping_list(
+            [(product, self.get_quantity(product) + quantity)])
+
+    def add(self, product, quantity):
+        """
+        Add a quantity of a product to the cart. Only the line of the product is checked.
+        :param product: product of the store
+        :param quantity: how many pieces to add
+        :return: If added: True, "No errors"
+                 If not:   False, "Error message"
+        """
+        validation_result, message = self._check_line(product, quantity)
+        if validation_result is False:
+            return validation_result, message
+        self._set_line(product, self.get_quantity(product) + quantity)
+        return True, "No errors"
+
+    def remove(self, product, quantity=None):
+        """
+        Remove a quantity of a product from the cart.
+        :param product: product in the cart
+        :param quantity: how many pieces to remove, None to remove the whole line
+        :return: If removed: True, "No errors"
+                 If not:   False, "Error message"
+        """
+        if product not in self._quantities:
+            return False, f"Product {product.name} is not in the cart"
+        if quantity is None or (isinstance(quantity, int)
+                                and quantity >= self._quantities[product]):
+            self._set_line(product, 0)
+            return True, "No errors"
+        if not isinstance(quantity, int) or quantity <= 0:
+            return False, "impossible quantity given"
+        validation_result, message = self._check_line(product, -quantity)
+        if validation_result is False:
+            return validation_result, message
+        self._set_line(product, self._quantities[product] - quantity)
+        return True, "No errors"
+
+    def clear(self):
+        """
+        Remove all the lines.
+        """
+        self._quantities = {}
+        self._prices = {}
+        self._total_price = 0
+        self._uncacheable = set()
+        self._priced_version = self._price_version()
+        self._validated_version = self.best_buy.get_version()
+
+    def order(self):
+        """
+        Order the cart from the store. The lines are not validated again unless
+        the store has changed since they were checked. The cart is emptied if
+        the order is accepted.
+        :return: Same as Store.order
+        """
+        price, message = self.best_buy.order_merged(self.items(), self._validated_version)
+        if price is not None:
+            self.clear()
+        return price, message
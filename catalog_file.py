@@ -0,0 +1,216 @@
+"""
+Binary catalog file for fast store start up.
+
+The file holds the columns of a ColumnarStore as fixed width arrays, plus a
+string table for the product names and a table of promotions. open_catalog
+maps the file into memory and uses the arrays as the columns of the store
+directly, so opening a catalog takes the same time whatever its size.
+Product objects are created only when a row is used.
+
+Layout, all numbers little endian:
+    header            magic, row count, names size, promotions size
+    prices            8 bytes per row
+    quantities        8 bytes per row
+    maximums          8 bytes per row
+    name offsets      8 bytes per row + 8
+    promotion numbers 4 bytes per row, -1 if the product has no promotion
+    kinds             1 byte per row
+    active flags      1 byte per row
+    names             UTF-8 names one after another
+    promotions        JSON list of the promotions
+"""
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+import products
+from columnar_store import ColumnarStore, product_kind, product_maximum
+from persistence import promotion_from_dict, promotion_to_dict
+
+MAGIC = b"BBCAT001"
+HEADER = struct.Struct("<8sQQQ")
+
+
+class CatalogFormatError(Exception):
+    """
+    Raised when a file is not a catalog file this module can read.
+    """
+
+
+def write_catalog(path, list_of_products):
+    """
+    Write the products to a catalog file.
+    :param path: file to write
+    :param list_of_products: products to write
+    :return: None
+    """
+    prices = array('q')
+    quantities = array('q')
+    maximums = array('q')
+    name_offsets = array('q', [0])
+    promotion_numbers = array('i')
+    kinds = array('b')
+    active = array('b')
+    names = bytearray()
+    promotion_table = []
+    promotion_numbers_by_id = {}
+    for product in list_of_products:
+        prices.append(product.get_price())
+        quantities.append(product.get_quantity()
+                          if isinstance(product, products.Product) else 0)
+        maximums.append(product_maximum(product))
+        names += product.name.encode("utf-8")
+        name_offsets.append(len(names))
+        promotion = product._promotion
+        if promotion is None:
+            promotion_numbers.append(-1)
+        else:
+            if id(promotion) not in promotion_numbers_by_id:
+                promotion_numbers_by_id[id(promotion)] = len(promotion_table)
+                promotion_table.append(promotion_to_dict(promotion))
+            promotion_numbers.append(promotion_numbers_by_id[id(promotion)])
+        kinds.append(product_kind(product))
+        active.append(1 if product.is_active() else 0)
+    columns = [prices, quantities, maximums, name_offsets, promotion_numbers, kinds, active]
+    if sys.byteorder != "little":
+        for column in columns:
+            column.byteswap()
+    promotions_json = json.dumps(promotion_table).encode("utf-8")
+    with open(path, "wb") as catalog_file:
+        catalog_file.write(HEADER.pack(MAGIC, len(prices), len(names), len(promotions_json)))
+        for column in columns:
+            column.tofile(catalog_file)
+        catalog_file.write(names)
+        catalog_file.write(promotions_json)
+
+
+class _NameColumn:
+    """
+    Read only list of names stored in the string table of a catalog file.
+    """
+    def __init__(self, offsets, names):
+        self._offsets = offsets
+        self._names = names
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        return str(self._names[self._offsets[row]:self._offsets[row + 1]], "utf-8")
+
+
+class _PromotionColumn:
+    """
+    The promotions of the rows of a catalog file. Promotions are created when first used.
+    Changes are kept in a dict in front of the file.
+    """
+    def __init__(self, promotion_numbers, promotion_table):
+        self._promotion_numbers = promotion_numbers
+        self._promotion_table = promotion_table
+        self._promotions = [None] * len(promotion_table)
+        self._changes = {}
+
+    def get(self, row, default=None):
+        """ Return the promotion of the row. """
+        if row in self._changes:
+            promotion = self._changes[row]
+        else:
+            number = self._promotion_numbers[row]
+            if number < 0:
+                return default
+            promotion = self._promotions[number]
+            if promotion is None:
+                promotion = promotion_from_dict(self._promotion_table[number])
+                self._promotions[number] = promotion
+        return default if promotion is None else promotion
+
+    def __setitem__(self, row, promotion):
+        self._changes[row] = promotion
+
+    def pop(self, row, default=None):
+        """ Remove the promotion of the row and return it. """
+        promotion = self.get(row, default)
+        self._changes[row] = None
+        return promotion
+
+
+class MappedStore(ColumnarStore):
+    """
+    ColumnarStore whose columns are in a memory mapped catalog file.
+    Changes to products stay in memory and are not written to the file.
+    The columns are copied to memory when the first product is added.
+    """
+    def __init__(self, path):
+        """
+        Open the catalog file.
+        :param path: catalog file made by write_catalog
+        """
+        super().__init__()
+        if sys.byteorder != "little":
+            raise CatalogFormatError("Catalog files can only be mapped on little endian machines")
+        with open(path, "rb") as catalog_file:
+            try:
+                # A private copy on write mapping: the columns can be changed in memory
+                self._map = mmap.mmap(catalog_file.fileno(), 0, access=mmap.ACCESS_COPY)
+            except ValueError as error:
+                raise CatalogFormatError(f"{path} is not a catalog file") from error
+        if len(self._map) < HEADER.size:
+            raise CatalogFormatError(f"{path} is not a catalog file")
+        magic, row_count, names_size, promotions_size = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise CatalogFormatError(f"{path} is not a catalog file")
+        if (HEADER.size + 38 * row_count + 8 + names_size + promotions_size
+                != len(self._map)):
+            raise CatalogFormatError(f"{path} has the wrong size for a catalog file")
+        data = memoryview(self._map)
+        position = HEADER.size
+
+        def column(type_code, item_size, length):
+            nonlocal position
+            start = position
+            position += item_size * length
+            return data[start:position].cast(type_code)
+
+        self._prices = column('q', 8, row_count)
+        self._quantities = column('q', 8, row_count)
+        self._maximums = column('q', 8, row_count)
+        name_offsets = column('q', 8, row_count + 1)
+        promotion_numbers = column('i', 4, row_count)
+        self._kinds = column('b', 1, row_count)
+        self._active = column('b', 1, row_count)
+        self._names = _NameColumn(name_offsets, column('B', 1, names_size))
+        promotion_table = json.loads(bytes(column('B', 1, promotions_size)))
+        self._promotions = _PromotionColumn(promotion_numbers, promotion_table)
+        # The name index is built when first needed
+        self._name_index = None
+
+    def _make_growable(self):
+        """
+        Copy the mapped columns to memory so that rows can be appended.
+        """
+        if isinstance(self._names, list):
+            return
+        self._names = [self._names[row] for row in range(len(self._names))]
+        self._prices = array('q', self._prices)
+        self._quantities = array('q', self._quantities)
+        self._maximums = array('q', self._maximums)
+        self._kinds = array('b', self._kinds)
+        self._active = array('b', self._active)
+        promotions = {}
+        for row in range(len(self._names)):
+            promotion = self._promotions.get(row)
+            if promotion is not None:
+                promotions[row] = promotion
+        self._promotions = promotions
+
+
+def open_catalog(path):
+    """
+    Open a catalog file as a store.
+    :param path: catalog file made by write_catalog
+    :return: instance of MappedStore
+    """
+    return MappedStore(path)
@@ -0,0 +1,520 @@
+"""
+Columnar inventory backend for the Store class.
+
+Product data is held in typed arrays, one column per attribute, instead of
+one Python object per product. Product objects handed out by the store are
+thin views over one row of the columns. Views hold no data of their own:
+two views of the same row are equal, so views are made when asked for and
+not kept.
+
+The columns use the array module of the standard library. A product costs
+about 8 bytes per column, one pointer to its name and one entry in the name
+index, which is several times less than a product object (see
+bench_columnar_store in benchmark.py). The names themselves are the same
+strings in both cases. Totals and active filtering run in C over the
+columns with sum, array.count and itertools.compress. Bulk restocks still
+look at each item in Python, because the items are Python objects.
+"""
+
+import weakref
+from array import array
+from itertools import compress
+from operator import mul
+
+import products
+from price_index import PriceIndex
+from store import Store
+
+# Kind codes stored in the kind column
+IMMATERIAL = 0
+MATERIAL = 1
+LIMITED_IMMATERIAL = 2
+LIMITED_MATERIAL = 3
+REMOVED = -1
+
+
+def product_kind(product):
+    """
+    Return the kind code of a product instance.
+    :param product: instance of one of the product classes.
+    :return: One of the kind codes of this module.
+    """
+    if isinstance(product, products.LimitedProduct):
+        return LIMITED_MATERIAL
+    if isinstance(product, products.Product):
+        return MATERIAL
+    if isinstance(product, products.LimitedImmaterialProduct):
+        return LIMITED_IMMATERIAL
+    return IMMATERIAL
+
+
+def product_maximum(product):
+    """
+    Return the per order maximum of a product, 0 if there is no maximum.
+    """
+    if isinstance(product, products.LimitedImmaterialProduct):
+        return product.get_maximum()
+    return 0
+
+
+class _RowView:
+    """
+    Mixin which maps the product attributes to one row of a ColumnarStore.
+    It is combined with the product classes so that all product methods work
+    on the row unchanged. Views of the same row are equal.
+    """
+    __slots__ = ()
+
+    def __init__(self, columnar_store, row):
+        # The product __init__ is not called: the data is already in the columns.
+        self._store = columnar_store
+        self._row = row
+
+    def __eq__(self, other):
+        if not isinstance(other, _RowView):
+            return NotImplemented
+        return self._store is other._store and self._row == other._row
+
+    def __hash__(self):
+        return hash((id(self._store), self._row))
+
+    @property
+    def _observers(self):
+        # The store reads quantities and activity from the columns, but it
+        # indexes rows by price, so it observes the views. Other observers,
+        # for example a Store the view was added to, are kept by the columnar
+        # store, so every view of the row tells them.
+        store = self._store
+        return (store._reference,) + store._row_observers.get(self._row, ())
+
+    @_observers.setter
+    def _observers(self, observers):
+        observers = tuple(reference for reference in observers
+                          if reference() is not self._store)
+        if observers:
+            self._store._row_observers[self._row] = observers
+        else:
+            self._store._row_observers.pop(self._row, None)
+
+    @property
+    def name(self):
+        """ Name of the product. """
+        return self._store._names[self._row]
+
+    @property
+    def _price(self):
+        return self._store._prices[self._row]
+
+    @_price.setter
+    def _price(self, price):
+        self._store._prices[self._row] = price
+
+    @property
+    def _active(self):
+        return bool(self._store._active[self._row])
+
+    @_active.setter
+    def _active(self, active):
+        self._store._active[self._row] = 1 if active else 0
+
+    @property
+    def _promotion(self):
+        return self._store._promotions.get(self._row)
+
+    @_promotion.setter
+    def _promotion(self, promotion):
+        if promotion is None:
+            self._store._promotions.pop(self._row, None)
+        else:
+            self._store._promotions[self._row] = promotion
+
+    @property
+    def _quantity(self):
+        return self._store._quantities[self._row]
+
+    @_quantity.setter
+    def _quantity(self, quantity):
+        self._store._quantities[self._row] = quantity
+
+
+class ImmaterialProductView(_RowView, products.ImmaterialProduct):
+    """ ImmaterialProduct stored in a ColumnarStore row. """
+    __slots__ = ('_store', '_row')
+
+
+class ProductView(_RowView, products.Product):
+    """ Product stored in a ColumnarStore row. """
+    __slots__ = ('_store', '_row')
+
+
+class LimitedImmaterialProductView(_RowView, products.LimitedImmaterialProduct):
+    """ LimitedImmaterialProduct stored in a ColumnarStore row. """
+    __slots__ = ('_store', '_row')
+
+    @property
+    def _LimitedImmaterialProduct__maximum(self):
+        return self._store._maximums[self._row]
+
+
+class LimitedProductView(_RowView, products.LimitedProduct):
+    """ LimitedProduct stored in a ColumnarStore row. """
+    __slots__ = ('_store', '_row')
+    # LimitedProduct.__init__ leaves the limit inherited from
+    # LimitedImmaterialProduct at its default value.
+    _LimitedImmaterialProduct__maximum = 1
+
+    @property
+    def _LimitedProduct__maximum(self):
+        return self._store._maximums[self._row]
+
+
+KIND_NAMES = {
+    IMMATERIAL: "ImmaterialProduct",
+    MATERIAL: "Product",
+    LIMITED_IMMATERIAL: "LimitedImmaterialProduct",
+    LIMITED_MATERIAL: "LimitedProduct",
+}
+
+VIEW_CLASSES = {
+    IMMATERIAL: ImmaterialProductView,
+    MATERIAL: ProductView,
+    LIMITED_IMMATERIAL: LimitedImmaterialProductView,
+    LIMITED_MATERIAL: LimitedProductView,
+}
+
+
+class ColumnarStore(Store):
+    """
+    Store which keeps its inventory in columns instead of product objects.
+    Products added to the store are copied into a row, and the store hands
+    out view objects for the rows. Use the products returned by the store,
+    for example by get_all_products, when making orders.
+    """
+    def __init__(self, list_of_products=None):
+        """
+        Initialize the store
+        :param list_of_products: products which are copied into the columns.
+        """
+        self._names = []
+        self._prices = array('q')
+        self._quantities = array('q')
+        self._active = array('b')
+        self._maximums = array('q')
+        self._kinds = array('b')
+        self._promotions = {}
+        # name -> row, or list of rows in insertion order if several rows
+        # have the name. Most names have one row, so no list is made for them.
+        self._name_index = {}
+        # Active rows in row order, None until asked for again after a change
+        self._active_row_list = None
+        # row -> weak references to observers of the row other than this store
+        self._row_observers = {}
+        self._reference = weakref.ref(self)
+        super().__init__(None)
+        for product in list_of_products or []:
+            self.add_product(product)
+
+    def _index_product(self, product):
+        """ Rows are indexed by add_product itself. """
+
+    def _get_name_index(self):
+        """
+        Return the name index, building it on first use.
+        """
+        if self._name_index is None:
+            self._name_index = {}
+            for row in self.rows():
+                self._index_row(self._names[row], row)
+        return self._name_index
+
+    def _index_row(self, name, row):
+        """
+        Add a row to the name index. Rows must be added in row order.
+        """
+        name_index = self._name_index
+        rows = name_index.get(name)
+        if rows is None:
+            name_index[name] = row
+        elif isinstance(rows, int):
+            name_index[name] = [rows, row]
+        else:
+            rows.append(row)
+
+    def _rows_named(self, name):
+        """
+        Return the rows with the name in insertion order.
+        """
+        rows = self._get_name_index().get(name)
+        if rows is None:
+            return ()
+        return (rows,) if isinstance(rows, int) else rows
+
+    def _make_growable(self):
+        """
+        Make sure new rows can be appended to the columns.
+        """
+
+    def on_product_activity_changed(self, product):
+        """
+        The active column is read directly, only the price index is updated.
+        Calls from different threads may come in any order, so a row is added
+        to the index only if it is not there yet.
+        """
+        self._version += 1
+        with self._active_lock:
+            self._active_row_list = None
+            if self._price_index is not None:
+                entry = self._price_entry(product)
+                if product.is_active():
+                    if entry not in self._price_index:
+                        self._price_index.add(entry)
+                else:
+                    self._price_index.remove(entry)
+
+    def on_product_quantity_changed(self, product, old_quantity):
+        """ The quantity column is read directly. """
+        self._version += 1
+
+    def on_product_price_changed(self, product, old_price):
+        """
+        Move the row of the product under its new price in the price index.
+        """
+        self._version += 1
+        with self._active_lock:
+            if self._price_index is not None and product.is_active():
+                self._price_index.remove(self._price_entry(product, old_price))
+                self._price_index.add(self._price_entry(product))
+
+    def _price_entry(self, product, price=None):
+        """
+        Return the entry of the product in the price index. Rows are stored
+        instead of views, so the index does not keep views alive.
+        """
+        return (product.get_price() if price is None else price, product._row, product._row)
+
+    def _price_entry_product(self, entry):
+        return self.product_at(entry[2])
+
+    def _get_price_index(self):
+        """
+        Return the price index of the active rows, building it on first use.
+        Call with the active lock held.
+        """
+        if self._price_index is None:
+            self._price_index = PriceIndex((self._prices[row], row, row)
+                                           for row in self.active_rows())
+        return self._price_index
+
+    @property
+    def list_of_products(self):
+        """
+        Return a list of views of all the products in the store.
+        """
+        return [self.product_at(row) for row in self.rows()]
+
+    @list_of_products.setter
+    def list_of_products(self, value):
+        # Store.__init__ assigns the list. The columns are the storage here.
+        pass
+
+    def rows(self):
+        """
+        Return the row numbers of all products in the store.
+        """
+        return list(compress(range(len(self._kinds)), map(REMOVED.__ne__, self._kinds)))
+
+    def product_at(self, row):
+        """
+        Return a product view of the row.
+        :param row: row number
+        :return: instance of one of the product view classes
+        """
+        kind = self._kinds[row]
+        if kind == REMOVED:
+            raise IndexError(f"Row {row} has been removed")
+        return VIEW_CLASSES[kind](self, row)
+
+    def _append_row(self, product):
+        """
+        Copy the product into a new row.
+        :return: the new row number
+        """
+        self._make_growable()
+        self._get_name_index()
+        row = len(self._names)
+        kind = product_kind(product)
+        self._names.append(product.name)
+        self._prices.append(product.get_price())
+        self._quantities.append(product.get_quantity()
+                                if isinstance(product, products.Product) else 0)
+        self._active.append(1 if product.is_active() else 0)
+        self._maximums.append(product_maximum(product))
+        self._kinds.append(kind)
+        if product._promotion is not None:
+            self._promotions[row] = product._promotion
+        self._index_row(product.name, row)
+        if self._active[row]:
+            with self._active_lock:
+                self._active_row_list = None
+                if self._price_index is not None:
+                    self._price_index.add((self._prices[row], row, row))
+        if self._name_search is not None:
+            self._name_search.add(self.product_at(row))
+        self._version += 1
+        return row
+
+    def add_product(self, new_product):
+        """
+        Add a new product to the store. The same rules as in Store.add_product
+        apply: matching products add to the quantity, matching immaterial
+        products are not added twice.
+        :param new_product: instance of one of the product classes
+        :return: the product view of the row holding the product
+        """
+        new_name_and_price = new_product.name_and_price()
+        new_is_material = isinstance(new_product, products.Product)
+        new_price = new_product.get_price()
+        for row in self._rows_named(new_product.name):
+            if self._prices[row] != new_price:
+                continue
+            old_product = self.product_at(row)
+            if old_product.name_and_price() != new_name_and_price:
+                continue
+            if new_is_material and self._kinds[row] in (MATERIAL, LIMITED_MATERIAL):
+                old_product.set_quantity(old_product.get_quantity() + new_product.get_quantity())
+            return old_product
+        return self.product_at(self._append_row(new_product))
+
+    def remove_product(self, product):
+        """
+        Remove a product from the store.
+        :param product: product view to remove
+        :return: None
+        """
+        if product not in self:
+            return
+        row = product._row
+        name_index = self._get_name_index()
+        rows = name_index[product.name]
+        if isinstance(rows, int):
+            del name_index[product.name]
+        else:
+            rows.remove(row)
+            if len(rows) == 1:
+                name_index[product.name] = rows[0]
+        if self._name_search is not None:
+            self._name_search.remove(product)
+        with self._active_lock:
+            if self._price_index is not None and self._active[row]:
+                self._price_index.remove(self._price_entry(product))
+            self._kinds[row] = REMOVED
+            self._active[row] = 0
+            self._active_row_list = None
+        self._quantities[row] = 0
+        self._promotions.pop(row, None)
+        self._row_observers.pop(row, None)
+        self._version += 1
+
+    def find_product(self, name):
+        """
+        Find a product by name.
+        :param name: name of the product
+        :return: The first product added to the store with that name, None if there is none.
+        """
+        same_name = self._rows_named(name)
+        return self.product_at(same_name[0]) if same_name else None
+
+    def __contains__(self, item):
+        return (isinstance(item, _RowView) and item._store is self
+                and self._kinds[item._row] != REMOVED)
+
+    def get_total_quantity(self):
+        """
+        Return the total quantity of the physical products in the store.
+        """
+        return sum(self._quantities)
+
+    def get_quantity_by_type(self):
+        """
+        Return the total quantity of the physical products in the store by product class.
+        :return: dict product class name -> quantity
+        """
+        kinds = self._kinds
+        return {KIND_NAMES[kind]: sum(compress(self._quantities, map(kind.__eq__, kinds)))
+                for kind in (MATERIAL, LIMITED_MATERIAL) if kind in kinds}
+
+    def get_stock_value(self):
+        """
+        Return the value of the physical products in the store at list price.
+        """
+        return sum(map(mul, self._prices, self._quantities))
+
+    def get_all_products(self):
+        """
+        Return a list of all active products in the store.
+        """
+        kinds = self._kinds
+        return [VIEW_CLASSES[kinds[row]](self, row) for row in self.active_rows()]
+
+    def active_rows(self):
+        """
+        Return the row numbers of the active products. The list is kept
+        until a product is activated, deactivated, added or removed.
+        """
+        with self._active_lock:
+            if self._active_row_list is None:
+                self._active_row_list = list(compress(range(len(self._active)), self._active))
+            return self._active_row_list
+
+    def get_product_type_quantity(self):
+        """
+        Return how many different items are active in the store inventory.
+        """
+        return len(self.active_rows())
+
+    def restock(self, items):
+        """
+        Add stock to many physical products at once. The columns are changed
+        directly, except for rows which other stores observe: those are
+        changed with set_quantity so the other stores are told. All the items
+        are checked before any stock is changed.
+        :param items: iterable of tuples (product view, quantity to add)
+        :return: None
+        """
+        items = list(items)
+        for product, quantity in items:
+            if product not in self or not isinstance(product, products.Product):
+                raise ValueError(f"{product.name} is not a physical product of this store")
+            if not isinstance(quantity, int) or isinstance(quantity, bool):
+                raise TypeError("Quantity must be an integer")
+            if quantity <= 0:
+                raise ValueError("Quantity must be positive")
+        quantities = self._quantities
+        active = self._active
+        row_observers = self._row_observers
+        for product, quantity in items:
+            row = product._row
+            if row in row_observers:
+                product.set_quantity(quantities[row] + quantity)
+                continue
+            was_active = active[row]
+            quantities[row] += quantity
+            active[row] = 1 if quantities[row] > 0 else 0
+            if active[row] == was_active:
+                continue
+            with self._active_lock:
+                self._active_row_list = None
+                if self._price_index is not None:
+                    if active[row]:
+                        self._price_index.add((self._prices[row], row, row))
+                    else:
+                        self._price_index.remove((self._prices[row], row, row))
+        self._version += 1
+
+    def __add__(self, other):
+        new_store = ColumnarStore()
+        for product in self.list_of_products:
+            new_store.add_product(product)
+        for product in other.list_of_products:
+            new_store.add_product(product)
+        return new_store
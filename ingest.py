@@ -0,0 +1,152 @@
+"""
+Streaming order ingestion for the Best Buy store.
+
+Orders are read from a file with one JSON object per line:
+    {"id": "A-1", "items": [["MacBook Air M2", 1], ["Shipping", 1]]}
+The "id" is optional, the line number is used when it is missing.
+
+Each order is resolved by product name, validated and applied to the store
+with the same rules as Store.order, and its result is written as one JSON
+line to the output:
+    {"id": "A-1", "price": 1460, "message": "Order completed successfully."}
+    {"id": "A-2", "price": null, "message": "Product Nothing is not in the store"}
+
+The input is read one line at a time and orders are applied in batches of
+batch_size, so memory use does not depend on the size of the input. An
+order which raises an error, for example a quantity too large to price, is
+rejected and the other orders of its batch are still applied.
+
+Run: python ingest.py INPUT OUTPUT [--catalog CATALOG_FILE]
+"""
+
+import argparse
+import json
+from itertools import islice
+
+import catalog_file
+from main import setup_store
+
+
+def read_orders(lines):
+    """
+    Parse order lines.
+    :param lines: iterable of JSON lines
+    :return: generator of (order id, items or None, error message or None)
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            order = json.loads(line)
+        except ValueError:
+            yield line_number, None, "Order is not valid JSON"
+            continue
+        if not isinstance(order, dict) or not isinstance(order.get("items"), list):
+            yield line_number, None, "Order must be a JSON object with a list of items"
+            continue
+        yield order.get("id", line_number), order["items"], None
+
+
+def resolve_orders(best_buy, orders):
+    """
+    Turn the product names of the orders into products.
+    :param best_buy: instance of the class Store
+    :param orders: generator made by read_orders
+    :return: generator of (order id, shopping list or None, error message or None)
+    """
+    for order_id, items, error in orders:
+        if error is not None:
+            yield order_id, None, error
+            continue
+        shopping_list, message = best_buy.resolve_shopping_list(items)
+        yield order_id, shopping_list, None if shopping_list is not None else message
+
+
+def order_batch(best_buy, shopping_lists):
+    """
+    Apply a batch of orders with Store.order_many. If the batch fails, the
+    orders are applied one by one, and each order which fails is rejected.
+    :param best_buy: instance of the class Store
+    :param shopping_lists: list of shopping lists
+    :return: list of tuples (price or None, message)
+    """
+    try:
+        return best_buy.order_many(shopping_lists)
+    except Exception:  # pylint: disable=broad-except
+        # order_many changes nothing when it fails
+        results = []
+        for shopping_list in shopping_lists:
+            try:
+                results.extend(best_buy.order_many([shopping_list]))
+            except Exception as error:  # pylint: disable=broad-except
+                results.append((None, f"Order failed: {error}"))
+        return results
+
+
+def apply_orders(best_buy, orders, batch_size=1000):
+    """
+    Apply the orders to the store in batches with Store.order_many.
+    :param best_buy: instance of the class Store
+    :param orders: generator made by resolve_orders
+    :param batch_size: how many orders are applied at once
+    :return: generator of (order id, price or None, message)
+    """
+    orders = iter(orders)
+    while True:
+        batch = list(islice(orders, batch_size))
+        if not batch:
+            return
+        results = iter(order_batch(best_buy, [shopping_list for _, shopping_list, _ in batch
+                                              if shopping_list is not None]))
+        for order_id, shopping_list, error in batch:
+            if shopping_list is None:
+                yield order_id, None, error
+            else:
+                price, message = next(results)
+                yield order_id, price, message
+
+
+def ingest(best_buy, input_stream, output_stream, batch_size=1000):
+    """
+    Read orders from input_stream, apply them to the store and write the
+    results to output_stream.
+    :param best_buy: instance of the class Store
+    :param input_stream: text stream of JSON lines
+    :param output_stream: text stream for the results
+    :param batch_size: how many orders are applied at once
+    :return: tuple (accepted orders, rejected orders)
+    """
+    accepted = rejected = 0
+    results = apply_orders(best_buy, resolve_orders(best_buy, read_orders(input_stream)),
+                           batch_size)
+    for order_id, price, message in results:
+        if price is None:
+            rejected += 1
+        else:
+            accepted += 1
+        output_stream.write(json.dumps({"id": order_id, "price": price, "message": message})
+                            + "\n")
+    return accepted, rejected
+
+
+def main():
+    """
+    Ingest an order file into the demo store or into a catalog file.
+    """
+    parser = argparse.ArgumentParser(description="Apply a file of orders to the store.")
+    parser.add_argument("input", help="orders, one JSON object per line")
+    parser.add_argument("output", help="file for the results")
+    parser.add_argument("--catalog", help="catalog file to use instead of the demo store")
+    arguments = parser.parse_args()
+    if arguments.catalog:
+        best_buy = catalog_file.open_catalog(arguments.catalog)
+    else:
+        best_buy = setup_store()
+    with open(arguments.input, encoding="utf-8") as input_stream, \
+            open(arguments.output, "w", encoding="utf-8") as output_stream:
+        accepted, rejected = ingest(best_buy, input_stream, output_stream)
+    print(f"{accepted} orders accepted, {rejected} orders rejected")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Opt-in timing instrumentation for the Best Buy store.
+
+When store_metrics is enabled, Store.order records how long each stage of
+an order takes: format validation, merging, prechecks, buying and promotion
+pricing. Durations go into histograms with power of two buckets, so
+recording is one list update. When disabled, the only cost is checking the
+enabled flag once per order and once per promoted purchase.
+
+    import instrumentation
+    instrumentation.store_metrics.enable()
+    ...
+    instrumentation.store_metrics.dump()
+"""
+
+import sys
+import time
+
+# Stages of Store.order
+VALIDATE = "validate"
+MERGE = "merge"
+PRECHECK = "precheck"
+BUY = "buy"
+PROMOTION = "promotion"
+
+
+class Histogram:
+    """
+    Histogram of durations in nanoseconds. Bucket n holds durations
+    from 2**(n-1) up to 2**n - 1 nanoseconds.
+    """
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+
+    def record(self, duration):
+        """
+        Add a duration in nanoseconds to the histogram.
+        """
+        self.buckets[min(duration.bit_length(), 63)] += 1
+        self.count += 1
+        self.total += duration
+        if self.minimum is None or duration < self.minimum:
+            self.minimum = duration
+        if duration > self.maximum:
+            self.maximum = duration
+
+    def percentile(self, percent):
+        """
+        Return an upper bound of the given percentile in nanoseconds.
+        """
+        if self.count == 0:
+            return 0
+        needed = self.count * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= needed:
+                return min(2 ** bucket - 1, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        """
+        Return the count, total, mean, minimum, maximum, median and 99th
+        percentile of the durations as a dict.
+        """
+        return {"count": self.count,
+                "total_ns": self.total,
+                "mean_ns": self.total / self.count if self.count else 0,
+                "min_ns": self.minimum or 0,
+                "max_ns": self.maximum,
+                "p50_ns": self.percentile(50),
+                "p99_ns": self.percentile(99)}
+
+
+class Metrics:
+    """
+    Histograms of stage durations plus plain event counters.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+
+    def enable(self):
+        """ Start recording. """
+        self.enabled = True
+
+    def disable(self):
+        """ Stop recording. What has been recorded is kept. """
+        self.enabled = False
+
+    def reset(self):
+        """ Forget everything recorded so far. """
+        self.histograms = {}
+        self.counters = {}
+
+    def record(self, stage, duration):
+        """
+        Record the duration of a stage in nanoseconds.
+        """
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.record(duration)
+
+    def count(self, event, amount=1):
+        """
+        Add to the counter of an event.
+        """
+        self.counters[event] = self.counters.get(event, 0) + amount
+
+    def summary(self):
+        """
+        Return everything recorded as a dict which can be saved as JSON.
+        """
+        return {"stages": {stage: histogram.summary()
+                           for stage, histogram in self.histograms.items()},
+                "counters": dict(self.counters)}
+
+    def dump(self, file=None):
+        """
+        Print a table of the recorded stages and counters.
+        """
+        file = file or sys.stdout
+        print(f"{'stage':<12} {'count':>9} {'mean us':>10} {'p50 us':>10} "
+              f"{'p99 us':>10} {'max us':>10}", file=file)
+        for stage, histogram in self.histograms.items():
+            summary = histogram.summary()
+            print(f"{stage:<12} {summary['count']:>9} {summary['mean_ns'] / 1000:>10.2f} "
+                  f"{summary['p50_ns'] / 1000:>10.2f} {summary['p99_ns'] / 1000:>10.2f} "
+                  f"{summary['max_ns'] / 1000:>10.2f}", file=file)
+        for event, count in self.counters.items():
+            print(f"{event:<12} {count:>9}", file=file)
+
+
+# Metrics of all the stores
+store_metrics = Metrics()
+
+# Clock used for the measurements
+clock = time.perf_counter_ns
@@ -1,9 +1,10 @@
 """
 The main part of Best Buy application
 """
-import os
 import sys
 import store
+from cart import Cart
+from renderer import PROMPT_ROWS, Renderer, page_lines
 import products
 import promotions
 
@@ -17,18 +18,16 @@ STORE_MENU = """
 
 Please choose a number: """
 
+# All the output of the application goes through this renderer
+screen = Renderer()
+
 
 def clear_the_terminal():
     """
     Clears the terminal.
     :return: None
     """
-    # For Windows
-    if os.name == 'nt':
-        os.system('cls')
-    # For macOS and Linux
-    else:
-        os.system('clear')
+    screen.clear()
 
 
 def ask_number(message="Give a number: ",
@@ -94,49 +93,91 @@ def setup_store():
     return best_buy
 
 
+def product_lines(best_buy):
+    """
+    Return the numbered lines of the products in the store.
+    :param best_buy: instance of the class Store
+    :return: list of lines
+    """
+    return [f"{product_num+1}. {product}"
+            for product_num, product in enumerate(best_buy.get_all_products())]
+
+
 def print_products(best_buy):
     """
-    List products in the store
+    List products in the store. On a terminal the list is shown a page at a time.
     :param best_buy: instance of the class Store
     :return: None
     """
-    for product_num, product in enumerate(best_buy.get_all_products()):
-        print(f"{product_num+1}. {product}")
+    lines = product_lines(best_buy)
+    page_size = max(screen.rows() - 4, 1)
+    if not screen.is_terminal() or len(lines) <= page_size:
+        screen.write(lines)
+        return
+    page_count = -(-len(lines) // page_size)
+    for page in range(page_count):
+        screen.write(page_lines(lines, page, page_size))
+        if page == page_count - 1:
+            break
+        if input("Press enter for the next page, q to stop: ").strip().lower() == "q":
+            break
 
 
 def show_total_items_in_store(best_buy):
     """ Print total items in the store """
-    total_products_in_store = sum(product.get_quantity() for product in best_buy.get_all_products()
-                                  if isinstance(product, products.Product))
-    print(f"Total of {total_products_in_store} items in store")
+    screen.write([f"Total of {best_buy.get_total_quantity()} items in store"])
 
 
-def print_order(order_list):
+def order_lines(order_list):
     """
-    Print the quantity, products, and total price of each order item in the order list
+    Return the lines showing the quantity, product and total price of each order item.
     :param order_list: A list of tuples. The tuple: (instance of Product class, quantity)
-    :return: None
+    :return: list of lines
     """
+    lines = []
     for order_item_no, order_item in enumerate(order_list):
         product, quantity = order_item
         product_name, product_price = product.name_and_price(quantity)
-        print(f"{order_item_no+1:>5}. {quantity:5} * {product_name:.<30} ${product_price:8.2f}")
+        lines.append(f"{order_item_no+1:>5}. {quantity:5} * {product_name:.<30} "
+                     f"${product_price:8.2f}")
+    return lines
+
+
+def print_order(order_list):
+    """
+    Print the quantity, products, and total price of each order item in the order list
+    :param order_list: A list of tuples. The tuple: (instance of Product class, quantity)
+    :return: None
+    """
+    screen.write(order_lines(order_list))
 
 
 def get_order(best_buy):
     """
     Get a validated order from the user. Ensure the store can provide the order.
+    The products are listed first and the order below them, so on a terminal
+    only the lines of the order are redrawn when it changes. A list of
+    products taller than the terminal is shown a page at a time like
+    print_products does, and the order is then written below it.
     :param best_buy: instance of the class Store
-    :return: A list of tuples. The tuple: (instance of Product class, quantity)
+    :return: instance of the class Cart with the lines of the order
     """
-    order_list = []
+    cart = Cart(best_buy)
     available_products = best_buy.get_all_products()
-    clear_the_terminal()
-    print("   Available products")
-    print("   ------------------")
-    print_products(best_buy)
+    products_screen = ["   Available products",
+                       "   ------------------"] + product_lines(best_buy)
+    # Screens taller than the terminal are drawn again in full, so a long
+    # list of products is kept out of the screen which is redrawn
+    products_fit = (not screen.is_terminal()
+                    or len(products_screen) + PROMPT_ROWS <= screen.rows())
+    if products_fit:
+        screen.show(products_screen, full=True)
+    else:
+        screen.clear()
+        screen.write(products_screen[:2])
+        print_products(best_buy)
     while True:
-        print("\nWhen you want to finish the order, enter empty text.\n")
+        screen.write(["", "When you want to finish the order, enter empty text.", ""])
         product_number = (ask_number(message="Which product # do you want to add to the order? ",
                             lower_limit=1,
                             upper_limit=len(available_products),
@@ -159,21 +200,18 @@ def get_order(best_buy):
                     )
         if quantity is None:
             break
-        order_list.append((available_products[product_number - 1], quantity))
-        validation_result, message = best_buy.validate_shopping_list(order_list)
+        # Only the changed line is validated, the cart keeps the lines merged
+        validation_result, message = cart.add(available_products[product_number - 1], quantity)
         if validation_result is not True:
-            order_list.pop()
-            print(f"Could not add that to the order because {message}.")
+            screen.write([f"Could not add that to the order because {message}."])
         else:
-            order_list = best_buy.merge_shopping_list_items(order_list)
-            clear_the_terminal()
-            print("   Your order so far")
-            print("   -----------------")
-            print_order(order_list)
-            print("\n   Available products")
-            print("   ------------------")
-            print_products(best_buy)
-    return order_list
+            order_screen = (["", "   Your order so far", "   -----------------"]
+                            + order_lines(cart.items()))
+            if products_fit:
+                screen.show(products_screen + order_screen)
+            else:
+                screen.write(order_screen)
+    return cart
 
 
 def make_an_order(best_buy):
@@ -182,18 +220,22 @@ def make_an_order(best_buy):
     :param best_buy: An instance of the Store class
     :return: None
     """
-    order_list = get_order(best_buy)
-    if len(order_list) == 0 :
-        print("Order was empty. Smart move!")
+    cart = get_order(best_buy)
+    if len(cart) == 0 :
+        screen.write(["Order was empty. Smart move!"])
         return
-    print("\n********\n")
-    payment_needed, message = best_buy.order(order_list)
+    screen.write(["", "********", ""])
+    # The cart is emptied by a successful order, so keep its lines for the receipt
+    order_list = cart.items()
+    # The lines were checked when they were added, the cart checks them
+    # again only if the store has changed since
+    payment_needed, message = cart.order()
     if payment_needed is None:
-        print(f"Error while making an order. The store did not accept the order because {message}")
+        screen.write([f"Error while making an order. "
+                      f"The store did not accept the order because {message}"])
         return
-    print("Order made!\n")
-    print_order(order_list)
-    print(f"\nTotal payment: ${payment_needed:.2f}")
+    screen.write(["Order made!", ""] + order_lines(order_list)
+                 + ["", f"Total payment: ${payment_needed:.2f}"])
 
 
 def quit_best_buy():
@@ -224,8 +266,7 @@ def start(best_buy):
                                  allow_empty=True)
                        or 4)
         clear_the_terminal()
-        print("   Command output")
-        print("   --------------")
+        screen.write(["   Command output", "   --------------"])
         if command_num in commands:
             commands[command_num](best_buy)
         elif command_num == 4:
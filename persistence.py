@@ -0,0 +1,463 @@
+"""
+Durable inventory for the Best Buy store.
+
+PersistentStore is a Store which writes every change made through it to a
+write-ahead log. From time to time the whole inventory is written to a
+snapshot and the log starts again from empty, which keeps recovery short.
+
+Files in the store directory:
+    snapshot.json    the inventory at the start of the current log
+    wal-<n>.log      changes after snapshot number n, one record per line
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import products
+import promotions
+from store import Store
+
+SNAPSHOT_FILE = "snapshot.json"
+
+PROMOTION_CLASSES = {
+    "SecondHalfPrice": promotions.SecondHalfPrice,
+    "ThirdOneFree": promotions.ThirdOneFree,
+    "PercentDiscount": promotions.PercentDiscount,
+}
+
+PRODUCT_CLASSES = {
+    "ImmaterialProduct": products.ImmaterialProduct,
+    "Product": products.Product,
+    "LimitedImmaterialProduct": products.LimitedImmaterialProduct,
+    "LimitedProduct": products.LimitedProduct,
+}
+
+
+def promotion_to_dict(promotion):
+    """
+    Return the promotion as a dict which can be saved as JSON.
+    """
+    type_name = type(promotion).__name__
+    if type_name not in PROMOTION_CLASSES:
+        raise TypeError(f"Cannot save promotions of type {type_name}")
+    promotion_dict = {"type": type_name, "name": promotion.name}
+    if isinstance(promotion, promotions.PercentDiscount):
+        promotion_dict["percent"] = promotion._discount_percent
+    return promotion_dict
+
+
+def promotion_from_dict(promotion_dict):
+    """
+    Create a promotion from a dict made by promotion_to_dict.
+    """
+    promotion_class = PROMOTION_CLASSES[promotion_dict["type"]]
+    if promotion_class is promotions.PercentDiscount:
+        return promotion_class(promotion_dict["name"], percent=promotion_dict["percent"])
+    return promotion_class(promotion_dict["name"])
+
+
+def product_to_dict(product):
+    """
+    Return the product as a dict which can be saved as JSON.
+    """
+    product_dict = {"type": None, "name": product.name, "price": product.get_price(),
+                    "active": product.is_active()}
+    for type_name in ("LimitedProduct", "Product", "LimitedImmaterialProduct",
+                      "ImmaterialProduct"):
+        if isinstance(product, PRODUCT_CLASSES[type_name]):
+            product_dict["type"] = type_name
+            break
+    if isinstance(product, products.Product):
+        product_dict["quantity"] = product.get_quantity()
+    if isinstance(product, products.LimitedImmaterialProduct):
+        product_dict["maximum"] = product.get_maximum()
+    if product._promotion is not None:
+        product_dict["promotion"] = promotion_to_dict(product._promotion)
+    return product_dict
+
+
+def product_from_dict(product_dict):
+    """
+    Create a product from a dict made by product_to_dict.
+    """
+    arguments = {"name": product_dict["name"], "price": product_dict["price"]}
+    for argument in ("quantity", "maximum"):
+        if argument in product_dict:
+            arguments[argument] = product_dict[argument]
+    product = PRODUCT_CLASSES[product_dict["type"]](**arguments)
+    if product_dict["active"]:
+        product.activate()
+    else:
+        product.deactivate()
+    if "promotion" in product_dict:
+        product.set_promotion(promotion_from_dict(product_dict["promotion"]))
+    return product
+
+
+class _ChangeGate:
+    """
+    Lets many changes run at the same time, or one snapshot alone. A waiting
+    snapshot stops new changes from starting, so it is not kept waiting.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._changes = 0
+        self._snapshots = 0
+        self._snapshot_running = False
+
+    @contextmanager
+    def change(self):
+        """
+        Hold the gate while a change is applied and logged.
+        """
+        with self._condition:
+            while self._snapshots:
+                self._condition.wait()
+            self._changes += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._changes -= 1
+                if not self._changes:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Hold the gate alone while a snapshot is written.
+        """
+        with self._condition:
+            self._snapshots += 1
+            while self._changes or self._snapshot_running:
+                self._condition.wait()
+            self._snapshot_running = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._snapshots -= 1
+                self._snapshot_running = False
+                self._condition.notify_all()
+
+
+class PersistentStore(Store):
+    """
+    Store which survives restarts.
+    Changes made with order, order_merged, order_many, safe_order, restock,
+    add_product and remove_product are written to the write-ahead log. A
+    change and its log record are made while snapshots wait, so a snapshot
+    never holds a change whose record is also in the new log.
+    Log lines are written in groups: a change is on disk after
+    group_commit_size changes, after flush_interval seconds or when sync is
+    called. A change which has returned may be lost in a crash until then.
+    Changes made directly to products, like set_price, are not logged.
+    """
+    def __init__(self, directory, list_of_products=None,
+                 group_commit_size=256, snapshot_interval=1_000_000, flush_interval=0.05):
+        """
+        Open the store in directory. If the directory holds a saved store, the
+        store is recovered from it and list_of_products is ignored. Otherwise
+        the store starts with list_of_products.
+        :param directory: directory for the snapshot and the log
+        :param list_of_products: products of a new store
+        :param group_commit_size: how many changes are written to disk at once
+        :param snapshot_interval: a snapshot is written after this many changes
+        :param flush_interval: seconds after which logged changes are written
+                               to disk, None to write them only in groups
+        """
+        super().__init__([])
+        self.directory = directory
+        self.group_commit_size = group_commit_size
+        self.snapshot_interval = snapshot_interval
+        self._ids = {}
+        self._products_by_id = {}
+        self._next_id = 0
+        self._pending = []
+        self._log_length = 0
+        self._log_lock = threading.Lock()
+        self._gate = _ChangeGate()
+        self._log_file = None
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._path(SNAPSHOT_FILE)):
+            self._generation = self._recover()
+        else:
+            self._generation = 0
+            for product in list_of_products or []:
+                self._append_product(product, self._next_id)
+            self._write_snapshot(self._generation)
+        self._log_file = open(self._log_path(self._generation), "a", encoding="utf-8")
+        self._closed = threading.Event()
+        self._flusher = None
+        if flush_interval is not None:
+            self._flusher = threading.Thread(target=self._flush_regularly,
+                                             args=(flush_interval,), daemon=True)
+            self._flusher.start()
+
+    def _path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def _log_path(self, generation):
+        return self._path(f"wal-{generation}.log")
+
+    def _add_with_id(self, product):
+        """
+        Add the product to the store and give it an id if it was added as a new product.
+        """
+        was_in_store = product in self
+        Store.add_product(self, product)
+        if not was_in_store and product in self:
+            self._set_id(product, self._next_id)
+
+    def _append_product(self, product, product_id):
+        """
+        Put the product at the end of the store like Store.__init__ does, without
+        looking for an equal product.
+        """
+        self.list_of_products.append(product)
+        self._index_product(product)
+        self._set_id(product, product_id)
+
+    def _set_id(self, product, product_id):
+        self._ids[product] = product_id
+        self._products_by_id[product_id] = product
+        self._next_id = max(self._next_id, product_id + 1)
+
+    def _recover(self):
+        """
+        Load the snapshot and replay the log written after it.
+        :return: the generation of the snapshot
+        """
+        with open(self._path(SNAPSHOT_FILE), encoding="utf-8") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        for product_id, product_dict in snapshot["products"]:
+            self._append_product(product_from_dict(product_dict), product_id)
+        self._next_id = snapshot["next_id"]
+        generation = snapshot["generation"]
+        log_path = self._log_path(generation)
+        if not os.path.exists(log_path):
+            return generation
+        complete_size = 0
+        # Stock changes only add up, so they are summed per product and applied
+        # in one go before a record which needs the current stock.
+        stock_changes = {}
+        with open(log_path, "rb") as log_file:
+            for line in log_file:
+                # The last line may be cut short by a crash
+                if not line.endswith(b"\n"):
+                    break
+                fields = line.split()
+                operation = fields[0]
+                if operation == b"o":
+                    for i in range(1, len(fields), 2):
+                        product_id = int(fields[i])
+                        stock_changes[product_id] = (stock_changes.get(product_id, 0)
+                                                     - int(fields[i + 1]))
+                elif operation == b"r":
+                    product_id = int(fields[1])
+                    stock_changes[product_id] = stock_changes.get(product_id, 0) + int(fields[2])
+                else:
+                    self._apply_stock_changes(stock_changes)
+                    stock_changes = {}
+                    if operation == b"a":
+                        self._add_with_id(product_from_dict(json.loads(line[2:])))
+                    elif operation == b"x":
+                        self._remove_with_id(self._products_by_id[int(fields[1])])
+                complete_size += len(line)
+                self._log_length += 1
+        self._apply_stock_changes(stock_changes)
+        if complete_size < os.path.getsize(log_path):
+            os.truncate(log_path, complete_size)
+        return generation
+
+    def _apply_stock_changes(self, stock_changes):
+        """
+        Change the quantities of products.
+        :param stock_changes: dict product id -> change of quantity
+        """
+        products_by_id = self._products_by_id
+        for product_id, quantity_change in stock_changes.items():
+            product = products_by_id[product_id]
+            product.set_quantity(product.get_quantity() + quantity_change)
+
+    def _remove_with_id(self, product):
+        """
+        Remove the product from the store and forget its id.
+        :return: the id the product had
+        """
+        product_id = self._ids.pop(product)
+        del self._products_by_id[product_id]
+        Store.remove_product(self, product)
+        return product_id
+
+    def _log(self, line):
+        """
+        Append a record to the log. Records are written to disk in groups.
+        Records are one line each:
+            o <product id> <quantity> ...   order of physical products
+            r <product id> <quantity>       restock
+            a <product as JSON>             add_product
+            x <product id>                  remove_product
+        """
+        with self._log_lock:
+            self._pending.append(line)
+            self._log_length += 1
+            if len(self._pending) >= self.group_commit_size:
+                self._write_pending()
+
+    @contextmanager
+    def _changing(self):
+        """
+        Hold the change gate while a change is applied and logged. Write a
+        snapshot afterwards if the log has grown long enough.
+        """
+        with self._gate.change():
+            yield
+        if self._log_length >= self.snapshot_interval:
+            self.snapshot()
+
+    def _flush_regularly(self, flush_interval):
+        """
+        Write the logged changes to disk every flush_interval seconds until
+        the store is closed.
+        """
+        while not self._closed.wait(flush_interval):
+            self.sync()
+
+    def _write_pending(self):
+        """
+        Write the pending records and wait until they are on disk.
+        Call with the log lock held.
+        """
+        if not self._pending:
+            return
+        self._log_file.write("\n".join(self._pending) + "\n")
+        self._log_file.flush()
+        os.fsync(self._log_file.fileno())
+        self._pending = []
+
+    def sync(self):
+        """
+        Write all the logged changes to disk.
+        """
+        with self._log_lock:
+            self._write_pending()
+
+    def _write_snapshot(self, generation):
+        """
+        Write the whole inventory to the snapshot file.
+        """
+        snapshot = {"generation": generation,
+                    "next_id": self._next_id,
+                    "products": [[self._ids[product], product_to_dict(product)]
+                                 for product in self.list_of_products]}
+        temporary_path = self._path(SNAPSHOT_FILE + ".tmp")
+        with open(temporary_path, "w", encoding="utf-8") as snapshot_file:
+            json.dump(snapshot, snapshot_file, separators=(",", ":"))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self._path(SNAPSHOT_FILE))
+
+    def snapshot(self):
+        """
+        Write a snapshot of the store and start a new empty log.
+        """
+        with self._gate.snapshot(), self._log_lock:
+            self._write_pending()
+            old_generation = self._generation
+            self._generation += 1
+            self._write_snapshot(self._generation)
+            self._log_file.close()
+            self._log_file = open(self._log_path(self._generation), "a", encoding="utf-8")
+            self._log_length = 0
+            os.remove(self._log_path(old_generation))
+
+    def close(self):
+        """
+        Write the logged changes to disk and close the log.
+        """
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.sync()
+        self._log_file.close()
+
+    def _log_order(self, shopping_list):
+        # Immaterial products have no stock, so only physical products are logged.
+        # Orders accept True as a quantity of 1, so the quantity is written as an int.
+        ids = self._ids
+        fields = [f"{ids[product]} {int(quantity)}"
+                  for product, quantity in self.merge_shopping_list_items(shopping_list)
+                  if isinstance(product, products.Product)]
+        if fields:
+            self._log("o " + " ".join(fields))
+
+    def order(self, shopping_list):
+        with self._changing():
+            price, message = super().order(shopping_list)
+            if price is not None:
+                self._log_order(shopping_list)
+        return price, message
+
+    def order_merged(self, unified_shopping_list, validated_version=None):
+        with self._changing():
+            price, message = super().order_merged(unified_shopping_list, validated_version)
+            if price is not None:
+                self._log_order(unified_shopping_list)
+        return price, message
+
+    def safe_order(self, shopping_list):
+        with self._changing():
+            price, message = super().safe_order(shopping_list)
+            if price is not None:
+                self._log_order(shopping_list)
+        return price, message
+
+    def order_many(self, shopping_lists):
+        shopping_lists = list(shopping_lists)
+        with self._changing():
+            results = super().order_many(shopping_lists)
+            for shopping_list, (price, _) in zip(shopping_lists, results):
+                if price is not None:
+                    self._log_order(shopping_list)
+        return results
+
+    def check_promotion(self, product, promotion):
+        """
+        Refuse promotions which cannot be saved in the snapshot.
+        """
+        promotion_to_dict(promotion)
+
+    def restock(self, product, quantity):
+        """
+        Add quantity pieces of a physical product to the store.
+        :param product: instance of products.Product in the store
+        :param quantity: how many pieces to add, a positive int
+        :return: None
+        """
+        if product not in self or not isinstance(product, products.Product):
+            raise ValueError(f"{product.name} is not a physical product of this store")
+        # The log must be readable again, so only plain ints are accepted
+        if not isinstance(quantity, int) or isinstance(quantity, bool):
+            raise TypeError("Quantity must be an integer")
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        with self._changing():
+            product.set_quantity(product.get_quantity() + quantity)
+            self._log(f"r {self._ids[product]} {quantity}")
+
+    def add_product(self, new_product):
+        # The record is made first, so a product which cannot be saved
+        # raises TypeError before the store is changed
+        record = "a " + json.dumps(product_to_dict(new_product), separators=(",", ":"))
+        with self._changing():
+            self._add_with_id(new_product)
+            self._log(record)
+
+    def remove_product(self, product):
+        if product not in self:
+            return
+        with self._changing():
+            self._log(f"x {self._remove_with_id(product)}")
@@ -0,0 +1,117 @@
+"""
+Price index for the Store class.
+
+PriceIndex keeps entries (price, position, value) in price order. The
+entries are split into sorted blocks of at most 2 * BLOCK_SIZE entries, and
+the last entry of each block is kept in a separate list. A binary search in
+that list finds the block, and a second one finds the place in the block.
+Adding or removing an entry moves at most one block, so updates stay cheap
+for large catalogs, and reading k entries from a price costs O(log n + k).
+"""
+
+from bisect import bisect_left, insort
+
+BLOCK_SIZE = 512
+
+
+class PriceIndex:
+    """
+    Sorted entries (price, position, value). The position must be unique,
+    so two entries never compare their values.
+    """
+    def __init__(self, entries=()):
+        """
+        Initialize the index.
+        :param entries: entries (price, position, value) in any order
+        """
+        entries = sorted(entries)
+        self._blocks = [entries[start:start + BLOCK_SIZE]
+                        for start in range(0, len(entries), BLOCK_SIZE)]
+        # Last entry of each block
+        self._maximums = [block[-1] for block in self._blocks]
+        self._length = len(entries)
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, entry):
+        block_number = bisect_left(self._maximums, entry)
+        if block_number == len(self._blocks):
+            return False
+        block = self._blocks[block_number]
+        position = bisect_left(block, entry)
+        return position < len(block) and block[position] == entry
+
+    def add(self, entry):
+        """
+        Add an entry (price, position, value).
+        """
+        blocks = self._blocks
+        self._length += 1
+        if not blocks:
+            blocks.append([entry])
+            self._maximums.append(entry)
+            return
+        block_number = min(bisect_left(self._maximums, entry), len(blocks) - 1)
+        block = blocks[block_number]
+        insort(block, entry)
+        self._maximums[block_number] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            blocks.insert(block_number + 1, block[BLOCK_SIZE:])
+            del block[BLOCK_SIZE:]
+            self._maximums.insert(block_number, block[-1])
+
+    def remove(self, entry):
+        """
+        Remove an entry if it is in the index.
+        """
+        block_number = bisect_left(self._maximums, entry)
+        if block_number == len(self._blocks):
+            return
+        block = self._blocks[block_number]
+        position = bisect_left(block, entry)
+        if position == len(block) or block[position] != entry:
+            return
+        del block[position]
+        self._length -= 1
+        if block:
+            self._maximums[block_number] = block[-1]
+        else:
+            del self._blocks[block_number]
+            del self._maximums[block_number]
+
+    def ascending(self, minimum_price=None):
+        """
+        Return the entries in price order, starting from the cheapest entry
+        which costs at least minimum_price. Entries with the same price are
+        in position order. The entries are found as the result is iterated.
+        """
+        blocks = self._blocks
+        block_number = position = 0
+        if minimum_price is not None:
+            # (price,) sorts before every entry with that price
+            start = (minimum_price,)
+            block_number = bisect_left(self._maximums, start)
+            if block_number < len(blocks):
+                position = bisect_left(blocks[block_number], start)
+        for block in blocks[block_number:]:
+            yield from block[position:]
+            position = 0
+
+    def descending(self):
+        """
+        Return the entries from the most expensive to the cheapest. Entries
+        with the same price are in reverse position order.
+        """
+        for block in reversed(self._blocks):
+            yield from reversed(block)
+
+    def between(self, minimum_price, maximum_price):
+        """
+        Return the entries with minimum_price <= price <= maximum_price in
+        price order.
+        """
+        for entry in self.ascending(minimum_price):
+            if entry[0] > maximum_price:
+                return
+            yield entry
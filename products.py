@@ -2,7 +2,139 @@
 Various product classes for the Store class to use.
 """
 
+import weakref
+from collections import OrderedDict
+from operator import attrgetter
+
 import promotions
+from instrumentation import PROMOTION, clock, store_metrics
+
+
+class QuoteCache:
+    """
+    Bounded cache of promotion prices keyed by (product, quantity).
+    The least recently used quote is dropped when the cache is full.
+    Products drop their quotes from the cache when their price or promotion changes.
+    """
+    def __init__(self, maxsize=4096):
+        """
+        Initialize the cache.
+        :param maxsize: How many quotes the cache holds at most.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._quotes = OrderedDict()
+        # product -> quantities of the product in the cache
+        self._quantities = {}
+
+    def __len__(self):
+        return len(self._quotes)
+
+    def get(self, product, quantity, compute):
+        """
+        Return the cached price of the quantity of the product.
+        :param compute: function called as compute(quantity) if the price is not cached
+        :return: the price
+        """
+        key = (product, quantity)
+        try:
+            price = self._quotes[key]
+        except KeyError:
+            self.misses += 1
+            price = compute(quantity)
+            if self.maxsize > 0:
+                self._quotes[key] = price
+                self._quantities.setdefault(product, set()).add(quantity)
+                if len(self._quotes) > self.maxsize:
+                    self._forget(*self._quotes.popitem(last=False)[0])
+            return price
+        self.hits += 1
+        self._quotes.move_to_end(key)
+        return price
+
+    def _forget(self, product, quantity):
+        """
+        Forget the quantity of the product after its quote has been dropped.
+        """
+        quantities = self._quantities[product]
+        quantities.discard(quantity)
+        if not quantities:
+            del self._quantities[product]
+
+    def invalidate(self, product):
+        """
+        Drop all the quotes of the product.
+        """
+        for quantity in self._quantities.pop(product, ()):
+            del self._quotes[(product, quantity)]
+
+    def invalidate_promotion(self, promotion):
+        """
+        Drop the quotes of the products which have the promotion.
+        """
+        for product in [product for product in self._quantities
+                        if product._promotion is promotion]:
+            self.invalidate(product)
+
+    def clear(self):
+        """
+        Drop all quotes and reset the counters.
+        """
+        self._quotes.clear()
+        self._quantities.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Quotes of all the products with a promotion go through this cache
+quote_cache = QuoteCache()
+
+
+class PricingMode:
+    """
+    How promotion prices are computed. By default promotions return floats.
+    In exact mode prices are taken as whole minor units (cents) and
+    promotions return integers rounded with the rounding policy, so order
+    totals are integer sums.
+    """
+    def __init__(self):
+        self.exact = False
+        self.rounding = promotions.ROUND_HALF_EVEN
+        # Changes when the mode is switched or when promotion prices change
+        # without the products being told, so saved prices can be checked
+        self.version = 0
+
+    def use_exact(self, rounding=promotions.ROUND_HALF_EVEN):
+        """
+        Compute promotion prices in whole minor units.
+        :param rounding: one of promotions.ROUNDINGS
+        """
+        if rounding not in promotions.ROUNDINGS:
+            raise ValueError(f"Unknown rounding {rounding}")
+        self.exact = True
+        self.rounding = rounding
+        self.version += 1
+        quote_cache.clear()
+
+    def prices_changed(self):
+        """
+        Tell the holders of saved prices, like carts, that promotion prices
+        have changed. Used by promotions which change without set_promotion.
+        """
+        self.version += 1
+
+    def use_float(self):
+        """
+        Compute promotion prices with floats.
+        """
+        self.exact = False
+        self.version += 1
+        quote_cache.clear()
+
+
+# Pricing mode of all the products
+pricing_mode = PricingMode()
 
 
 class ImmaterialProduct:
@@ -11,6 +143,10 @@ class ImmaterialProduct:
     is a limitless supply.
     This is the base class for all product classes.
     """
+    # All the subclasses of ImmaterialProduct use __slots__ to keep products small.
+    # Product and LimitedImmaterialProduct are both bases of LimitedProduct, so only
+    # one of them can add slots: _quantity is declared here instead of in Product.
+    __slots__ = ('name', '_price', '_active', '_promotion', '_quantity', '_observers')
 
     def __init__(self, name, price):
         """
@@ -26,6 +162,40 @@ class ImmaterialProduct:
         self._price = price
         self._active = True
         self._promotion = None
+        # Weak references to the stores which want to know when the product changes
+        self._observers = ()
+
+    def add_observer(self, observer):
+        """
+        Tell the observer when the product changes. The observer is usually a Store.
+        Only a weak reference to the observer is kept.
+        It needs the methods on_product_activity_changed(product),
+        on_product_quantity_changed(product, old_quantity),
+        on_product_price_changed(product, old_price),
+        check_promotion(product, promotion) and
+        on_product_promotion_changed(product).
+        """
+        self._observers = tuple(reference for reference in self._observers
+                                if reference() not in (None, observer)) + (weakref.ref(observer),)
+
+    def remove_observer(self, observer):
+        """
+        Stop telling the observer about changes of the product.
+        """
+        self._observers = tuple(reference for reference in self._observers
+                                if reference() not in (None, observer))
+
+    def _set_active(self, active):
+        """
+        Set the product active or inactive and tell the observers if it changed.
+        """
+        if active == self._active:
+            return
+        self._active = active
+        for reference in self._observers:
+            observer = reference()
+            if observer is not None:
+                observer.on_product_activity_changed(self)
 
     def is_active(self):
         """
@@ -37,13 +207,13 @@ class ImmaterialProduct:
         """
         Activate the product.
         """
-        self._active = True
+        self._set_active(True)
 
     def deactivate(self):
         """
         Deactivate the product.
         """
-        self._active = False
+        self._set_active(False)
 
     def __gt__(self, other):
         """ Overload > operator. """
@@ -64,14 +234,41 @@ class ImmaterialProduct:
         """ Get the price of one product"""
         return self._price
 
+    def set_price(self, price):
+        """
+        Set the price of one product.
+        """
+        if not isinstance(price, int):
+            raise TypeError("Price must be an integer")
+        if price < 0:
+            raise ValueError("Price cannot be negative")
+        old_price = self._price
+        self._price = price
+        quote_cache.invalidate(self)
+        for reference in self._observers:
+            observer = reference()
+            if observer is not None:
+                observer.on_product_price_changed(self, old_price)
+
     def name_and_price(self, quantity=1):
         """
         Return the product name and price based on given quantity.
+        Prices with a promotion come from the quote cache if the promotion can be cached.
         """
         if self._promotion is not None:
-            return self.name, self._promotion.apply_promotion(self, quantity)
+            if self._promotion.cacheable:
+                return self.name, quote_cache.get(self, quantity, self._promotion_price)
+            return self.name, self._promotion_price(quantity)
         return self.name, self._price * quantity
 
+    def _promotion_price(self, quantity):
+        """
+        Return the price of the quantity with the promotion applied.
+        """
+        if pricing_mode.exact:
+            return self._promotion.apply_promotion_exact(self, quantity, pricing_mode.rounding)
+        return self._promotion.apply_promotion(self, quantity)
+
     def buy(self, quantity=1):
         """
         Return the price based on given quantity.
@@ -82,6 +279,15 @@ class ImmaterialProduct:
         if precheck is False:
             return False, message
         if self._promotion is not None:
+            if store_metrics.enabled:
+                start_time = clock()
+                price = self._promotion_price(quantity)
+                store_metrics.record(PROMOTION, clock() - start_time)
+                return price, "Purchase was successful"
+            if pricing_mode.exact:
+                return (self._promotion.apply_promotion_exact(self, quantity,
+                                                              pricing_mode.rounding),
+                        "Purchase was successful")
             return self._promotion.apply_promotion(self, quantity), "Purchase was successful"
         return quantity * self._price, "Purchase was successful"
 
@@ -103,7 +309,17 @@ class ImmaterialProduct:
         """
         if not isinstance(promotion, promotions.Promotion):
             raise TypeError("promotion must be of type promotions.Promotion")
+        # A store may refuse the promotion, so ask before anything is changed
+        for reference in self._observers:
+            observer = reference()
+            if observer is not None:
+                observer.check_promotion(self, promotion)
         self._promotion = promotion
+        quote_cache.invalidate(self)
+        for reference in self._observers:
+            observer = reference()
+            if observer is not None:
+                observer.on_product_promotion_changed(self)
 
 class Product(ImmaterialProduct):
     """
@@ -111,6 +327,8 @@ class Product(ImmaterialProduct):
     The major difference from ImmaterialProduct:
     There is a defined number of the product available.
     """
+    __slots__ = ()
+
     def __init__(self, name, price, quantity):
         """
         Initialize the product.
@@ -136,8 +354,13 @@ class Product(ImmaterialProduct):
         """
         Set the quantity of the product.
         """
+        old_quantity = self._quantity
         self._quantity = quantity
-        self._active = quantity > 0
+        for reference in self._observers:
+            observer = reference()
+            if observer is not None:
+                observer.on_product_quantity_changed(self, old_quantity)
+        self._set_active(quantity > 0)
 
     def __str__(self):
         """
@@ -177,6 +400,8 @@ class LimitedImmaterialProduct(ImmaterialProduct):
     """
     Limited immaterial product can be sold only a defined amount in one order.
     """
+    __slots__ = ('__maximum',)
+
     def __init__(self, name, price, maximum=1):
         """
         Initialize the product.
@@ -187,6 +412,12 @@ class LimitedImmaterialProduct(ImmaterialProduct):
         super().__init__(name, price)
         self.__maximum = maximum
 
+    def get_maximum(self):
+        """
+        Return how many of the product can be included in one order.
+        """
+        return self.__maximum
+
     def __str__(self):
         """
         Return the product name, price and quantity in a string.
@@ -214,10 +445,18 @@ class LimitedProduct(Product, LimitedImmaterialProduct):
     """
     Limited product can be sold only one at a time
     """
+    __slots__ = ('__maximum',)
+
     def __init__(self, name, price, quantity, maximum=1):
         super().__init__(name, price, quantity)
         self.__maximum = maximum
 
+    def get_maximum(self):
+        """
+        Return how many of the product can be included in one order.
+        """
+        return self.__maximum
+
     def __str__(self):
         """
         Return the product name, price and quantity in a string.
@@ -241,6 +480,120 @@ class LimitedProduct(Product, LimitedImmaterialProduct):
                            f"Only {self.__maximum} allowed in one purchase")
         return precheck, message
 
+# Kinds of purchase limits
+STOCK = "stock"
+ORDER_MAXIMUM = "order maximum"
+
+# The limits the precheck_purchase method of each product class adds to those
+# of its base classes, as (attribute holding the limit, kind of limit).
+# Every class also requires a positive integer quantity. Being inactive is
+# not a limit: precheck_purchase lets inactive products pass.
+PURCHASE_CONSTRAINTS = {
+    ImmaterialProduct: (),
+    Product: (("_quantity", STOCK),),
+    LimitedImmaterialProduct: (("_LimitedImmaterialProduct__maximum", ORDER_MAXIMUM),),
+    LimitedProduct: (("_LimitedProduct__maximum", ORDER_MAXIMUM),),
+}
+
+# product class -> compiled purchase check
+purchase_checks = {}
+
+
+def _limit_error(product, quantity, limits):
+    """
+    Return the message of the first limit the quantity goes over, None if there is none.
+    """
+    for attribute, kind in limits:
+        limit = getattr(product, attribute)
+        if quantity > limit:
+            if kind == STOCK:
+                return f"there are only {limit} pieces of {product.name}. Cannot sell {quantity}"
+            return f"{product.name} is a limited product. Only {limit} allowed in one purchase"
+    return None
+
+
+def compile_purchase_check(product_class):
+    """
+    Turn the purchase constraints of a product class into one check function.
+    Limits are checked in the order precheck_purchase checks them, which is
+    base classes first. A class which overrides precheck_purchase but is not
+    in PURCHASE_CONSTRAINTS is checked with its precheck_purchase.
+    :param product_class: ImmaterialProduct or a subclass
+    :return: function check(product, quantity) which returns None if the
+             purchase is possible and the message of precheck_purchase if not
+    """
+    check = purchase_checks.get(product_class)
+    if check is not None:
+        return check
+    limits = []
+    for base in reversed(product_class.__mro__):
+        if base in PURCHASE_CONSTRAINTS:
+            limits.extend(PURCHASE_CONSTRAINTS[base])
+        elif "precheck_purchase" in vars(base):
+            limits = None
+            break
+    if limits is None:
+        def check(product, quantity):
+            precheck, message = product.precheck_purchase(quantity)
+            return message if precheck is False else None
+    else:
+        # The limit attributes are read with attrgetters made once per
+        # class, and the message is made only when a limit is passed.
+        limits = tuple(limits)
+        getters = tuple(attrgetter(attribute) for attribute, _ in limits)
+        if len(getters) == 1:
+            get_limit = getters[0]
+
+            def check(product, quantity):
+                if not isinstance(quantity, int) or quantity <= 0:
+                    return 'impossible quantity given'
+                if quantity <= get_limit(product):
+                    return None
+                return _limit_error(product, quantity, limits)
+        elif len(getters) == 2:
+            get_first_limit, get_second_limit = getters
+
+            def check(product, quantity):
+                if not isinstance(quantity, int) or quantity <= 0:
+                    return 'impossible quantity given'
+                if quantity <= get_first_limit(product) and quantity <= get_second_limit(product):
+                    return None
+                return _limit_error(product, quantity, limits)
+        else:
+            def check(product, quantity):
+                if not isinstance(quantity, int) or quantity <= 0:
+                    return 'impossible quantity given'
+                for get_limit in getters:
+                    if quantity > get_limit(product):
+                        return _limit_error(product, quantity, limits)
+                return None
+    purchase_checks[product_class] = check
+    return check
+
+
+def purchase_error(product, quantity):
+    """
+    Check if it is possible to purchase the product in the quantity defined.
+    Same as precheck_purchase, but the message is made only on failure.
+    :return: None if the purchase is possible, else the message of precheck_purchase.
+    """
+    check = purchase_checks.get(product.__class__) or compile_purchase_check(product.__class__)
+    return check(product, quantity)
+
+
+def purchase_errors(lines):
+    """
+    Check many purchases at once.
+    :param lines: An iterable of (product, quantity) pairs
+    :return: A list with the result of purchase_error for each pair
+    """
+    checks = purchase_checks
+    errors = []
+    for product, quantity in lines:
+        check = checks.get(product.__class__) or compile_purchase_check(product.__class__)
+        errors.append(check(product, quantity))
+    return errors
+
 
 def main():
     """
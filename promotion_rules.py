@@ -0,0 +1,245 @@
+"""
+Stackable promotion rules for the Best Buy store.
+
+A product holds one promotion. PromotionRules is a promotion which holds
+many rules, so several promotions can apply to the same product:
+
+    rules = PromotionRules("Spring sale")
+    rules.add_rule(promotions.PercentDiscount("10% off", percent=10))
+    rules.add_rule(promotions.ThirdOneFree("Third One Free!"),
+                   names=["Google Pixel 7"], priority=5)
+    pixel.set_promotion(rules)
+
+Each rule has a promotion, the names of the products it applies to (all
+products by default), a priority, an exclusive flag and an optional date
+window. The rules of a product name are resolved into a plan, which is the
+tuple of promotions to apply. Plans are kept until a rule is added or
+removed, or until a date window opens or closes. Pricing then runs the plan
+and does not look at the rules, so its cost does not depend on how many
+rules there are.
+
+Stacked promotions are applied one after the other: each promotion prices
+the quantity at the unit price left by the previous one.
+"""
+
+from bisect import bisect_right
+from datetime import datetime
+from fractions import Fraction
+
+import products
+import promotions
+
+
+class PromotionRule:
+    """
+    One rule of PromotionRules.
+    """
+    def __init__(self, promotion, names=None, priority=0, exclusive=False,
+                 start=None, end=None):
+        """
+        Initialize the rule.
+        :param promotion: instance of promotions.Promotion
+        :param names: names of the products the rule applies to, None for all products
+        :param priority: rules with a higher priority are applied first
+        :param exclusive: the rule applies alone. It is skipped if a rule with
+                          a higher priority already applies.
+        :param start: datetime when the rule starts to apply, None if it always has
+        :param end: datetime when the rule stops applying, None if it never does
+        """
+        if not isinstance(promotion, promotions.Promotion):
+            raise TypeError("promotion must be of type promotions.Promotion")
+        if isinstance(promotion, PromotionRules):
+            raise TypeError("Promotion rules cannot be nested")
+        if start is not None and end is not None and start >= end:
+            raise ValueError("Rule must start before it ends")
+        self.promotion = promotion
+        self.names = None if names is None else frozenset(names)
+        self.priority = priority
+        self.exclusive = exclusive
+        self.start = start
+        self.end = end
+
+    def is_valid_at(self, moment):
+        """
+        Test if the date window of the rule contains the moment.
+        """
+        return ((self.start is None or self.start <= moment)
+                and (self.end is None or moment < self.end))
+
+    def __str__(self):
+        return self.promotion.name
+
+
+class PromotionRules(promotions.Promotion):
+    """
+    Promotion which applies the rules matching the product.
+    """
+    def __init__(self, name, clock=datetime.now):
+        """
+        Initialize an empty set of rules.
+        :param name: name of the promotion
+        :param clock: function returning the current datetime
+        """
+        super().__init__(name)
+        self.clock = clock
+        # Rules sorted by priority, highest first, then in the order they were added
+        self._rules = []
+        # rule -> position in _rules
+        self._rule_positions = {}
+        # product name -> rules for that name, sorted like _rules
+        self._rules_by_name = {}
+        # Rules for all products, sorted like _rules
+        self._general_rules = []
+        # Starts and ends of the date windows, sorted
+        self._boundaries = []
+        # product name -> plan, for the time between _valid_from and _valid_until
+        self._plans = {}
+        self._valid_from = None
+        self._valid_until = None
+
+    @property
+    def cacheable(self):
+        """
+        Quotes can be cached if no rule has a date window: rules which start
+        or end change the price without the promotion being set again.
+        """
+        return not self._boundaries
+
+    def get_rules(self):
+        """
+        Return the rules, highest priority first.
+        """
+        return list(self._rules)
+
+    def add_rule(self, promotion, names=None, priority=0, exclusive=False,
+                 start=None, end=None):
+        """
+        Add a rule. The parameters are those of PromotionRule.
+        :return: the new PromotionRule
+        """
+        rule = PromotionRule(promotion, names, priority, exclusive, start, end)
+        self.add_rules([rule])
+        return rule
+
+    def add_rules(self, rules):
+        """
+        Add many rules at once. The plans are dropped only once.
+        :param rules: instances of PromotionRule
+        """
+        self._rules.extend(rules)
+        self._rules_changed()
+
+    def remove_rule(self, rule):
+        """
+        Remove a rule returned by add_rule.
+        """
+        if rule in self._rules:
+            self._rules.remove(rule)
+            self._rules_changed()
+
+    def _rules_changed(self):
+        """
+        Rebuild the rule indexes and drop the plans and the cached quotes of
+        the products with these rules.
+        """
+        # sort is stable, so rules with the same priority stay in the order added
+        self._rules.sort(key=lambda rule: -rule.priority)
+        self._rule_positions = {rule: number for number, rule in enumerate(self._rules)}
+        self._rules_by_name = {}
+        self._general_rules = []
+        boundaries = set()
+        for rule in self._rules:
+            if rule.names is None:
+                self._general_rules.append(rule)
+            else:
+                for name in rule.names:
+                    self._rules_by_name.setdefault(name, []).append(rule)
+            boundaries.update(moment for moment in (rule.start, rule.end) if moment is not None)
+        self._boundaries = sorted(boundaries)
+        self._plans = {}
+        self._valid_from = self._valid_until = None
+        products.quote_cache.invalidate_promotion(self)
+        products.pricing_mode.prices_changed()
+
+    def _check_window(self):
+        """
+        Drop the plans if a date window has opened or closed since they were made.
+        """
+        moment = self.clock()
+        if ((self._valid_from is not None and moment < self._valid_from)
+                or (self._valid_until is not None and moment >= self._valid_until)
+                or (self._valid_from is None and self._valid_until is None)):
+            self._plans = {}
+            products.pricing_mode.prices_changed()
+            position = bisect_right(self._boundaries, moment)
+            self._valid_from = self._boundaries[position - 1] if position > 0 else None
+            self._valid_until = (self._boundaries[position]
+                                 if position < len(self._boundaries) else None)
+        return moment
+
+    def get_plan(self, name):
+        """
+        Return the promotions applied to the products with the name, in order.
+        :param name: product name
+        :return: tuple of instances of promotions.Promotion
+        """
+        moment = self._check_window() if self._boundaries else None
+        plan = self._plans.get(name)
+        if plan is None:
+            plan = self._plans[name] = self._compile_plan(name, moment)
+        return plan
+
+    def _compile_plan(self, name, moment):
+        """
+        Resolve the rules of a product name at a moment into a plan.
+        """
+        named_rules = self._rules_by_name.get(name, [])
+        if named_rules and self._general_rules:
+            # Both lists are in rule order, and sort merges sorted runs quickly
+            rules = sorted(named_rules + self._general_rules,
+                           key=self._rule_positions.__getitem__)
+        else:
+            rules = named_rules or self._general_rules
+        plan = []
+        for rule in rules:
+            if moment is not None and not rule.is_valid_at(moment):
+                continue
+            if rule.exclusive:
+                if not plan:
+                    plan.append(rule.promotion)
+                    break
+                continue
+            plan.append(rule.promotion)
+        return tuple(plan)
+
+    def apply_promotion(self, product, quantity):
+        plan = self.get_plan(product.name)
+        if not plan or quantity == 0:
+            return product.get_price() * quantity
+        if len(plan) == 1:
+            return plan[0].apply_promotion(product, quantity)
+        unit_price = product.get_price()
+        for promotion in plan:
+            price = promotion.apply_promotion(promotions._UnitPrice(unit_price), quantity)
+            unit_price = price / quantity
+        return price
+
+    def apply_promotion_exact(self, product, quantity, rounding=promotions.ROUND_HALF_EVEN):
+        plan = self.get_plan(product.name)
+        if len(plan) == 1:
+            return plan[0].apply_promotion_exact(product, quantity, rounding)
+        # Multiply the paid fractions and round once at the end
+        paid = Fraction(product.get_price() * quantity)
+        for promotion in plan:
+            paid *= promotion.paid_fraction(quantity)
+        return promotions.divide_rounded(paid.numerator, paid.denominator, rounding)
+
+    def paid_fraction(self, quantity):
+        raise TypeError("Promotion rules cannot be nested")
+
+    def apply_promotion_batch(self, prices, quantities):
+        raise TypeError("Promotion rules need the product name, price them one by one")
+
+    def apply_promotion_batch_exact(self, prices, quantities,
+                                    rounding=promotions.ROUND_HALF_EVEN):
+        raise TypeError("Promotion rules need the product name, price them one by one")
@@ -3,12 +3,43 @@ Promotion classes are used in Best Buy to define product price discounts of diff
 """
 
 from abc import ABC, abstractmethod
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_EVEN, ROUND_HALF_UP
+from fractions import Fraction
+
+# Rounding policies of exact prices. The names are those of the decimal module.
+ROUNDINGS = (ROUND_HALF_EVEN, ROUND_HALF_UP, ROUND_FLOOR, ROUND_CEILING)
+
+
+def divide_rounded(numerator, denominator, rounding=ROUND_HALF_EVEN):
+    """
+    Divide two integers and round the result to an integer.
+    :param numerator: integer, not negative
+    :param denominator: integer greater than zero
+    :param rounding: one of ROUNDINGS
+    :return: the rounded quotient
+    """
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder == 0 or rounding == ROUND_FLOOR:
+        return quotient
+    if rounding == ROUND_CEILING:
+        return quotient + 1
+    if rounding not in ROUNDINGS:
+        raise ValueError(f"Unknown rounding {rounding}")
+    twice_remainder = 2 * remainder
+    if twice_remainder > denominator or (twice_remainder == denominator
+                                         and (rounding == ROUND_HALF_UP or quotient % 2)):
+        return quotient + 1
+    return quotient
 
 
 class Promotion(ABC):
     """
     Abstract base class for all promotions.
     """
+    # False if the price of the same product and quantity can change without
+    # the promotion being set again, so quotes must not be cached
+    cacheable = True
+
     def __init__(self, name):
         self.name = name
 
@@ -23,9 +54,72 @@ class Promotion(ABC):
         """
         pass
 
+    def apply_promotion_batch(self, prices, quantities):
+        """
+        Apply the promotion to many (unit price, quantity) pairs at once.
+        The results are the same as those of apply_promotion.
+        Subclasses override this with a version which does not go through
+        apply_promotion for every pair.
+        :param prices: sequence of unit prices
+        :param quantities: sequence of quantities, same length as prices
+        :return: list of prices after applying the promotion
+        """
+        return [self.apply_promotion(_UnitPrice(price), quantity)
+                for price, quantity in zip(prices, quantities)]
+
+    def apply_promotion_exact(self, product, quantity, rounding=ROUND_HALF_EVEN):
+        """
+        Apply the promotion in whole minor units (cents). Prices are integers,
+        so the only rounding is the final one, done with the rounding policy.
+        Subclasses override this with integer arithmetic. This version rounds
+        the exact value of the result of apply_promotion.
+        :param product: instance of one of the product classes.
+        :param quantity: How many products are being bought
+        :param rounding: one of ROUNDINGS
+        :return: The price after applying the promotion, an integer.
+        """
+        price = Fraction(self.apply_promotion(product, quantity))
+        return divide_rounded(price.numerator, price.denominator, rounding)
+
+    def apply_promotion_batch_exact(self, prices, quantities, rounding=ROUND_HALF_EVEN):
+        """
+        Same as apply_promotion_batch, but with the results of apply_promotion_exact.
+        """
+        return [self.apply_promotion_exact(_UnitPrice(price), quantity, rounding)
+                for price, quantity in zip(prices, quantities)]
+
+    def paid_fraction(self, quantity):
+        """
+        Return the part of the list price which is paid for quantity products
+        as an exact fraction. Used to stack promotions: the fractions of the
+        promotions are multiplied together. This version assumes the price of
+        the promotion grows in proportion to the unit price, which is true of
+        the promotions of this module.
+        :param quantity: How many products are being bought
+        :return: fractions.Fraction
+        """
+        if quantity == 0:
+            return Fraction(1)
+        return Fraction(self.apply_promotion(_UnitPrice(1), quantity)) / quantity
+
     def __str__(self):
         return self.name
 
+
+class _UnitPrice:
+    """
+    Minimal stand-in for a product when only the price is known.
+    """
+    __slots__ = ('_price',)
+
+    def __init__(self, price):
+        self._price = price
+
+    def get_price(self):
+        """ Get the price of one product"""
+        return self._price
+
+
 class SecondHalfPrice(Promotion):
     """
     Defines a promotion where the second product is half price.
@@ -34,6 +128,28 @@ class SecondHalfPrice(Promotion):
     def apply_promotion(product, quantity):
         return product.get_price() * (quantity - (quantity // 2) / 2)
 
+    def apply_promotion_batch(self, prices, quantities):
+        return [price * (quantity - (quantity // 2) / 2)
+                for price, quantity in zip(prices, quantities)]
+
+    @staticmethod
+    def apply_promotion_exact(product, quantity, rounding=ROUND_HALF_EVEN):
+        return divide_rounded(product.get_price() * (2 * quantity - quantity // 2), 2, rounding)
+
+    def apply_promotion_batch_exact(self, prices, quantities, rounding=ROUND_HALF_EVEN):
+        if rounding not in ROUNDINGS:
+            raise ValueError(f"Unknown rounding {rounding}")
+        # Only an odd number of half prices needs rounding
+        half_up = rounding in (ROUND_HALF_UP, ROUND_CEILING)
+        results = []
+        for price, quantity in zip(prices, quantities):
+            halves = price * (quantity // 2)
+            whole = price * (quantity - quantity // 2) + halves // 2
+            if halves % 2 and (half_up or (rounding == ROUND_HALF_EVEN and whole % 2)):
+                whole += 1
+            results.append(whole)
+        return results
+
 
 class ThirdOneFree(Promotion):
     """
@@ -43,6 +159,19 @@ class ThirdOneFree(Promotion):
     def apply_promotion(product, quantity):
         return product.get_price() * (quantity - (quantity // 3))
 
+    def apply_promotion_batch(self, prices, quantities):
+        return [price * (quantity - (quantity // 3))
+                for price, quantity in zip(prices, quantities)]
+
+    @staticmethod
+    def apply_promotion_exact(product, quantity, rounding=ROUND_HALF_EVEN):
+        # Whole products only: nothing to round
+        return product.get_price() * (quantity - (quantity // 3))
+
+    def apply_promotion_batch_exact(self, prices, quantities, rounding=ROUND_HALF_EVEN):
+        return [price * (quantity - (quantity // 3))
+                for price, quantity in zip(prices, quantities)]
+
 class PercentDiscount(Promotion):
     """
     Defines a promotion where the percent discount is applied.
@@ -55,6 +184,11 @@ class PercentDiscount(Promotion):
         """
         super().__init__(name)
         self._discount_percent = percent
+        # The part of the price which is paid as an exact fraction, for exact pricing.
+        # The percent is read as written, so 17.1 is 171/10.
+        paid = (100 - Fraction(str(percent))) / 100
+        self._paid_numerator = paid.numerator
+        self._paid_denominator = paid.denominator
 
     def apply_promotion(self, product, quantity):
         """
@@ -64,3 +198,36 @@ class PercentDiscount(Promotion):
         :return:
         """
         return product.get_price() * quantity * (1 - self._discount_percent / 100)
+
+    def apply_promotion_batch(self, prices, quantities):
+        factor = 1 - self._discount_percent / 100
+        return [price * quantity * factor for price, quantity in zip(prices, quantities)]
+
+    def paid_fraction(self, quantity):
+        return Fraction(self._paid_numerator, self._paid_denominator)
+
+    def apply_promotion_exact(self, product, quantity, rounding=ROUND_HALF_EVEN):
+        return divide_rounded(product.get_price() * quantity * self._paid_numerator,
+                              self._paid_denominator, rounding)
+
+    def apply_promotion_batch_exact(self, prices, quantities, rounding=ROUND_HALF_EVEN):
+        numerator = self._paid_numerator
+        denominator = self._paid_denominator
+        if rounding == ROUND_FLOOR:
+            return [price * quantity * numerator // denominator
+                    for price, quantity in zip(prices, quantities)]
+        if rounding == ROUND_CEILING:
+            return [-(-price * quantity * numerator // denominator)
+                    for price, quantity in zip(prices, quantities)]
+        if rounding == ROUND_HALF_UP:
+            return [(2 * price * quantity * numerator + denominator) // (2 * denominator)
+                    for price, quantity in zip(prices, quantities)]
+        if rounding != ROUND_HALF_EVEN:
+            raise ValueError(f"Unknown rounding {rounding}")
+        results = []
+        for price, quantity in zip(prices, quantities):
+            quotient, remainder = divmod(price * quantity * numerator, denominator)
+            if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+                quotient += 1
+            results.append(quotient)
+        return results
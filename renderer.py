@@ -0,0 +1,123 @@
+"""
+Terminal output for the Best Buy application.
+
+The Renderer builds each screen as a list of lines and writes it to the
+terminal in one call. The screen is cleared with escape sequences instead of
+running the clear command in a shell. When a screen is drawn again, only
+the lines which changed are written. When the output is not a terminal, no
+escape sequences are written and every screen is written in full, so the
+output can be read by tests and other programs.
+"""
+
+import shutil
+import sys
+
+# Move the cursor to the top left corner and clear the screen
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+# Clear from the cursor to the end of the line / of the screen
+CLEAR_LINE_END = "\x1b[K"
+CLEAR_SCREEN_END = "\x1b[J"
+# Rows kept free below a screen for prompts and messages. Taller screens
+# would scroll the terminal, so they are always drawn in full.
+PROMPT_ROWS = 8
+
+
+def move_to(row):
+    """
+    Return the escape sequence which moves the cursor to the start of a row.
+    :param row: row number, 1 is the top row
+    """
+    return f"\x1b[{row};1H"
+
+
+def page_lines(lines, page, page_size):
+    """
+    Return one page of lines followed by a line telling which page it is.
+    :param lines: all the lines
+    :param page: page number, 0 is the first page
+    :param page_size: how many lines there are on a page
+    :return: list of lines
+    """
+    page_count = max(1, -(-len(lines) // page_size))
+    page = min(max(page, 0), page_count - 1)
+    return (lines[page * page_size:(page + 1) * page_size]
+            + [f"   Page {page + 1} of {page_count}"])
+
+
+class Renderer:
+    """
+    Write whole screens to a terminal in one call each.
+    """
+    def __init__(self, stream=None):
+        """
+        Initialize the renderer.
+        :param stream: text stream to write to. Default is sys.stdout at the time of writing.
+        """
+        self._stream = stream
+        # Lines of the screen drawn last by show, None if the screen is not known
+        self._screen = None
+
+    @property
+    def stream(self):
+        """ The stream the renderer writes to. """
+        return self._stream if self._stream is not None else sys.stdout
+
+    def is_terminal(self):
+        """
+        Return True if the output goes to a terminal.
+        """
+        try:
+            return self.stream.isatty()
+        except (AttributeError, ValueError):
+            return False
+
+    def rows(self):
+        """
+        Return the number of rows of the terminal.
+        """
+        return shutil.get_terminal_size().lines
+
+    def _write(self, text):
+        stream = self.stream
+        stream.write(text)
+        stream.flush()
+
+    def clear(self):
+        """
+        Clear the screen.
+        """
+        self._screen = None
+        if self.is_terminal():
+            self._write(CLEAR_SCREEN)
+
+    def write(self, lines):
+        """
+        Write lines below what is on the screen.
+        :param lines: list of lines without line endings
+        """
+        if lines:
+            self._write("\n".join(lines) + "\n")
+
+    def show(self, lines, full=False):
+        """
+        Draw a screen from the top. On a terminal, if the previous screen drawn
+        with show fits on the terminal, only the lines which changed are
+        written and everything below the new screen is cleared.
+        :param lines: list of lines without line endings
+        :param full: clear the screen and draw all the lines in any case
+        """
+        if not self.is_terminal():
+            self.write(lines)
+            return
+        previous = self._screen
+        rows = self.rows()
+        if (full or previous is None or len(previous) + PROMPT_ROWS > rows
+                or len(lines) + PROMPT_ROWS > rows):
+            output = [CLEAR_SCREEN, "\n".join(lines), "\n"]
+        else:
+            output = [move_to(row) + line + CLEAR_LINE_END
+                      for row, line in enumerate(lines, start=1)
+                      if row > len(previous) or previous[row - 1] != line]
+            output.append(move_to(len(lines) + 1) + CLEAR_SCREEN_END)
+        self._screen = list(lines)
+        self._write("".join(output))
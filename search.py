@@ -0,0 +1,240 @@
+"""
+Product name search for the Store class.
+
+Names are split into words (tokens) which are case folded. NameSearch keeps
+two indexes: one from every token to the products whose names contain it,
+and one from the whole case folded name to the products. Both find the keys
+starting with a prefix with a binary search in a sorted list of keys, so a
+query costs O(log n) plus the size of the answer.
+"""
+
+import re
+from bisect import bisect_left
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# New keys wait in an unsorted list until a query finds this many of them
+MERGE_THRESHOLD = 1024
+
+# Most keys looked at when guessing how many products a query word matches
+MAXIMUM_COUNTED_KEYS = 256
+
+
+def tokenize(text):
+    """
+    Split text into case folded words.
+    :param text: a string
+    :return: list of words
+    """
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class PrefixIndex:
+    """
+    Map from string keys to lists of values in which the keys starting with
+    a prefix can be found quickly. The keys are kept in a sorted list. New
+    keys are appended to a short unsorted list, which is sorted into the
+    main list when a query finds it too long.
+    """
+    def __init__(self):
+        # key -> values in the order they were added. Keys stay when their
+        # last value is removed, until the sorted list is rebuilt.
+        self._values = {}
+        self._sorted_keys = []
+        self._new_keys = []
+        self._empty_keys = 0
+
+    def __len__(self):
+        return len(self._values) - self._empty_keys
+
+    def add(self, key, value):
+        """
+        Add a value under the key.
+        """
+        values = self._values.get(key)
+        if values is None:
+            self._values[key] = [value]
+            self._new_keys.append(key)
+            return
+        if not values:
+            self._empty_keys -= 1
+        values.append(value)
+
+    def remove(self, key, value):
+        """
+        Remove a value from under the key if it is there.
+        """
+        values = self._values.get(key)
+        if values and value in values:
+            values.remove(value)
+            if not values:
+                self._empty_keys += 1
+
+    def get(self, key):
+        """
+        Return the values under the key.
+        """
+        return list(self._values.get(key, ()))
+
+    def count(self, key):
+        """
+        Return how many values there are under the key.
+        """
+        return len(self._values.get(key, ()))
+
+    def _sort_new_keys(self):
+        """
+        Move the new keys into the sorted list. Keys without values are
+        dropped when they have become a large part of the index.
+        """
+        if self._empty_keys > len(self._values) // 8:
+            values = self._values
+            self._values = {key: key_values for key, key_values in values.items()
+                            if key_values}
+            self._sorted_keys = sorted(self._values)
+            self._empty_keys = 0
+        else:
+            # Two sorted runs, which sort merges in linear time
+            self._new_keys.sort()
+            self._sorted_keys += self._new_keys
+            self._sorted_keys.sort()
+        self._new_keys = []
+
+    def keys_with_prefix(self, prefix):
+        """
+        Return the keys starting with the prefix in sorted order.
+        The keys are found as the result is iterated.
+        """
+        if len(self._new_keys) > MERGE_THRESHOLD:
+            self._sort_new_keys()
+        new_keys = sorted(key for key in self._new_keys if key.startswith(prefix))
+        return self._merge_keys(prefix, new_keys)
+
+    def _merge_keys(self, prefix, new_keys):
+        sorted_keys = self._sorted_keys
+        position = bisect_left(sorted_keys, prefix)
+        new_position = 0
+        while True:
+            if position < len(sorted_keys) and sorted_keys[position].startswith(prefix):
+                key = sorted_keys[position]
+            else:
+                key = None
+            if new_position < len(new_keys) and (key is None or new_keys[new_position] < key):
+                key = new_keys[new_position]
+                new_position += 1
+            elif key is not None:
+                position += 1
+            else:
+                return
+            yield key
+
+    def values_with_prefix(self, prefix):
+        """
+        Return the values of the keys starting with the prefix, key by key in
+        sorted order. The values are found as the result is iterated.
+        """
+        values = self._values
+        for key in self.keys_with_prefix(prefix):
+            yield from values[key]
+
+
+class NameSearch:
+    """
+    Token and whole name indexes of product names.
+    """
+    def __init__(self, products=()):
+        """
+        Initialize the indexes.
+        :param products: products to index
+        """
+        self._tokens = PrefixIndex()
+        self._names = PrefixIndex()
+        for product in products:
+            self.add(product)
+
+    def add(self, product):
+        """
+        Index the name of the product.
+        """
+        self._names.add(product.name.casefold(), product)
+        for token in set(tokenize(product.name)):
+            self._tokens.add(token, product)
+
+    def remove(self, product):
+        """
+        Remove the product from the indexes.
+        """
+        self._names.remove(product.name.casefold(), product)
+        for token in set(tokenize(product.name)):
+            self._tokens.remove(token, product)
+
+    def search_prefix(self, prefix, limit=10, accept=None):
+        """
+        Find products whose names start with the prefix, ignoring case.
+        :param prefix: start of the name
+        :param limit: the most products to return, None for all
+        :param accept: function which returns False for products to leave out
+        :return: list of products ordered by name
+        """
+        found = []
+        if limit is not None and limit <= 0:
+            return found
+        for product in self._names.values_with_prefix(prefix.casefold()):
+            if accept is None or accept(product):
+                found.append(product)
+                if len(found) == limit:
+                    break
+        return found
+
+    def search(self, query, limit=10, accept=None):
+        """
+        Find products whose names have, for every word of the query, a word
+        starting with it. Case is ignored. "goo pix" finds "Google Pixel 7".
+        :param query: words to look for
+        :param limit: the most products to return, None for all
+        :param accept: function which returns False for products to leave out
+        :return: list of products. The query word which matches the fewest
+                 products picks the order: products where it is a whole
+                 word come first, then by the word it starts in
+                 alphabetical order.
+        """
+        query_tokens = tokenize(query)
+        found = []
+        if not query_tokens or (limit is not None and limit <= 0):
+            return found
+        leading_token = self._most_selective(query_tokens)
+        query_tokens.remove(leading_token)
+        # The other words must each start a word of the name
+        other_words = re.compile("".join(rf"(?=.*\b{re.escape(query_token)})"
+                                         for query_token in query_tokens))
+        seen = set()
+        for product in self._tokens.values_with_prefix(leading_token):
+            if product in seen:
+                continue
+            seen.add(product)
+            if query_tokens and other_words.match(product.name.casefold()) is None:
+                continue
+            if accept is None or accept(product):
+                found.append(product)
+                if len(found) == limit:
+                    break
+        return found
+
+    def _most_selective(self, query_tokens):
+        """
+        Return the query word which starts the words of the fewest products.
+        Counting stops as soon as a word is known not to be the best one, or
+        after MAXIMUM_COUNTED_KEYS keys.
+        """
+        best_token = None
+        best_count = None
+        for query_token in sorted(set(query_tokens), key=len, reverse=True):
+            count = 0
+            for counted_keys, key in enumerate(self._tokens.keys_with_prefix(query_token)):
+                count += self._tokens.count(key)
+                if ((best_count is not None and count >= best_count)
+                        or counted_keys >= MAXIMUM_COUNTED_KEYS):
+                    break
+            if best_count is None or count < best_count:
+                best_token, best_count = query_token, count
+        return best_token
@@ -0,0 +1,209 @@
+"""
+Asyncio network front-end for the Best Buy store.
+
+The server speaks newline delimited JSON over TCP. Each request is one JSON
+object on one line and gets one JSON object on one line as the answer.
+
+Requests:
+    {"command": "list"}
+    {"command": "totals"}
+    {"command": "validate", "items": [["MacBook Air M2", 1], ["Shipping", 1]]}
+    {"command": "order", "items": [["MacBook Air M2", 1], ["Shipping", 1]]}
+
+Answers are {"ok": true, "result": ...} or {"ok": false, "error": "message"}.
+Products are referred to by name.
+"""
+
+import asyncio
+import json
+
+import products
+from main import setup_store
+
+
+class RequestError(Exception):
+    """
+    Raised when a request cannot be handled. The message is sent to the client.
+    """
+
+
+class StoreServer:
+    """
+    Serve one Store to many clients on one event loop.
+    Orders from all the clients are queued and applied in batches with
+    Store.order_many, in the order they arrived.
+    """
+    def __init__(self, best_buy, host="127.0.0.1", port=0):
+        """
+        Initialize the server.
+        :param best_buy: instance of the class Store
+        :param host: address to listen on
+        :param port: port to listen on. 0 picks a free port.
+        """
+        self.best_buy = best_buy
+        self.host = host
+        self.port = port
+        self._server = None
+        self._order_queue = None
+        self._order_task = None
+
+    async def start(self):
+        """
+        Start listening. After this the port attribute holds the real port.
+        """
+        self._order_queue = asyncio.Queue()
+        self._order_task = asyncio.create_task(self._process_orders())
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port,
+                                                  backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        Stop the server.
+        """
+        self._server.close()
+        await self._server.wait_closed()
+        self._order_task.cancel()
+
+    async def serve_forever(self):
+        """
+        Start the server and serve until cancelled.
+        """
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def _handle_client(self, reader, writer):
+        """
+        Answer the requests of one client until it disconnects.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    answer = {"ok": True, "result": await self.handle_request(line)}
+                except RequestError as error:
+                    answer = {"ok": False, "error": str(error)}
+                except Exception as error:  # pylint: disable=broad-except
+                    # A request which fails must not drop the connection
+                    answer = {"ok": False, "error": f"Request failed: {error}"}
+                writer.write(json.dumps(answer).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line):
+        """
+        Handle one request.
+        :param line: the request, a JSON object
+        :return: the result of the request
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            raise RequestError("Request is not valid JSON") from error
+        if not isinstance(request, dict):
+            raise RequestError("Request must be a JSON object")
+        command = request.get("command")
+        if command == "list":
+            return self.list_products()
+        if command == "totals":
+            return self.totals()
+        if command == "validate":
+            validation_result, message = self.best_buy.validate_shopping_list(
+                self.shopping_list(request.get("items")))
+            return {"valid": validation_result, "message": message}
+        if command == "order":
+            price, message = await self.order(self.shopping_list(request.get("items")))
+            if price is None:
+                raise RequestError(message)
+            return {"price": price, "message": message}
+        raise RequestError(f"Unknown command {command}")
+
+    def list_products(self):
+        """
+        Return the active products of the store.
+        """
+        return [{"name": product.name,
+                 "price": product.get_price(),
+                 "quantity": (product.get_quantity()
+                              if isinstance(product, products.Product) else None),
+                 "description": str(product)}
+                for product in self.best_buy.get_all_products()]
+
+    def totals(self):
+        """
+        Return the total number of items, the number of active products
+        and the value of the stock.
+        """
+        return {"total_quantity": self.best_buy.get_total_quantity(),
+                "product_types": self.best_buy.get_product_type_quantity(),
+                "stock_value": self.best_buy.get_stock_value()}
+
+    def shopping_list(self, items):
+        """
+        Turn the items of a request into a shopping list.
+        :param items: A list of [product name, quantity] pairs
+        :return: A list of tuples (product, quantity)
+        """
+        if not isinstance(items, list):
+            raise RequestError("items must be a list of [product name, quantity] pairs")
+        shopping_list, message = self.best_buy.resolve_shopping_list(items)
+        if shopping_list is None:
+            raise RequestError(message)
+        return shopping_list
+
+    async def order(self, shopping_list):
+        """
+        Queue the shopping list for the next batch of orders and wait for the result.
+        :return: Same as Store.order
+        """
+        result = asyncio.get_running_loop().create_future()
+        self._order_queue.put_nowait((shopping_list, result))
+        return await result
+
+    async def _process_orders(self):
+        """
+        Apply the queued orders in batches.
+        """
+        while True:
+            batch = [await self._order_queue.get()]
+            while not self._order_queue.empty():
+                batch.append(self._order_queue.get_nowait())
+            try:
+                results = self.best_buy.order_many(shopping_list for shopping_list, _ in batch)
+            except Exception:  # pylint: disable=broad-except
+                # order_many changes nothing when it fails, so apply the
+                # orders one by one to fail only the order which is wrong
+                results = []
+                for shopping_list, _ in batch:
+                    try:
+                        results.append(self.best_buy.order_many([shopping_list])[0])
+                    except Exception as error:  # pylint: disable=broad-except
+                        results.append(error)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def main():
+    """
+    Serve the demo store on localhost.
+    """
+    server = StoreServer(setup_store(), port=8765)
+    print("Serving Best Buy on 127.0.0.1:8765")
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == '__main__':
+    main()
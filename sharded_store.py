@@ -0,0 +1,427 @@
+"""
+Sharded multi-process store for the Best Buy application.
+
+ShardedStore splits the catalog between worker processes. Each worker holds
+an ordinary Store with its part of the products. All products with the same
+name live in the same shard, picked by a hash of the name, so the lines of a
+shopping list can be sent to the shards which own them.
+
+Shopping lists name their products like the server and ingest modules do:
+    [("MacBook Air M2", 1), ("Shipping", 1)]
+
+An order whose lines are all in one shard is applied by that shard alone.
+An order which spans shards is applied with two phase commit: every shard
+checks and applies its lines but keeps what is needed to undo them, and the
+undo is used on every shard if any of them rejects its lines. So an order is
+applied fully or not at all.
+"""
+
+import multiprocessing
+import os
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+from itertools import count
+
+import products
+from persistence import product_from_dict, product_to_dict
+from store import Store
+
+
+class _Shard:
+    """
+    The part of the store held by one worker process.
+    """
+    def __init__(self):
+        self.store = Store()
+        # product -> position of the product in the whole sharded store
+        self.positions = {}
+        # transaction -> physical products and quantities taken by the transaction
+        self.prepared = {}
+
+    def add_products(self, entries):
+        """
+        Add products to the shard.
+        :param entries: list of (position, product as a dict)
+        """
+        for position, product_dict in entries:
+            product = product_from_dict(product_dict)
+            self.store.add_product(product)
+            if product in self.store and product not in self.positions:
+                self.positions[product] = position
+
+    def remove_product(self, name, price):
+        """
+        Remove the first product with the name and price.
+        """
+        for product in self.store.list_of_products:
+            if product.name == name and product.get_price() == price:
+                self.store.remove_product(product)
+                del self.positions[product]
+                return
+
+    def order(self, items):
+        """
+        Same as Store.order, for (product name, quantity) pairs.
+        """
+        shopping_list, message = self.store.resolve_shopping_list(items)
+        if shopping_list is None:
+            return None, message
+        return self.store.order(shopping_list)
+
+    def order_many(self, orders):
+        """
+        Same as Store.order_many, for lists of (product name, quantity) pairs.
+        """
+        shopping_lists = [self.store.resolve_shopping_list(items) for items in orders]
+        results = iter(self.store.order_many(shopping_list
+                                             for shopping_list, _ in shopping_lists
+                                             if shopping_list is not None))
+        return [next(results) if shopping_list is not None else (None, message)
+                for shopping_list, message in shopping_lists]
+
+    def prepare(self, transaction, items):
+        """
+        First phase of an order which spans shards: apply the lines of this
+        shard and remember how to undo them.
+        :return: Same as Store.order
+        """
+        shopping_list, message = self.store.resolve_shopping_list(items)
+        if shopping_list is None:
+            return None, message
+        validation_result, message = self.store.validate_shopping_list(shopping_list)
+        if validation_result is not True:
+            return None, message
+        taken = []
+        price = 0
+        try:
+            for product, quantity in shopping_list:
+                price += product.buy(quantity)[0]
+                if isinstance(product, products.Product):
+                    taken.append((product, quantity))
+        except BaseException:
+            # A shard which raises keeps nothing, so there is nothing to abort
+            for product, quantity in taken:
+                product.set_quantity(product.get_quantity() + quantity)
+            raise
+        self.prepared[transaction] = taken
+        return price, "Order completed successfully."
+
+    def commit(self, transaction):
+        """
+        Second phase: keep the changes of the transaction.
+        """
+        self.prepared.pop(transaction, None)
+
+    def abort(self, transaction):
+        """
+        Second phase: give back the stock taken by the transaction.
+        """
+        for product, quantity in self.prepared.pop(transaction, ()):
+            product.set_quantity(product.get_quantity() + quantity)
+
+    def products(self):
+        """
+        Return the active products as (position, product as a dict).
+        """
+        return [(self.positions[product], product_to_dict(product))
+                for product in self.store.get_all_products()]
+
+    def find_product(self, name):
+        """
+        Return the first product with the name as (position, product as a dict),
+        None if there is none.
+        """
+        product = self.store.find_product(name)
+        if product is None:
+            return None
+        return self.positions[product], product_to_dict(product)
+
+    def totals(self):
+        """
+        Return the total quantity, the number of active products and the stock value.
+        """
+        return (self.store.get_total_quantity(), self.store.get_product_type_quantity(),
+                self.store.get_stock_value())
+
+
+def _run_shard(connection):
+    """
+    Main loop of a worker process. Requests are (method name, arguments) and
+    answers are (True, result) or (False, exception).
+    """
+    shard = _Shard()
+    while True:
+        command, arguments = connection.recv()
+        if command == "stop":
+            connection.close()
+            return
+        try:
+            connection.send((True, getattr(shard, command)(*arguments)))
+        except Exception as error:  # pylint: disable=broad-except
+            connection.send((False, error))
+
+
+class ShardedStore:
+    """
+    Store whose products are split between worker processes.
+    Each shard has its own lock, held while a request to it is answered, so
+    orders to different shards are applied at the same time by different
+    processes. Reads ask every shard and combine the answers. Products
+    returned by reads are copies: changing them does not change the store.
+    Call close when the store is no longer needed.
+    """
+    def __init__(self, list_of_products=None, shard_count=None):
+        """
+        Start the worker processes and give them their products.
+        :param list_of_products: products of the store
+        :param shard_count: number of worker processes. Default is the number of CPUs.
+        """
+        self.shard_count = shard_count or os.cpu_count() or 1
+        # Guards the position counter
+        self._lock = threading.Lock()
+        # One lock per shard connection. Locks are taken in shard order.
+        self._shard_locks = [threading.Lock() for _ in range(self.shard_count)]
+        self._next_position = 0
+        # next() of a count is atomic, so no lock is needed for transaction numbers
+        self._transactions = count()
+        self._connections = []
+        self._processes = []
+        for _ in range(self.shard_count):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_run_shard, args=(worker_connection,),
+                                              daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self.add_products(list_of_products or [])
+
+    def shard_of(self, name):
+        """
+        Return the number of the shard which holds the products with the name.
+        """
+        if not isinstance(name, str):
+            return 0
+        return zlib.crc32(name.encode("utf-8")) % self.shard_count
+
+    @contextmanager
+    def _locked(self, shards):
+        """
+        Hold the locks of the shards, taken in shard order.
+        :param shards: iterable of shard numbers
+        """
+        with ExitStack() as stack:
+            for shard in sorted(set(shards)):
+                stack.enter_context(self._shard_locks[shard])
+            yield
+
+    def _call(self, calls):
+        """
+        Send requests to shards and wait for all the answers. The shards work
+        on their requests at the same time. Call with the locks of the shards held.
+        :param calls: dict shard number -> (method name, arguments)
+        :return: dict shard number -> result
+        """
+        for shard, call in calls.items():
+            self._connections[shard].send(call)
+        results = {}
+        error = None
+        for shard in calls:
+            succeeded, result = self._connections[shard].recv()
+            if succeeded:
+                results[shard] = result
+            else:
+                error = result
+        if error is not None:
+            raise error
+        return results
+
+    def _call_all(self, command, *arguments):
+        """
+        Send the same request to every shard.
+        :return: list of the results in shard order
+        """
+        with self._locked(range(self.shard_count)):
+            results = self._call({shard: (command, arguments)
+                                  for shard in range(self.shard_count)})
+        return [results[shard] for shard in range(self.shard_count)]
+
+    def add_product(self, new_product):
+        """
+        Add a product to the store with the same rules as Store.add_product.
+        :param new_product: instance of products.ImmaterialProduct or a subclass
+        :return: None
+        """
+        self.add_products([new_product])
+
+    def add_products(self, list_of_products):
+        """
+        Add many products to the store, one request per shard.
+        :param list_of_products: products to add
+        :return: None
+        """
+        entries = {}
+        with self._lock:
+            for product in list_of_products:
+                entries.setdefault(self.shard_of(product.name), []).append(
+                    (self._next_position, product_to_dict(product)))
+                self._next_position += 1
+            with self._locked(entries):
+                self._call({shard: ("add_products", (shard_entries,))
+                            for shard, shard_entries in entries.items()})
+
+    def remove_product(self, product):
+        """
+        Remove the product with the name and price of the given product.
+        :param product: a product of the store, for example one from get_all_products
+        :return: None
+        """
+        shard = self.shard_of(product.name)
+        with self._locked([shard]):
+            self._call({shard: ("remove_product", (product.name, product.get_price()))})
+
+    def _route(self, items):
+        """
+        Split the items of an order by shard.
+        :param items: An iterable of (product name, quantity) pairs
+        :return: dict shard number -> list of items, in the order the shards
+                 first appear in the items. None if the items are not pairs.
+        """
+        lines_by_shard = {}
+        for item in items:
+            if not isinstance(item, (list, tuple)) or len(item) != 2:
+                return None
+            lines_by_shard.setdefault(self.shard_of(item[0]), []).append(tuple(item))
+        return lines_by_shard
+
+    def order(self, items):
+        """
+        Process an order.
+        :param items: An iterable of (product name, quantity) pairs
+        :return: Same as Store.order
+        """
+        lines_by_shard = self._route(items)
+        if lines_by_shard is None:
+            return None, "Items must be (product name, quantity) pairs"
+        with self._locked(lines_by_shard):
+            return self._order_routed(lines_by_shard)
+
+    def _order_routed(self, lines_by_shard):
+        """
+        Process an order which has been split by shard. Call with the locks
+        of its shards held.
+        """
+        if not lines_by_shard:
+            return 0, "Order completed successfully."
+        if len(lines_by_shard) == 1:
+            [(shard, lines)] = lines_by_shard.items()
+            return self._call({shard: ("order", (lines,))})[shard]
+        transaction = next(self._transactions)
+        try:
+            results = self._call({shard: ("prepare", (transaction, lines))
+                                  for shard, lines in lines_by_shard.items()})
+        except Exception:
+            # Every shard has answered. Those which prepared keep the stock
+            # until they are told to abort, and abort does nothing on the others.
+            self._call({shard: ("abort", (transaction,)) for shard in lines_by_shard})
+            raise
+        failed = [shard for shard in lines_by_shard if results[shard][0] is None]
+        if failed:
+            self._call({shard: ("abort", (transaction,))
+                        for shard in lines_by_shard if shard not in failed})
+            return results[failed[0]]
+        self._call({shard: ("commit", (transaction,)) for shard in lines_by_shard})
+        return (sum(price for price, _ in results.values()),
+                "Order completed successfully.")
+
+    def order_many(self, orders):
+        """
+        Process many orders. The result is the same as calling "order" for each
+        order in turn. Orders which stay in one shard are sent to their shards
+        in batches, so all the shards work at the same time.
+        :param orders: An iterable of lists of (product name, quantity) pairs
+        :return: A list with the result of each order in input order.
+        """
+        results = []
+        batches = {}
+
+        def apply_batches():
+            with self._locked(batches):
+                answers = self._call({shard: ("order_many", ([lines for _, lines in batch],))
+                                      for shard, batch in batches.items()})
+            for shard, batch in batches.items():
+                for (index, _), result in zip(batch, answers[shard]):
+                    results[index] = result
+            batches.clear()
+
+        for index, items in enumerate(orders):
+            results.append(None)
+            lines_by_shard = self._route(items)
+            if lines_by_shard is None:
+                results[index] = None, "Items must be (product name, quantity) pairs"
+            elif len(lines_by_shard) == 1:
+                [(shard, lines)] = lines_by_shard.items()
+                batches.setdefault(shard, []).append((index, lines))
+            else:
+                # Earlier orders get the stock first
+                apply_batches()
+                with self._locked(lines_by_shard):
+                    results[index] = self._order_routed(lines_by_shard)
+        apply_batches()
+        return results
+
+    def get_all_products(self):
+        """
+        Return copies of the active products of all the shards in the order
+        they were added.
+        """
+        entries = [entry for shard_entries in self._call_all("products")
+                   for entry in shard_entries]
+        entries.sort(key=lambda entry: entry[0])
+        return [product_from_dict(product_dict) for _, product_dict in entries]
+
+    def find_product(self, name):
+        """
+        Find a product by name.
+        :param name: name of the product
+        :return: A copy of the first product added with that name, None if there is none.
+        """
+        shard = self.shard_of(name)
+        with self._locked([shard]):
+            entry = self._call({shard: ("find_product", (name,))})[shard]
+        return None if entry is None else product_from_dict(entry[1])
+
+    def _totals(self):
+        return self._call_all("totals")
+
+    def get_total_quantity(self):
+        """
+        Return the total quantity of the physical products in the store.
+        """
+        return sum(total_quantity for total_quantity, _, _ in self._totals())
+
+    def get_product_type_quantity(self):
+        """
+        Return how many different items are active in the store inventory.
+        """
+        return sum(product_types for _, product_types, _ in self._totals())
+
+    def get_stock_value(self):
+        """
+        Return the value of the physical products in the store at list price.
+        """
+        return sum(stock_value for _, _, stock_value in self._totals())
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        with self._locked(range(self.shard_count)):
+            for connection in self._connections:
+                connection.send(("stop", ()))
+                connection.close()
+            for process in self._processes:
+                process.join()
+            self._connections = []
+            self._processes = []
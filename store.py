@@ -2,7 +2,14 @@
 The Store class to be used in Best Buy application.
 """
 
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
 import products
+from price_index import PriceIndex
+from search import NameSearch
+from instrumentation import BUY, MERGE, PRECHECK, VALIDATE, clock, store_metrics
 
 
 class Store:
@@ -13,7 +20,182 @@ class Store:
         """
         Initialize the store
         """
-        self.list_of_products = list_of_products
+        self.list_of_products = list_of_products if list_of_products is not None else []
+        # Indexes kept in sync by add_product and remove_product.
+        # _catalog_index: (name, price) -> products sharing that key, in insertion order
+        # _product_ids: identity index used for membership checks
+        # _name_index: name -> products with that name, in insertion order
+        self._catalog_index = {}
+        self._product_ids = set()
+        self._name_index = {}
+        # _positions: product -> insertion position, keeps get_all_products in list order
+        # _active_products: active product -> position. Products tell the store when
+        # they are activated or deactivated.
+        # _active_list: cached get_all_products result, None when it needs a rebuild
+        self._positions = {}
+        self._next_position = 0
+        self._active_products = {}
+        self._active_list = None
+        # Guards _active_products, _active_list and _price_index. Products
+        # call the store from the threads of safe_order when they sell out.
+        self._active_lock = threading.RLock()
+        # Running stock counters of the physical products
+        self._total_quantity = 0
+        self._quantity_by_type = {}
+        self._stock_value = 0
+        self._counters_lock = threading.Lock()
+        # One lock per product for safe_order, created when first needed
+        self._product_locks = {}
+        self._product_locks_lock = threading.Lock()
+        # Changes whenever a product is added, removed or changed. Carts use it
+        # to know if the lines they have checked are still valid.
+        self._version = 0
+        # Name search indexes, built when first searched
+        self._name_search = None
+        # Price index of the active products, built when first queried
+        self._price_index = None
+        # Basket promotions applied to whole orders, None if there are none
+        self._bundle_promotions = None
+        for product in self.list_of_products:
+            self._index_product(product)
+
+    @staticmethod
+    def _catalog_key(product):
+        """
+        Return the key the catalog index uses for the product.
+        """
+        return product.name, product.get_price()
+
+    @staticmethod
+    def _remove_from_bucket(index, key, product):
+        """
+        Remove the product from the list stored under the key of the index.
+        Empty lists are removed from the index.
+        """
+        bucket = index.get(key, [])
+        if product in bucket:
+            bucket.remove(product)
+            if not bucket:
+                del index[key]
+
+    def _index_product(self, product):
+        """
+        Add the product to the catalog indexes.
+        """
+        self._catalog_index.setdefault(self._catalog_key(product), []).append(product)
+        self._product_ids.add(product)
+        self._name_index.setdefault(product.name, []).append(product)
+        self._positions[product] = self._next_position
+        self._next_position += 1
+        if product.is_active():
+            with self._active_lock:
+                self._active_products[product] = self._positions[product]
+                self._active_list = None
+                if self._price_index is not None:
+                    self._price_index.add(self._price_entry(product))
+        if isinstance(product, products.Product):
+            self._count_stock(product, product.get_quantity(), product.get_price())
+        product.add_observer(self)
+        if self._name_search is not None:
+            self._name_search.add(product)
+        self._version += 1
+
+    def _unindex_product(self, product):
+        """
+        Remove the product from the catalog indexes.
+        """
+        product.remove_observer(self)
+        if isinstance(product, products.Product):
+            self._count_stock(product, -product.get_quantity(), product.get_price())
+        self._remove_from_bucket(self._catalog_index, self._catalog_key(product), product)
+        self._product_ids.discard(product)
+        self._product_locks.pop(product, None)
+        self._remove_from_bucket(self._name_index, product.name, product)
+        with self._active_lock:
+            if self._active_products.pop(product, None) is not None:
+                self._active_list = None
+                if self._price_index is not None:
+                    self._price_index.remove(self._price_entry(product))
+        self._positions.pop(product, None)
+        if self._name_search is not None:
+            self._name_search.remove(product)
+        self._version += 1
+
+    def on_product_activity_changed(self, product):
+        """
+        Called by a product of the store when it is activated or deactivated.
+        Calls from different threads may come in any order, so the product is
+        added or removed only if the active set does not already match it.
+        """
+        with self._active_lock:
+            is_listed = product in self._active_products
+            if product.is_active() and not is_listed:
+                self._active_products[product] = self._positions[product]
+                if self._price_index is not None:
+                    self._price_index.add(self._price_entry(product))
+            elif not product.is_active() and is_listed:
+                del self._active_products[product]
+                if self._price_index is not None:
+                    self._price_index.remove(self._price_entry(product))
+            self._active_list = None
+        self._version += 1
+
+    def _count_stock(self, product, quantity_change, price):
+        """
+        Update the stock counters when quantity_change units of the product
+        priced at price are added to the store (negative when removed).
+        """
+        type_name = type(product).__name__
+        with self._counters_lock:
+            self._total_quantity += quantity_change
+            self._quantity_by_type[type_name] = (self._quantity_by_type.get(type_name, 0)
+                                                 + quantity_change)
+            self._stock_value += quantity_change * price
+
+    def on_product_quantity_changed(self, product, old_quantity):
+        """
+        Called by a physical product of the store when its quantity changes.
+        """
+        self._version += 1
+        self._count_stock(product, product.get_quantity() - old_quantity, product.get_price())
+
+    def on_product_price_changed(self, product, old_price):
+        """
+        Called by a product of the store when its price changes.
+        """
+        self._version += 1
+        self._remove_from_bucket(self._catalog_index, (product.name, old_price), product)
+        self._catalog_index.setdefault(self._catalog_key(product), []).append(product)
+        with self._active_lock:
+            if self._price_index is not None and product in self._active_products:
+                self._price_index.remove(self._price_entry(product, old_price))
+                self._price_index.add(self._price_entry(product))
+        if isinstance(product, products.Product):
+            with self._counters_lock:
+                self._stock_value += product.get_quantity() * (product.get_price() - old_price)
+
+    def on_product_promotion_changed(self, product):
+        """
+        Called by a product of the store when its promotion changes.
+        """
+        self._version += 1
+
+    def check_promotion(self, product, promotion):
+        """
+        Called by a product of the store before its promotion is set.
+        Raise an error if the store cannot hold the promotion. Every promotion
+        is accepted here.
+        """
+
+    def _product_lock(self, product):
+        """
+        Return the lock of the product.
+        """
+        lock = self._product_locks.get(product)
+        if lock is None:
+            with self._product_locks_lock:
+                lock = self._product_locks.setdefault(product, threading.Lock())
+        return lock
 
     def add_product(self, new_product):
         """
@@ -24,17 +206,20 @@ class Store:
         :param new_product: instance of products.Product
         :return: None
         """
-        for old_product in self.list_of_products:
-            if (old_product.name_and_price() == new_product.name_and_price()
-                    and isinstance(old_product, products.Product)
+        # Only products sharing the catalog key can match, so look at that bucket only
+        new_name_and_price = new_product.name_and_price()
+        for old_product in self._catalog_index.get(self._catalog_key(new_product), ()):
+            if old_product.name_and_price() != new_name_and_price:
+                continue
+            if (isinstance(old_product, products.Product)
                     and isinstance(new_product, products.Product)):
                 old_product.set_quantity(old_product.get_quantity() + new_product.get_quantity())
                 return
-            if (old_product.name_and_price() == new_product.name_and_price()
-                    and isinstance(old_product, products.ImmaterialProduct)
+            if (isinstance(old_product, products.ImmaterialProduct)
                     and isinstance(new_product, products.ImmaterialProduct)):
                 return
         self.list_of_products.append(new_product)
+        self._index_product(new_product)
 
     def remove_product(self, product):
         """
@@ -42,26 +227,216 @@ class Store:
         :param product: product to remove
         :return: None
         """
-        if product in self.list_of_products:
+        if product in self._product_ids:
             self.list_of_products.remove(product)
+            self._unindex_product(product)
+
+    def find_product(self, name):
+        """
+        Find a product by name.
+        :param name: name of the product
+        :return: The first product added to the store with that name, None if there is none.
+        """
+        same_name = self._name_index.get(name)
+        return same_name[0] if same_name else None
+
+    def _get_name_search(self):
+        """
+        Return the name search indexes, building them on first use.
+        """
+        if self._name_search is None:
+            self._name_search = NameSearch(self.list_of_products)
+        return self._name_search
+
+    def search(self, query, limit=10):
+        """
+        Find active products by the words of their names, ignoring case.
+        Every word of the query must start a word of the name, so
+        "goo pix" finds "Google Pixel 7".
+        :param query: words to look for
+        :param limit: the most products to return, None for all
+        :return: list of products, exact word matches first
+        """
+        return self._get_name_search().search(query, limit, accept=lambda product:
+                                              product.is_active())
+
+    def search_prefix(self, prefix, limit=10):
+        """
+        Find active products whose names start with the prefix, ignoring case.
+        :param prefix: start of the name
+        :param limit: the most products to return, None for all
+        :return: list of products ordered by name
+        """
+        return self._get_name_search().search_prefix(prefix, limit, accept=lambda product:
+                                                     product.is_active())
+
+    def _price_entry(self, product, price=None):
+        """
+        Return the entry of the product in the price index.
+        :param price: price to use instead of the current price of the product
+        """
+        return (product.get_price() if price is None else price,
+                self._positions[product], product)
+
+    def _price_entry_product(self, entry):
+        """
+        Return the product of an entry of the price index.
+        """
+        return entry[2]
+
+    def _get_price_index(self):
+        """
+        Return the price index of the active products, building it on first use.
+        Call with the active lock held, and keep it while reading the index.
+        """
+        if self._price_index is None:
+            self._price_index = PriceIndex(self._price_entry(product)
+                                           for product in self._active_products)
+        return self._price_index
+
+    def get_products_between(self, minimum_price, maximum_price, limit=None):
+        """
+        Return the active products priced from minimum_price to maximum_price.
+        :param minimum_price: lowest price to include
+        :param maximum_price: highest price to include
+        :param limit: the most products to return, None for all
+        :return: list of products, cheapest first. Products with the same
+                 price are in the order they were added.
+        """
+        with self._active_lock:
+            entries = self._get_price_index().between(minimum_price, maximum_price)
+            return [self._price_entry_product(entry) for entry in islice(entries, limit)]
+
+    @staticmethod
+    def _in_stock(product):
+        """
+        Test if an active product can be bought. A physical product can be
+        activated with no stock left.
+        """
+        return not isinstance(product, products.Product) or product.get_quantity() > 0
+
+    def get_cheapest_products(self, count):
+        """
+        Return the cheapest active products which are in stock.
+        :param count: the most products to return
+        :return: list of products, cheapest first
+        """
+        with self._active_lock:
+            found = (self._price_entry_product(entry)
+                     for entry in self._get_price_index().ascending())
+            return list(islice((product for product in found if self._in_stock(product)),
+                               count))
+
+    def get_most_expensive_products(self, count):
+        """
+        Return the most expensive active products.
+        :param count: the most products to return
+        :return: list of products, most expensive first
+        """
+        with self._active_lock:
+            return [self._price_entry_product(entry)
+                    for entry in islice(self._get_price_index().descending(), count)]
+
+    def resolve_shopping_list(self, items):
+        """
+        Turn product names into products.
+        :param items: An iterable of (product name, quantity) pairs
+        :return: If all names are found: (shopping list, "Products found") where the
+                 shopping list is a list of tuples (product, quantity).
+                 If not: (None, Error message)
+        """
+        shopping_list = []
+        for item in items:
+            if not isinstance(item, (list, tuple)) or len(item) != 2:
+                return None, "Items must be (product name, quantity) pairs"
+            name, quantity = item
+            product = self.find_product(name) if isinstance(name, str) else None
+            if product is None:
+                return None, f"Product {name} is not in the store"
+            shopping_list.append((product, quantity))
+        return shopping_list, "Products found"
+
+    def set_bundle_promotions(self, bundle_promotions):
+        """
+        Set the basket promotions applied to the orders of the store.
+        :param bundle_promotions: instance of bundles.BundlePromotions, None for no basket promotions
+        """
+        self._bundle_promotions = bundle_promotions
+        self._version += 1
+
+    def get_bundle_promotions(self):
+        """
+        Return the basket promotions of the store, None if there are none.
+        """
+        return self._bundle_promotions
+
+    def get_order_price(self, shopping_list, line_prices):
+        """
+        Return the price of an order from the prices of its lines, with the
+        basket promotions of the store applied.
+        :param shopping_list: A list of tuples (product, quantity)
+        :param line_prices: the price of each line
+        """
+        if self._bundle_promotions is None:
+            return sum(line_prices)
+        return self._bundle_promotions.get_price(shopping_list, line_prices)
+
+    def _buy_lines(self, shopping_list):
+        """
+        Buy the lines of a shopping list which has been validated.
+        :return: the price of the order
+        """
+        if self._bundle_promotions is None:
+            return sum(product.buy(quantity)[0] for product, quantity in shopping_list)
+        return self._bundle_promotions.get_price(
+            shopping_list, [product.buy(quantity)[0] for product, quantity in shopping_list])
+
+    def get_version(self):
+        """
+        Return a number which changes whenever a product is added to the store,
+        removed from it or changed.
+        """
+        return self._version
 
     def get_total_quantity(self):
         """
-        Return the total quantity of the product in the store.
+        Return the total quantity of the physical products in the store.
         """
-        return sum(product.quantity for product in self.list_of_products)
+        return self._total_quantity
+
+    def get_quantity_by_type(self):
+        """
+        Return the total quantity of the physical products in the store by product class.
+        :return: dict product class name -> quantity
+        """
+        with self._counters_lock:
+            return dict(self._quantity_by_type)
+
+    def get_stock_value(self):
+        """
+        Return the value of the physical products in the store at list price.
+        """
+        return self._stock_value
 
     def get_all_products(self):
         """
         Return a list of all products in the store.
         """
-        return [product for product in self.list_of_products if product.is_active()]
+        # Built under the active lock, so a change made by another thread
+        # cannot drop the cached list while it is built and then be overwritten
+        with self._active_lock:
+            active_list = self._active_list
+            if active_list is None:
+                active_list = [product for product, _ in
+                               sorted(self._active_products.items(), key=lambda item: item[1])]
+                self._active_list = active_list
+            return list(active_list)
 
     def get_product_type_quantity(self):
         """
         Return how many different items are active in the store inventory.
         """
-        return sum(1 for product in self.list_of_products if product.is_active())
+        return len(self._active_products)
 
     @staticmethod
     def validate_shopping_list_format(shopping_list):
@@ -81,7 +456,6 @@ class Store:
                                "List items are not all tuples  of length 2")
             product, quantity = item
             if not isinstance(product, products.ImmaterialProduct) or not isinstance(quantity, int):
-                print(product)
                 return (False, "Shopping list format is wrong. "
                                "Products are not all inherited from ImmaterialProduct")
         return True, "Shopping list format is correct"
@@ -115,11 +489,24 @@ class Store:
 
         # If same product is ordered twice inside the same order, combine them
         unified_shopping_list = self.merge_shopping_list_items(shopping_list)
+        return self.validate_merged_shopping_list(unified_shopping_list)
+
+    def validate_merged_shopping_list(self, unified_shopping_list):
+        """
+        Check that the store can deliver a shopping list which has already
+        been checked for format and merged with merge_shopping_list_items.
+        :param unified_shopping_list: A list of tuples. Each product only once.
+        :return: If valid: True, "No errors"
+                 If not:   False, "Error message"
+        """
+        checks = products.purchase_checks
         for product, quantity in unified_shopping_list:
-            if product not in self.list_of_products:
+            if product not in self:
                 return False, f"Product {product.name} is not in the store"
-            precheck_result, message =  product.precheck_purchase(quantity)
-            if precheck_result is False:
+            check = (checks.get(product.__class__)
+                     or products.compile_purchase_check(product.__class__))
+            message = check(product, quantity)
+            if message is not None:
                 return False, message
         return True, "No errors"
 
@@ -130,22 +517,201 @@ class Store:
         :return if successful: (float/int, str) price of purchase, "Order completed successfully."
         :return if not successful: (None, str) None, Error message
         """
+        if store_metrics.enabled:
+            return self._timed_order(shopping_list)
         validation_result, message = self.validate_shopping_list(shopping_list)
         if validation_result is not True:
             return None, message
-        return (sum(product.buy(quantity)[0] for product, quantity in shopping_list),
-                "Order completed successfully.")
+        return self._buy_lines(shopping_list), "Order completed successfully."
+
+    def order_merged(self, unified_shopping_list, validated_version=None):
+        """
+        Process a shopping list which has already been checked for format and
+        merged, like the items of a Cart. The list is validated again only if
+        the store has changed since it was validated.
+        :param unified_shopping_list: A list of tuples. Each product only once.
+        :param validated_version: get_version() of the store when the list was
+                                  validated, None if it has not been validated.
+        :return: Same as "order"
+        """
+        if validated_version is None or validated_version != self._version:
+            validation_result, message = self.validate_merged_shopping_list(
+                unified_shopping_list)
+            if validation_result is not True:
+                return None, message
+        return self._buy_lines(unified_shopping_list), "Order completed successfully."
+
+    def _timed_order(self, shopping_list):
+        """
+        Same as "order", but records the duration of each stage in store_metrics.
+        """
+        start_time = clock()
+        validation_result, message = self.validate_shopping_list_format(shopping_list)
+        merge_start_time = clock()
+        store_metrics.record(VALIDATE, merge_start_time - start_time)
+        if validation_result is False:
+            store_metrics.count("rejected")
+            return None, message
+        unified_shopping_list = self.merge_shopping_list_items(shopping_list)
+        precheck_start_time = clock()
+        store_metrics.record(MERGE, precheck_start_time - merge_start_time)
+        validation_result, message = self.validate_merged_shopping_list(unified_shopping_list)
+        buy_start_time = clock()
+        store_metrics.record(PRECHECK, buy_start_time - precheck_start_time)
+        if validation_result is False:
+            store_metrics.count("rejected")
+            return None, message
+        price = self._buy_lines(shopping_list)
+        store_metrics.record(BUY, clock() - buy_start_time)
+        store_metrics.count("completed")
+        return price, "Order completed successfully."
+
+    def order_many(self, shopping_lists):
+        """
+        Process many shopping lists. The result is the same as calling "order"
+        for each shopping list in turn: earlier shopping lists get the stock first.
+        The demand of all the shopping lists is summed per product first.
+        Products with enough stock for the whole batch get their stock reduced
+        once, at the end. Products which may run out get their stock reduced
+        before each shopping list which needs them is checked, so it is
+        checked against what is left. If an exception is raised, the stock
+        taken so far is given back and the exception is raised again.
+        :param shopping_lists: An iterable of shopping lists.
+        :return: A list with the result of each shopping list in input order.
+                 A result is (float/int, "Order completed successfully.") or
+                 (None, Error message) like the result of "order".
+        """
+        shopping_lists = list(shopping_lists)
+        # Upper bound of the demand: lines which turn out to be invalid are counted too
+        demand = {}
+        for shopping_list in shopping_lists:
+            for item in shopping_list:
+                if isinstance(item, tuple) and len(item) == 2:
+                    product, quantity = item
+                    if (isinstance(product, products.Product) and isinstance(quantity, int)
+                            and quantity > 0):
+                        demand[product] = demand.get(product, 0) + quantity
+        may_run_out = {product for product, quantity in demand.items()
+                       if quantity > product.get_quantity()}
+        # product -> stock taken by accepted shopping lists, not yet reduced
+        taken = {}
+        # product -> stock already reduced, given back if an exception is raised
+        reduced = {}
+        results = []
+        try:
+            for shopping_list in shopping_lists:
+                validation_result, message = self.validate_shopping_list_format(shopping_list)
+                if validation_result is False:
+                    results.append((None, message))
+                    continue
+                unified_shopping_list = self.merge_shopping_list_items(shopping_list)
+                for product, _ in unified_shopping_list:
+                    if product in may_run_out and product in taken:
+                        self._reduce_stock(product, taken.pop(product), reduced)
+                validation_result, message = self.validate_merged_shopping_list(
+                    unified_shopping_list)
+                if validation_result is False:
+                    results.append((None, message))
+                    continue
+                # Promotions are applied line by line, just like "order" does
+                price = self.get_order_price(shopping_list,
+                                             [product.name_and_price(quantity)[1]
+                                              for product, quantity in shopping_list])
+                for product, quantity in unified_shopping_list:
+                    if isinstance(product, products.Product):
+                        taken[product] = taken.get(product, 0) + quantity
+                results.append((price, "Order completed successfully."))
+            for product, quantity in taken.items():
+                self._reduce_stock(product, quantity, reduced)
+        except BaseException:
+            for product, quantity in reduced.items():
+                product.set_quantity(product.get_quantity() + quantity)
+            raise
+        return results
+
+    @staticmethod
+    def _reduce_stock(product, quantity, reduced):
+        """
+        Take quantity pieces of a physical product and add them to reduced.
+        """
+        product.set_quantity(product.get_quantity() - quantity)
+        reduced[product] = reduced.get(product, 0) + quantity
+
+    def safe_order(self, shopping_list):
+        """
+        Same as "order" but safe to call from many threads at the same time.
+        The products of the order are locked for the duration of the stock check
+        and the purchase, so stock is never oversold and an order is applied
+        fully or not at all. Locks are always taken in the same order to avoid
+        deadlocks. Orders of different products do not wait for each other.
+        :param shopping_list: A list of tuples. Each tuple == (Product instance, quantity)
+        :return: Same as "order"
+        """
+        validation_result, message = self.validate_shopping_list_format(shopping_list)
+        if validation_result is False:
+            return None, message
+        unified_shopping_list = self.merge_shopping_list_items(shopping_list)
+        # Products which are not in the store fail validation, they need no lock
+        locks = [self._product_lock(product)
+                 for product in sorted((product for product, _ in unified_shopping_list
+                                        if product in self), key=id)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            validation_result, message = self.validate_merged_shopping_list(
+                unified_shopping_list)
+            if validation_result is False:
+                return None, message
+            return self._buy_lines(shopping_list), "Order completed successfully."
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def order_in_parallel(self, shopping_lists, max_workers=None):
+        """
+        Process many shopping lists with safe_order on a thread pool.
+        :param shopping_lists: An iterable of shopping lists.
+        :param max_workers: Number of threads. Default is decided by ThreadPoolExecutor.
+        :return: A list with the result of each shopping list in input order.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.safe_order, shopping_lists))
 
     def __contains__(self, item):
-        return item in self.list_of_products
+        return item in self._product_ids
 
     def __add__(self, other):
-        new_store = Store([])
-        for product in self.list_of_products:
-            new_store.add_product(product)
-        for product in other.list_of_products:
-            new_store.add_product(product)
-        return new_store
+        return Store.merge_stores(self, other)
+
+    @staticmethod
+    def merge_stores(*stores):
+        """
+        Merge the products of many stores into a new store. The result is the
+        same as adding the products of each store in turn with add_product:
+        quantities of equal physical products are added to the first one and
+        other duplicates are dropped. Products are grouped by their catalog
+        key in one pass, and the new store is indexed once at the end.
+        :param stores: instances of the class Store
+        :return: A new instance of the class Store
+        """
+        merged_products = []
+        # catalog key -> [(name_and_price, product)] of the products kept so far
+        kept_products = {}
+        for store in stores:
+            for product in store.list_of_products:
+                name_and_price = product.name_and_price()
+                bucket = kept_products.setdefault(Store._catalog_key(product), [])
+                for old_name_and_price, old_product in bucket:
+                    if old_name_and_price == name_and_price:
+                        if (isinstance(old_product, products.Product)
+                                and isinstance(product, products.Product)):
+                            old_product.set_quantity(old_product.get_quantity()
+                                                     + product.get_quantity())
+                        break
+                else:
+                    bucket.append((name_and_price, product))
+                    merged_products.append(product)
+        return Store(merged_products)
 
 def main():
     """
@@ -0,0 +1,93 @@
+import pytest
+from bundles import BundlePromotions, BuyAndGet, MixAndMatch, OrderDiscount
+from cart import Cart
+from products import ImmaterialProduct, Product, pricing_mode
+from store import Store
+
+
+def setup_store(*bundle_promotions):
+    store = Store([Product("MacBook Air M2", price=1450, quantity=100),
+                   Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                   Product("Google Pixel 7", price=500, quantity=250),
+                   ImmaterialProduct("Windows License", price=125),
+                   ImmaterialProduct("XYZ Service Contract", price=400)])
+    store.set_bundle_promotions(BundlePromotions(bundle_promotions))
+    return store, store.get_all_products()
+
+
+def test_buy_and_get():
+    store, (mac, bose, pixel, windows, service) = setup_store(
+        BuyAndGet("Mac and earbuds", buy_names=["MacBook Air M2"],
+                  get_names=["Bose QuietComfort Earbuds"], percent=20))
+    assert store.order([(mac, 1), (bose, 2)])[0] == pytest.approx(1900)
+    assert store.order([(bose, 2)])[0] == 500
+    assert store.order([(mac, 2), (pixel, 1), (bose, 1), (bose, 2)])[0] == pytest.approx(4050)
+
+
+def test_buy_and_get_in_one_group():
+    store, (mac, bose, pixel, windows, service) = setup_store(
+        BuyAndGet("Buy two get one free", buy_names=["Google Pixel 7", "XYZ Service Contract"],
+                  get_names=["Google Pixel 7", "XYZ Service Contract"], percent=100,
+                  buy_quantity=2))
+    assert store.order([(pixel, 3)])[0] == pytest.approx(1000)
+    # The two most expensive units are free, four units are left to buy
+    assert store.order([(pixel, 3), (service, 3)])[0] == pytest.approx(1700)
+
+
+def test_mix_and_match():
+    store, (mac, bose, pixel, windows, service) = setup_store(
+        MixAndMatch("Any three for 900", names=["Google Pixel 7", "Windows License",
+                                                "XYZ Service Contract"], quantity=3, price=900))
+    assert store.order([(pixel, 2), (windows, 2), (service, 1)])[0] == pytest.approx(1150)
+    assert store.order([(pixel, 7)])[0] == pytest.approx(2 * 900 + 500)
+    # Three licenses cost less than 900 already
+    assert store.order([(windows, 3)])[0] == 375
+
+
+def test_priority_decides_which_deal_gets_the_units():
+    mix = MixAndMatch("Pixel pair", names=["Google Pixel 7"], quantity=2, price=800)
+    gift = BuyAndGet("Pixel with a mac", buy_names=["MacBook Air M2"],
+                     get_names=["Google Pixel 7"], percent=50, priority=1)
+    store, (mac, bose, pixel, windows, service) = setup_store(mix, gift)
+    assert store.order([(mac, 1), (pixel, 2)])[0] == pytest.approx(1450 + 250 + 500)
+    store.get_bundle_promotions().remove(gift)
+    assert store.order([(mac, 1), (pixel, 2)])[0] == pytest.approx(1450 + 800)
+
+
+def test_order_discount_uses_the_best_tier():
+    store, (mac, bose, pixel, windows, service) = setup_store(
+        OrderDiscount("50 off", minimum_total=1000, amount=50),
+        OrderDiscount("10% off", minimum_total=2000, percent=10))
+    assert store.order([(mac, 2)])[0] == pytest.approx(2610)
+    assert store.order([(mac, 1)])[0] == 1400
+    assert store.order([(bose, 1)])[0] == 250
+
+
+def test_exact_pricing_rounds_the_order_once():
+    store, (mac, bose, pixel, windows, service) = setup_store(
+        BuyAndGet("Mac and earbuds", buy_names=["MacBook Air M2"],
+                  get_names=["Bose QuietComfort Earbuds"], percent=15))
+    pricing_mode.use_exact()
+    try:
+        assert store.order([(mac, 1), (bose, 1)])[0] == 1662
+    finally:
+        pricing_mode.use_float()
+
+
+def test_cart_and_order_many_use_basket_promotions():
+    store, (mac, bose, pixel, windows, service) = setup_store(
+        BuyAndGet("Mac and earbuds", buy_names=["MacBook Air M2"],
+                  get_names=["Bose QuietComfort Earbuds"], percent=20))
+    cart = Cart(store)
+    cart.add(mac, 1)
+    cart.add(bose, 2)
+    assert cart.get_total_price() == pytest.approx(1900)
+    assert store.order_many([[(mac, 1), (bose, 2)]])[0][0] == pytest.approx(1900)
+    assert cart.order()[0] == pytest.approx(1900)
+
+
+def test_wrong_arguments():
+    with pytest.raises(TypeError):
+        BundlePromotions([object()])
+    with pytest.raises(ValueError):
+        MixAndMatch("Nothing", names=["Google Pixel 7"], quantity=0, price=0)
@@ -0,0 +1,141 @@
+from datetime import datetime
+
+import products
+import promotions
+from cart import Cart
+from promotion_rules import PromotionRules
+from store import Store
+
+
+def setup_store():
+    product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
+                    products.Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    products.ImmaterialProduct("Windows License", price=125),
+                    products.LimitedImmaterialProduct("Shipping", price=10, maximum=1),
+                    ]
+    product_list[0].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    return Store(product_list)
+
+
+def test_add_merges_lines_and_keeps_total():
+    best_buy = setup_store()
+    mac, bose, windows, shipping = best_buy.list_of_products
+    cart = Cart(best_buy)
+    assert cart.add(mac, 1) == (True, "No errors")
+    assert cart.add(bose, 3) == (True, "No errors")
+    assert cart.add(mac, 1) == (True, "No errors")
+    assert cart.items() == [(mac, 2), (bose, 3)]
+    assert cart.get_total_price() == 2175 + 750
+    assert cart.get_total_price() == sum(price for _, price in
+                                         (product.name_and_price(quantity)
+                                          for product, quantity in cart.items()))
+
+
+def test_add_checks_the_merged_line():
+    best_buy = setup_store()
+    mac, bose, windows, shipping = best_buy.list_of_products
+    cart = Cart(best_buy)
+    assert cart.add(shipping, 1)[0] is True
+    assert cart.add(shipping, 1) == (False, "Shipping is a limited product. "
+                                            "Only 1 allowed in one purchase")
+    assert cart.add(mac, 101) == (False, "there are only 100 pieces of MacBook Air M2. "
+                                         "Cannot sell 101")
+    assert cart.add(mac, "1")[0] is False
+    assert cart.add(products.Product("Other", price=1, quantity=1), 1) == (
+        False, "Product Other is not in the store")
+    assert cart.items() == [(shipping, 1)]
+    assert cart.get_total_price() == 10
+
+
+def test_remove():
+    best_buy = setup_store()
+    mac, bose, windows, shipping = best_buy.list_of_products
+    cart = Cart(best_buy)
+    cart.add(mac, 3)
+    cart.add(windows, 2)
+    assert cart.remove(mac, 1) == (True, "No errors")
+    assert cart.items() == [(mac, 2), (windows, 2)]
+    assert cart.remove(mac, 0) == (False, "impossible quantity given")
+    assert cart.remove(windows) == (True, "No errors")
+    assert cart.remove(windows) == (False, "Product Windows License is not in the cart")
+    assert cart.get_total_price() == 2175
+    assert cart.remove(mac, 5) == (True, "No errors")
+    assert len(cart) == 0
+    assert cart.get_total_price() == 0
+
+
+def test_order_skips_validation_when_store_is_unchanged(monkeypatch):
+    best_buy = setup_store()
+    mac, bose, windows, shipping = best_buy.list_of_products
+    cart = Cart(best_buy)
+    cart.add(mac, 2)
+    cart.add(bose, 3)
+    total = cart.get_total_price()
+
+    def validate(_):
+        raise AssertionError("validated again")
+    monkeypatch.setattr(best_buy, "validate_merged_shopping_list", validate)
+    assert cart.order() == (total, "Order completed successfully.")
+    assert len(cart) == 0
+    assert mac.get_quantity() == 98
+
+
+def test_order_validates_when_store_has_changed():
+    best_buy = setup_store()
+    mac, bose, windows, shipping = best_buy.list_of_products
+    cart = Cart(best_buy)
+    other_cart = Cart(best_buy)
+    cart.add(bose, 300)
+    cart.add(shipping, 1)
+    assert other_cart.add(bose, 300)[0] is True
+    assert other_cart.order()[0] is not None
+    assert cart.order() == (None, "there are only 200 pieces of Bose QuietComfort Earbuds. "
+                                  "Cannot sell 300")
+    assert bose.get_quantity() == 200
+    assert cart.items() == [(bose, 300), (shipping, 1)]
+    bose.set_price(100)
+    assert cart.get_total_price() == 30010
+
+
+def test_total_follows_promotions_and_pricing_mode():
+    best_buy = setup_store()
+    mac, bose, _, _ = best_buy.list_of_products
+    cart = Cart(best_buy)
+    cart.add(bose, 3)
+    assert cart.get_total_price() == 750
+    bose.set_promotion(promotions.ThirdOneFree("Third One Free!"))
+    assert cart.get_total_price() == 500
+    cart.add(mac, 1)
+    mac.set_price(999)
+    products.pricing_mode.use_exact()
+    try:
+        assert cart.get_total_price() == 1499
+        assert isinstance(cart.get_total_price(), int)
+    finally:
+        products.pricing_mode.use_float()
+    assert isinstance(cart.get_total_price(), float)
+
+
+def test_total_follows_promotion_rule_changes():
+    class Clock:
+        moment = datetime(2026, 3, 1)
+
+        def __call__(self):
+            return self.moment
+
+    best_buy = setup_store()
+    bose = best_buy.list_of_products[1]
+    clock = Clock()
+    rules = PromotionRules("Sale", clock=clock)
+    bose.set_promotion(rules)
+    cart = Cart(best_buy)
+    cart.add(bose, 1)
+    assert cart.get_total_price() == 250
+    rules.add_rule(promotions.PercentDiscount("50% off", percent=50))
+    assert cart.get_total_price() == 125
+    rules.add_rule(promotions.PercentDiscount("20% off", percent=20),
+                   start=datetime(2026, 3, 10))
+    assert cart.get_total_price() == 125
+    clock.moment = datetime(2026, 3, 10)
+    assert cart.get_total_price() == 100
+    assert cart.order() == (100, "Order completed successfully.")
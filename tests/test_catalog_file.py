@@ -0,0 +1,44 @@
+import pytest
+import main
+import products
+from catalog_file import CatalogFormatError, open_catalog, write_catalog
+
+
+def test_write_and_open(tmp_path):
+    best_buy = main.setup_store()
+    best_buy.get_all_products()[2].deactivate()
+    write_catalog(tmp_path / "catalog.bin", best_buy.list_of_products)
+    mapped = open_catalog(tmp_path / "catalog.bin")
+    assert ([str(product) for product in mapped.list_of_products] ==
+            [str(product) for product in best_buy.list_of_products])
+    assert mapped.get_product_type_quantity() == 6
+    assert mapped.get_total_quantity() == 950
+    assert mapped.find_product("Windows License").name_and_price(2) == ("Windows License", 175.0)
+
+
+def test_change_and_add_to_mapped_store(tmp_path):
+    write_catalog(tmp_path / "catalog.bin", main.setup_store().list_of_products)
+    mapped = open_catalog(tmp_path / "catalog.bin")
+    mac, bose = mapped.get_all_products()[:2]
+    assert mapped.order([(mac, 100), (bose, 3)]) == (1450 * 75 + 500, "Order completed successfully.")
+    mapped.add_product(products.Product("Dell 1001", price=1000, quantity=10))
+    mapped.add_product(products.Product("Bose QuietComfort Earbuds", price=250, quantity=3))
+    assert mapped.get_total_quantity() == 850 + 10
+    assert str(mapped.get_all_products()[0]) == \
+        "Bose QuietComfort Earbuds, Price: $250, Quantity: 500, Promotion: Third One Free!"
+    assert mapped.find_product("Dell 1001").get_quantity() == 10
+    assert open_catalog(tmp_path / "catalog.bin").get_total_quantity() == 950
+
+
+def test_not_a_catalog(tmp_path):
+    (tmp_path / "catalog.bin").write_bytes(b"Not a catalog at all")
+    with pytest.raises(CatalogFormatError):
+        open_catalog(tmp_path / "catalog.bin")
+
+
+def test_truncated_catalog(tmp_path):
+    write_catalog(tmp_path / "catalog.bin", main.setup_store().list_of_products)
+    data = (tmp_path / "catalog.bin").read_bytes()
+    (tmp_path / "catalog.bin").write_bytes(data[:-10])
+    with pytest.raises(CatalogFormatError, match="wrong size"):
+        open_catalog(tmp_path / "catalog.bin")
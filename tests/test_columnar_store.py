@@ -0,0 +1,132 @@
+import pytest
+import products
+import promotions
+from columnar_store import ColumnarStore
+from store import Store
+
+
+class TestColumnarStore:
+    def setup(self):
+        product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
+                        products.Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                        products.Product("Google Pixel 7", price=500, quantity=250),
+                        products.ImmaterialProduct("Windows License", price=125),
+                        products.ImmaterialProduct("XYZ Service Contract", price=400),
+                        products.LimitedImmaterialProduct("Shipping", price=10, maximum=1),
+                        products.LimitedProduct("Rare coffee", price=100, maximum=1, quantity=100),
+                        ]
+        product_list[0].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+        return ColumnarStore(product_list)
+
+    def test_views_behave_like_products(self):
+        store = self.setup()
+        all_products = store.get_all_products()
+        assert (str(all_products[0]) ==
+                "MacBook Air M2, Price: $1450, Quantity: 100, Promotion: Second Half price!")
+        assert (str(all_products[5]) ==
+                "Shipping, Price: $10  Limited to 1 per order!, Promotion: None")
+        assert (str(all_products[6]) ==
+                "Rare coffee, Price: $100, Quantity: 100, Limited to 1 per order!, Promotion: None")
+        assert isinstance(all_products[6], products.LimitedProduct)
+        assert all_products[0] == store.get_all_products()[0]
+        assert hash(all_products[0]) == hash(store.find_product("MacBook Air M2"))
+        assert all_products[0] != all_products[1]
+
+    def test_totals(self):
+        store = self.setup()
+        assert store.get_total_quantity() == 950
+        assert store.get_product_type_quantity() == 7
+        assert store.get_quantity_by_type() == {"Product": 850, "LimitedProduct": 100}
+        assert store.get_stock_value() == 145000 + 125000 + 125000 + 10000
+
+    def test_order(self):
+        store = self.setup()
+        all_products = store.get_all_products()
+        assert (store.order([(all_products[0], 100), (all_products[5], 1)]) ==
+                (1450 * 75 + 10, "Order completed successfully."))
+        assert all_products[0].get_quantity() == 0
+        assert not all_products[0].is_active()
+        assert store.get_product_type_quantity() == 6
+        assert store.order([(all_products[6], 2)]) == (
+            None, "Rare coffee is a limited product. Only 1 allowed in one purchase")
+
+    def test_add_and_remove_product(self):
+        store = self.setup()
+        store.add_product(products.Product("Google Pixel 7", price=500, quantity=10))
+        store.add_product(products.ImmaterialProduct("Windows License", price=125))
+        assert store.get_product_type_quantity() == 7
+        assert store.get_all_products()[2].get_quantity() == 260
+        pixel = store.get_all_products()[2]
+        store.remove_product(pixel)
+        assert pixel not in store
+        assert store.get_total_quantity() == 700
+        assert products.Product("Something", price=1, quantity=1) not in store
+
+    def test_restock(self):
+        store = self.setup()
+        mac = store.get_all_products()[0]
+        store.order([(mac, 100)])
+        store.restock([(mac, 5)])
+        assert mac.get_quantity() == 5
+        assert mac.is_active()
+
+    def test_restock_checks_all_items_first(self):
+        store = self.setup()
+        mac, bose, pixel, windows, service, shipping, coffee = store.get_all_products()
+        version = store.get_version()
+        with pytest.raises(ValueError):
+            store.restock([(mac, 5), (service, 1)])
+        with pytest.raises(ValueError):
+            store.restock([(mac, 5), (bose, -20)])
+        with pytest.raises(TypeError):
+            store.restock([(mac, 5), (bose, True)])
+        assert mac.get_quantity() == 100
+        assert bose.get_quantity() == 500
+        assert store.get_version() == version
+        store.restock([(mac, 5), (bose, 1)])
+        assert store.get_total_quantity() == 956
+        assert store.get_quantity_by_type() == {"Product": 856, "LimitedProduct": 100}
+        assert store.get_stock_value() == 405000 + 1450 * 5 + 250
+        assert store.get_version() != version
+
+    def test_adding_stores(self):
+        store = self.setup() + self.setup()
+        assert store.get_total_quantity() == 1900
+        assert store.get_product_type_quantity() == 7
+
+    def test_price_change_keeps_row_index(self):
+        store = self.setup()
+        pixel = store.find_product("Google Pixel 7")
+        pixel.set_price(450)
+        store.add_product(products.Product("Google Pixel 7", price=450, quantity=10))
+        assert pixel.get_quantity() == 260
+        assert store.get_product_type_quantity() == 7
+
+    def test_price_queries(self):
+        store = self.setup()
+        mac, bose, pixel, windows, service, shipping, coffee = store.get_all_products()
+        assert store.get_cheapest_products(3) == [shipping, coffee, windows]
+        store.order([(coffee, 1)])
+        coffee.set_quantity(0)
+        pixel.set_price(90)
+        store.remove_product(shipping)
+        assert store.get_cheapest_products(3) == [pixel, windows, bose]
+        store.restock([(coffee, 3)])
+        store.order([(bose, 500)])
+        store.add_product(products.Product("Cheap cable", price=5, quantity=1))
+        assert [product.name for product in store.get_products_between(0, 250)] == [
+            "Cheap cable", "Google Pixel 7", "Rare coffee", "Windows License"]
+        assert store.get_most_expensive_products(1) == [mac]
+
+    def test_views_in_a_store(self):
+        columnar_store = self.setup()
+        store = Store([]) + columnar_store
+        mac = store.get_all_products()[0]
+        store.order([(mac, 100)])
+        assert store.get_product_type_quantity() == 6
+        assert store.get_total_quantity() == 850
+        # A new view of the row still tells the other store about changes
+        columnar_store.restock([(columnar_store.find_product("MacBook Air M2"), 5)])
+        columnar_store.find_product("MacBook Air M2").set_quantity(7)
+        assert store.get_product_type_quantity() == 7
+        assert store.get_total_quantity() == 857
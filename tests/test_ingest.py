@@ -0,0 +1,45 @@
+import io
+import json
+import main
+from ingest import ingest
+
+
+def test_ingest():
+    store = main.setup_store()
+    lines = [{"id": "A-1", "items": [["MacBook Air M2", 2], ["Shipping", 1]]},
+             {"items": [["Shipping", 2]]},
+             {"id": "A-3", "items": [["Nothing", 1]]},
+             {"id": "A-4", "items": [["Rare coffee", "1"]]},
+             {"id": "A-5", "items": "MacBook"},
+             {"id": "A-6", "items": [["MacBook Air M2", 99]]}]
+    input_stream = io.StringIO("\n".join(json.dumps(line) for line in lines)
+                               + "\n\nnot json\n")
+    output_stream = io.StringIO()
+    assert ingest(store, input_stream, output_stream, batch_size=2) == (1, 6)
+    results = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+    assert results == [
+        {"id": "A-1", "price": 2185.0, "message": "Order completed successfully."},
+        {"id": 2, "price": None,
+         "message": "Shipping is a limited product. Only 1 allowed in one purchase"},
+        {"id": "A-3", "price": None, "message": "Product Nothing is not in the store"},
+        {"id": "A-4", "price": None, "message": "Shopping list format is wrong. "
+                                                "Products are not all inherited from ImmaterialProduct"},
+        {"id": 5, "price": None, "message": "Order must be a JSON object with a list of items"},
+        {"id": "A-6", "price": None,
+         "message": "there are only 98 pieces of MacBook Air M2. Cannot sell 99"},
+        {"id": 8, "price": None, "message": "Order is not valid JSON"}]
+
+
+def test_failing_order_is_rejected():
+    store = main.setup_store()
+    lines = [{"id": "A-1", "items": [["Google Pixel 7", 1]]},
+             {"id": "A-2", "items": [["Windows License", 10 ** 400]]},
+             {"id": "A-3", "items": [["Google Pixel 7", 2]]}]
+    input_stream = io.StringIO("\n".join(json.dumps(line) for line in lines))
+    output_stream = io.StringIO()
+    assert ingest(store, input_stream, output_stream) == (2, 1)
+    results = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+    assert [result["id"] for result in results] == ["A-1", "A-2", "A-3"]
+    assert results[1]["price"] is None
+    assert results[1]["message"].startswith("Order failed")
+    assert store.find_product("Google Pixel 7").get_quantity() == 247
@@ -0,0 +1,46 @@
+import io
+import main
+from instrumentation import Histogram, Metrics, store_metrics
+
+
+def test_histogram():
+    histogram = Histogram()
+    for duration in (1, 3, 100, 1000, 5000):
+        histogram.record(duration)
+    summary = histogram.summary()
+    assert summary["count"] == 5
+    assert summary["total_ns"] == 6104
+    assert (summary["min_ns"], summary["max_ns"]) == (1, 5000)
+    assert summary["p50_ns"] == 127
+    assert summary["p99_ns"] == 5000
+
+
+def test_order_stages_are_recorded():
+    store = main.setup_store()
+    all_products = store.get_all_products()
+    store_metrics.reset()
+    store.order([(all_products[0], 1)])
+    assert store_metrics.summary() == {"stages": {}, "counters": {}}
+    store_metrics.enable()
+    try:
+        assert store.order([(all_products[0], 2), (all_products[1], 3)]) == (
+            2175.0 + 500, "Order completed successfully.")
+        assert store.order([(all_products[5], 2)])[0] is None
+        assert store.order(["wrong"])[0] is None
+    finally:
+        store_metrics.disable()
+    summary = store_metrics.summary()
+    counts = {stage: stage_summary["count"] for stage, stage_summary in summary["stages"].items()}
+    assert counts == {"validate": 3, "merge": 2, "precheck": 2, "buy": 1, "promotion": 2}
+    assert summary["counters"] == {"completed": 1, "rejected": 2}
+    output = io.StringIO()
+    store_metrics.dump(output)
+    assert "precheck" in output.getvalue()
+    store_metrics.reset()
+
+
+def test_metrics_count():
+    metrics = Metrics()
+    metrics.count("orders", 3)
+    metrics.count("orders")
+    assert metrics.summary()["counters"] == {"orders": 4}
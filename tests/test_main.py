@@ -1,5 +1,6 @@
 import pytest
 import main
+from cart import Cart
 from unittest.mock import patch
 
 def test_setup_store():
@@ -15,7 +16,7 @@ def test_get_order(monkeypatch, capfd):
     store = main.setup_store()
     inputs_to_get_order = iter(['7', '1', '6', '1', '5', '100', '\n'])
     monkeypatch.setattr('builtins.input', lambda _: next(inputs_to_get_order))
-    shopping_list = main.get_order(store)
+    shopping_list = main.get_order(store).items()
     assert (str(shopping_list[0][0]) ==
             "Rare coffee, Price: $100, Quantity: 100, Limited to 1 per order!, Promotion: None")
     assert (str(shopping_list[1][0]) ==
@@ -37,17 +38,25 @@ def test_get_order_limited_too_many(monkeypatch, capfd):
 def test_make_an_order(monkeypatch, capfd):
     store = main.setup_store()
     products_all = store.get_all_products()
-    order = [(products_all[0], 100), (products_all[1], 200), (products_all[5], 1)]
-    monkeypatch.setattr('main.get_order', lambda _: order)
+    cart = Cart(store)
+    for product, quantity in [(products_all[0], 100), (products_all[1], 200),
+                              (products_all[5], 1)]:
+        cart.add(product, quantity)
+    monkeypatch.setattr('main.get_order', lambda _: cart)
     main.make_an_order(store)
     captured = capfd.readouterr()
     assert "Total payment: $142260" in captured.out
+    assert len(cart) == 0
 
 def test_make_an_invalid_order(monkeypatch, capfd):
     store = main.setup_store()
     products_all = store.get_all_products()
-    order = [(products_all[0], 100), (products_all[1], 200), (products_all[5], 2)]
-    monkeypatch.setattr('main.get_order', lambda _: order)
+    cart = Cart(store)
+    cart.add(products_all[0], 100)
+    cart.add(products_all[5], 1)
+    # The store changes after the cart was checked
+    store.order([(products_all[0], 1)])
+    monkeypatch.setattr('main.get_order', lambda _: cart)
     main.make_an_order(store)
     captured = capfd.readouterr()
-    assert "Shipping is a limited product" in captured.out
\ No newline at end of file
+    assert "there are only 99 pieces of MacBook Air M2" in captured.out
\ No newline at end of file
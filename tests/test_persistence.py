@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+import products
+import promotions
+from cart import Cart
+from persistence import PersistentStore
+from promotion_rules import PromotionRules
+
+
+def product_list():
+    product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
+                    products.Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    products.ImmaterialProduct("Windows License", price=125),
+                    products.LimitedImmaterialProduct("Shipping", price=10, maximum=1),
+                    products.LimitedProduct("Rare coffee", price=100, maximum=3, quantity=100),
+                    ]
+    product_list[0].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    product_list[2].set_promotion(promotions.PercentDiscount("30% off!", percent=30))
+    return product_list
+
+
+def descriptions(store):
+    return [str(product) for product in store.list_of_products]
+
+
+def make_changes(store):
+    mac, bose, _, shipping, coffee = store.list_of_products
+    assert store.order([(mac, 10), (shipping, 1), (mac, 5)])[0] is not None
+    assert store.order([(coffee, 2)])[0] is None
+    store.order_many([[(bose, 500)], [(bose, 1)]])
+    store.restock(bose, 20)
+    store.add_product(products.Product("MacBook Air M2", price=1450, quantity=5))
+    store.add_product(products.Product("Google Pixel 7", price=500, quantity=250))
+    store.remove_product(shipping)
+    store.safe_order([(store.find_product("Google Pixel 7"), 50)])
+
+
+def test_recover_from_log(tmp_path):
+    store = PersistentStore(tmp_path, product_list(), group_commit_size=3)
+    make_changes(store)
+    store.close()
+    recovered = PersistentStore(tmp_path)
+    assert descriptions(recovered) == descriptions(store)
+    assert recovered.get_total_quantity() == store.get_total_quantity() == 90 + 20 + 100 + 200
+    recovered.order([(recovered.find_product("Google Pixel 7"), 1)])
+    recovered.close()
+    assert PersistentStore(tmp_path).find_product("Google Pixel 7").get_quantity() == 199
+
+
+def test_recover_from_snapshot(tmp_path):
+    store = PersistentStore(tmp_path, product_list(), snapshot_interval=4)
+    make_changes(store)
+    store.close()
+    assert len(list(tmp_path.glob("wal-*.log"))) == 1
+    assert descriptions(PersistentStore(tmp_path)) == descriptions(store)
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    store = PersistentStore(tmp_path, product_list(), group_commit_size=1)
+    mac = store.list_of_products[0]
+    store.order([(mac, 10)])
+    store.close()
+    with open(tmp_path / "wal-0.log", "a", encoding="utf-8") as log_file:
+        log_file.write('o 0 1')
+    recovered = PersistentStore(tmp_path)
+    assert recovered.list_of_products[0].get_quantity() == 90
+    recovered.order([(recovered.list_of_products[0], 10)])
+    recovered.close()
+    assert PersistentStore(tmp_path).list_of_products[0].get_quantity() == 80
+
+
+def test_cart_orders_are_logged(tmp_path):
+    store = PersistentStore(tmp_path, [products.Product("Google Pixel 7", price=500,
+                                                        quantity=100)])
+    pixel = store.list_of_products[0]
+    cart = Cart(store)
+    cart.add(pixel, 5)
+    assert cart.order()[0] is not None
+    store.order([(pixel, 3)])
+    store.close()
+    assert PersistentStore(tmp_path).list_of_products[0].get_quantity() == 92
+
+
+def test_promotions_which_cannot_be_saved_are_refused(tmp_path):
+    store = PersistentStore(tmp_path, product_list())
+    mac = store.list_of_products[0]
+    with pytest.raises(TypeError):
+        mac.set_promotion(PromotionRules("Sale"))
+    assert str(mac._promotion) == "Second Half price!"
+    pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    pixel.set_promotion(PromotionRules("Sale"))
+    with pytest.raises(TypeError):
+        store.add_product(pixel)
+    assert pixel not in store
+    store.snapshot()
+    store.close()
+    assert descriptions(PersistentStore(tmp_path)) == descriptions(store)
+
+
+def test_changes_are_flushed_after_flush_interval(tmp_path):
+    store = PersistentStore(tmp_path, product_list(), flush_interval=0.01)
+    store.order([(store.list_of_products[0], 10)])
+    deadline = time.monotonic() + 5
+    while not (tmp_path / "wal-0.log").read_text(encoding="utf-8"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert (tmp_path / "wal-0.log").read_text(encoding="utf-8") == "o 0 10\n"
+    store.close()
+
+
+def test_snapshot_waits_for_changes(tmp_path):
+    store = PersistentStore(tmp_path, product_list(), flush_interval=None)
+    with store._gate.change():
+        snapshot = threading.Thread(target=store.snapshot)
+        snapshot.start()
+        snapshot.join(0.1)
+        assert snapshot.is_alive()
+    snapshot.join()
+    assert store._generation == 1
+    store.close()
+
+
+def test_quantities_are_logged_as_integers(tmp_path):
+    store = PersistentStore(tmp_path, product_list())
+    mac, bose = store.list_of_products[:2]
+    assert store.order([(mac, True)])[0] is not None
+    for quantity in (1.5, True, 0, -3):
+        with pytest.raises((TypeError, ValueError)):
+            store.restock(bose, quantity)
+    store.close()
+    recovered = PersistentStore(tmp_path)
+    assert recovered.list_of_products[0].get_quantity() == 99
+    assert recovered.list_of_products[1].get_quantity() == 500
+    recovered.close()
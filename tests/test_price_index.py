@@ -0,0 +1,47 @@
+import random
+
+import price_index
+from price_index import PriceIndex
+
+
+def test_price_index_queries():
+    index = PriceIndex([(300, 0, "c"), (100, 1, "a"), (200, 2, "b"), (100, 3, "a2")])
+    assert len(index) == 4
+    assert [entry[2] for entry in index.ascending()] == ["a", "a2", "b", "c"]
+    assert [entry[2] for entry in index.ascending(150)] == ["b", "c"]
+    assert [entry[2] for entry in index.descending()] == ["c", "b", "a2", "a"]
+    assert [entry[2] for entry in index.between(100, 200)] == ["a", "a2", "b"]
+    assert list(index.between(400, 500)) == []
+    index.remove((100, 1, "a"))
+    index.remove((100, 1, "a"))
+    index.add((150, 4, "d"))
+    assert [entry[2] for entry in index.between(0, 1000)] == ["a2", "d", "b", "c"]
+    assert len(index) == 4
+
+
+def test_price_index_matches_sorted_list(monkeypatch):
+    monkeypatch.setattr(price_index, "BLOCK_SIZE", 4)
+    generator = random.Random(7)
+    index = PriceIndex()
+    entries = set()
+    for position in range(500):
+        entry = (generator.randrange(50), position, position)
+        index.add(entry)
+        entries.add(entry)
+        if generator.random() < 0.4:
+            removed = generator.choice(sorted(entries))
+            index.remove(removed)
+            entries.discard(removed)
+    assert list(index.ascending()) == sorted(entries)
+    assert list(index.descending()) == sorted(entries, reverse=True)
+    assert list(index.between(10, 20)) == [entry for entry in sorted(entries)
+                                           if 10 <= entry[0] <= 20]
+    assert len(index) == len(entries)
+
+
+def test_contains():
+    index = PriceIndex([(5, 0, "a"), (3, 1, "b")])
+    assert (3, 1, "b") in index
+    assert (3, 2, "b") not in index
+    index.remove((3, 1, "b"))
+    assert (3, 1, "b") not in index
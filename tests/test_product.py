@@ -1,5 +1,6 @@
 import pytest
-from products import Product, LimitedImmaterialProduct
+from products import (ImmaterialProduct, Product, LimitedImmaterialProduct, LimitedProduct,
+                      QuoteCache, quote_cache, purchase_error, purchase_errors)
 import promotions
 
 class TestProduct:
@@ -70,4 +71,65 @@ class TestProduct:
         product1 = Product("Name", 10, 200)
         product2 = LimitedImmaterialProduct("Name", 12, 200)
         assert product1 < product2
-        assert not product1 > product2
\ No newline at end of file
+        assert not product1 > product2
+
+    def test_products_have_no_instance_dict(self):
+        product = LimitedProduct("Name", 10, 5, maximum=2)
+        assert not hasattr(product, "__dict__")
+        with pytest.raises(AttributeError): product.color = "red"
+        assert str(product) == "Name, Price: $10, Quantity: 5, Limited to 2 per order!, Promotion: None"
+        assert product.buy(1) == (10, 'Purchase was successful')
+
+    def test_quote_cache_hits_and_invalidation(self):
+        quote_cache.clear()
+        product = Product("Name", 10, 200)
+        product.set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+        assert product.name_and_price(2) == ("Name", 15)
+        assert product.name_and_price(2) == ("Name", 15)
+        assert (quote_cache.hits, quote_cache.misses) == (1, 1)
+        product.set_price(20)
+        assert product.name_and_price(2) == ("Name", 30)
+        product.set_promotion(promotions.ThirdOneFree("Third One Free!"))
+        assert product.name_and_price(3) == ("Name", 40)
+        assert product.name_and_price(2) == ("Name", 40)
+        assert (quote_cache.hits, quote_cache.misses) == (1, 4)
+
+    def test_quote_cache_eviction(self):
+        cache = QuoteCache(maxsize=2)
+        product = Product("Name", 10, 200)
+        for quantity in (1, 2, 1, 3):
+            cache.get(product, quantity, lambda quantity: quantity * 10)
+        assert len(cache) == 2
+        assert (cache.hits, cache.misses) == (1, 3)
+        cache.get(product, 2, lambda quantity: quantity * 10)
+        assert cache.misses == 4
+
+    def test_set_price_wrong_values(self):
+        product = Product("Name", 10, 200)
+        with pytest.raises(TypeError): product.set_price("10")
+        with pytest.raises(ValueError): product.set_price(-1)
+
+    def test_purchase_error_matches_precheck_purchase(self):
+        class CheckedProduct(Product):
+            __slots__ = ()
+
+            def precheck_purchase(self, quantity=1):
+                if quantity == 7:
+                    return False, "no sevens"
+                return super().precheck_purchase(quantity)
+
+        all_products = [ImmaterialProduct("Service", 10),
+                        Product("Name", 10, 5),
+                        LimitedImmaterialProduct("Shipping", 10, maximum=2),
+                        LimitedProduct("Coffee", 10, 5, maximum=3),
+                        LimitedProduct("Tea", 10, 5, maximum=0),
+                        CheckedProduct("Checked", 10, 9)]
+        all_products[1].deactivate()
+        lines = [(product, quantity) for product in all_products
+                 for quantity in (-1, 0, 1, 2, 3, 4, 6, 7, 1.5, "1")]
+        expected = []
+        for product, quantity in lines:
+            precheck, message = product.precheck_purchase(quantity)
+            expected.append(message if precheck is False else None)
+        assert [purchase_error(product, quantity) for product, quantity in lines] == expected
+        assert purchase_errors(lines) == expected
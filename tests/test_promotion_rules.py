@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import pytest
+import promotions
+from products import Product, pricing_mode, quote_cache
+from promotion_rules import PromotionRules
+
+
+class Clock:
+    def __init__(self, moment):
+        self.moment = moment
+
+    def __call__(self):
+        return self.moment
+
+
+def test_rules_stack_by_priority():
+    rules = PromotionRules("Sale")
+    ten_percent = promotions.PercentDiscount("10% off", percent=10)
+    third_free = promotions.ThirdOneFree("Third One Free!")
+    rules.add_rule(ten_percent)
+    rules.add_rule(third_free, names=["Pixel"], priority=5)
+    pixel = Product("Pixel", price=100, quantity=10)
+    mac = Product("Mac", price=1000, quantity=10)
+    pixel.set_promotion(rules)
+    mac.set_promotion(rules)
+    assert rules.get_plan("Pixel") == (third_free, ten_percent)
+    assert rules.get_plan("Mac") == (ten_percent,)
+    assert pixel.buy(3)[0] == pytest.approx(180)
+    assert mac.buy(2)[0] == pytest.approx(1800)
+    assert [rule.promotion for rule in rules.get_rules()] == [third_free, ten_percent]
+
+
+def test_exclusive_rule_applies_alone():
+    rules = PromotionRules("Sale")
+    half = promotions.SecondHalfPrice("Second Half price!")
+    rules.add_rule(promotions.PercentDiscount("10% off", percent=10))
+    exclusive = rules.add_rule(half, names=["Pixel"], priority=5, exclusive=True)
+    assert rules.get_plan("Pixel") == (half,)
+    stacked = rules.add_rule(promotions.ThirdOneFree("Third One Free!"), priority=9)
+    # A higher priority rule applies, so the exclusive rule is skipped
+    assert rules.get_plan("Pixel") == (stacked.promotion, rules.get_rules()[2].promotion)
+    rules.remove_rule(stacked)
+    rules.remove_rule(exclusive)
+    assert len(rules.get_plan("Pixel")) == 1
+
+
+def test_date_windows():
+    clock = Clock(datetime(2026, 3, 1))
+    rules = PromotionRules("Sale", clock=clock)
+    rules.add_rule(promotions.PercentDiscount("50% off", percent=50),
+                   start=datetime(2026, 3, 10), end=datetime(2026, 3, 20))
+    pixel = Product("Pixel", price=100, quantity=10)
+    pixel.set_promotion(rules)
+    assert not rules.cacheable
+    assert pixel.name_and_price(2)[1] == 200
+    clock.moment = datetime(2026, 3, 10)
+    assert pixel.name_and_price(2)[1] == 100
+    clock.moment = datetime(2026, 3, 20)
+    assert pixel.name_and_price(2)[1] == 200
+    with pytest.raises(ValueError):
+        rules.add_rule(promotions.ThirdOneFree("Third One Free!"),
+                       start=datetime(2026, 3, 20), end=datetime(2026, 3, 10))
+
+
+def test_rule_changes_drop_cached_quotes():
+    rules = PromotionRules("Sale")
+    pixel = Product("Pixel", price=100, quantity=10)
+    pixel.set_promotion(rules)
+    assert pixel.name_and_price(3)[1] == 300
+    rule = rules.add_rule(promotions.ThirdOneFree("Third One Free!"))
+    assert pixel.name_and_price(3)[1] == 200
+    rules.remove_rule(rule)
+    assert pixel.name_and_price(3)[1] == 300
+    quote_cache.clear()
+
+
+def test_exact_stacked_price_is_rounded_once():
+    rules = PromotionRules("Sale")
+    rules.add_rule(promotions.SecondHalfPrice("Second Half price!"))
+    rules.add_rule(promotions.PercentDiscount("15% off", percent=15))
+    pixel = Product("Pixel", price=99, quantity=10)
+    pixel.set_promotion(rules)
+    pricing_mode.use_exact()
+    try:
+        # 99 * 1.5 * 0.85 = 126.225
+        assert pixel.buy(2)[0] == 126
+    finally:
+        pricing_mode.use_float()
+
+
+def test_nesting_is_refused():
+    with pytest.raises(TypeError):
+        PromotionRules("Outer").add_rule(PromotionRules("Inner"))
+
+
+def test_rule_changes_keep_other_quotes_and_counters():
+    quote_cache.clear()
+    rules = PromotionRules("Sale")
+    pixel = Product("Pixel", price=100, quantity=10)
+    pixel.set_promotion(rules)
+    mac = Product("Mac", price=1000, quantity=10)
+    mac.set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    pixel.name_and_price(3)
+    mac.name_and_price(2)
+    rules.add_rule(promotions.ThirdOneFree("Third One Free!"))
+    assert len(quote_cache) == 1
+    assert (quote_cache.hits, quote_cache.misses) == (0, 2)
+    mac.name_and_price(2)
+    assert quote_cache.hits == 1
+    quote_cache.clear()
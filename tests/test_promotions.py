@@ -0,0 +1,90 @@
+from decimal import Decimal, localcontext
+from fractions import Fraction
+
+import pytest
+import promotions
+from products import Product, pricing_mode
+from store import Store
+
+
+class OneEuroOff(promotions.Promotion):
+    def apply_promotion(self, product, quantity):
+        return (product.get_price() - 1) * quantity
+
+
+@pytest.mark.parametrize("promotion", [promotions.SecondHalfPrice("Second Half price!"),
+                                       promotions.ThirdOneFree("Third One Free!"),
+                                       promotions.PercentDiscount("30% off!", percent=30),
+                                       promotions.PercentDiscount("17% off!", percent=17),
+                                       OneEuroOff("1 off")])
+def test_batch_matches_scalar(promotion):
+    prices = [price for price in (0, 1, 7, 10, 99, 1450, 123457) for _ in range(8)]
+    quantities = list(range(1, 9)) * 7
+    expected = [promotion.apply_promotion(Product("Name", price, 100), quantity)
+                for price, quantity in zip(prices, quantities)]
+    assert promotion.apply_promotion_batch(prices, quantities) == expected
+
+
+
+def rounded(value, rounding):
+    """ Round an exact fraction with the decimal module. """
+    with localcontext() as context:
+        context.prec = 50
+        decimal_value = Decimal(value.numerator) / Decimal(value.denominator)
+        return int(decimal_value.quantize(Decimal(1), rounding=rounding))
+
+
+EXACT_CASES = [
+    (promotions.SecondHalfPrice("Second Half price!"),
+     lambda price, quantity: price * (quantity - Fraction(quantity // 2, 2))),
+    (promotions.ThirdOneFree("Third One Free!"),
+     lambda price, quantity: Fraction(price * (quantity - quantity // 3))),
+    (promotions.PercentDiscount("30% off!", percent=30),
+     lambda price, quantity: Fraction(price * quantity * 70, 100)),
+    (promotions.PercentDiscount("12.5% off!", percent=12.5),
+     lambda price, quantity: Fraction(price * quantity * 875, 1000)),
+    (OneEuroOff("1 off"), lambda price, quantity: Fraction((price - 1) * quantity)),
+]
+
+
+@pytest.mark.parametrize("rounding", promotions.ROUNDINGS)
+@pytest.mark.parametrize("promotion, exact_value", EXACT_CASES)
+def test_exact_prices_are_rounded_integers(promotion, exact_value, rounding):
+    prices = [price for price in (1, 7, 10, 99, 1450, 123457) for _ in range(8)]
+    quantities = list(range(1, 9)) * 6
+    expected = [rounded(exact_value(price, quantity), rounding)
+                for price, quantity in zip(prices, quantities)]
+    scalar = [promotion.apply_promotion_exact(Product("Name", price, 100), quantity, rounding)
+              for price, quantity in zip(prices, quantities)]
+    assert scalar == expected
+    assert all(isinstance(price, int) for price in scalar)
+    assert promotion.apply_promotion_batch_exact(prices, quantities, rounding) == expected
+
+
+def test_divide_rounded():
+    assert [promotions.divide_rounded(n, 2) for n in (1, 3, 5)] == [0, 2, 2]
+    assert [promotions.divide_rounded(n, 2, promotions.ROUND_HALF_UP) for n in (1, 3)] == [1, 2]
+    assert promotions.divide_rounded(7, 4, promotions.ROUND_FLOOR) == 1
+    assert promotions.divide_rounded(5, 4, promotions.ROUND_CEILING) == 2
+    with pytest.raises(ValueError):
+        promotions.divide_rounded(1, 2, "ROUND_SOMEWHERE")
+
+
+def test_exact_pricing_mode_order_totals_are_integers():
+    product_list = [Product("MacBook Air M2", price=145099, quantity=100),
+                    Product("Bose QuietComfort Earbuds", price=24999, quantity=500)]
+    product_list[0].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    product_list[1].set_promotion(promotions.PercentDiscount("17% off!", percent=17))
+    best_buy = Store(product_list)
+    shopping_list = [(product_list[0], 3), (product_list[1], 3), (product_list[1], 1)]
+    pricing_mode.use_exact(promotions.ROUND_HALF_UP)
+    try:
+        price, _ = best_buy.order(shopping_list)
+        # 362747.5 + 62247.51 + 20749.17, each line rounded half up
+        assert price == 362748 + 62248 + 20749
+        assert best_buy.order_many([shopping_list]) == [(price, "Order completed successfully.")]
+        with pytest.raises(ValueError):
+            pricing_mode.use_exact("ROUND_SOMEWHERE")
+    finally:
+        pricing_mode.use_float()
+    assert isinstance(best_buy.order(shopping_list)[0], float)
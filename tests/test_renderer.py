@@ -0,0 +1,92 @@
+import io
+
+import main
+from renderer import CLEAR_SCREEN, Renderer, move_to, page_lines
+
+
+class FakeTerminal(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def isatty(self):
+        return True
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+def terminal_renderer(monkeypatch, rows=40):
+    terminal = FakeTerminal()
+    renderer = Renderer(terminal)
+    monkeypatch.setattr(renderer, "rows", lambda: rows)
+    return renderer, terminal
+
+
+def test_not_a_terminal_gets_plain_lines():
+    stream = io.StringIO()
+    renderer = Renderer(stream)
+    renderer.clear()
+    renderer.show(["a", "b"])
+    renderer.show(["a", "c"])
+    assert stream.getvalue() == "a\nb\na\nc\n"
+
+
+def test_screen_is_written_in_one_call(monkeypatch):
+    renderer, terminal = terminal_renderer(monkeypatch)
+    renderer.show([f"line {i}" for i in range(20)])
+    assert terminal.writes == 1
+    assert terminal.getvalue().startswith(CLEAR_SCREEN + "line 0\nline 1\n")
+
+
+def test_only_changed_lines_are_redrawn(monkeypatch):
+    renderer, terminal = terminal_renderer(monkeypatch)
+    renderer.show(["header", "product 1", "product 2"])
+    terminal.seek(0)
+    terminal.truncate()
+    renderer.show(["header", "product 1", "product 2", "order 1"])
+    output = terminal.getvalue()
+    assert "product" not in output
+    assert move_to(4) + "order 1" in output
+    assert terminal.writes == 2
+
+
+def test_tall_screens_are_drawn_in_full(monkeypatch):
+    renderer, terminal = terminal_renderer(monkeypatch, rows=10)
+    renderer.show(["a", "b", "c"])
+    renderer.show(["a", "b", "d"])
+    assert terminal.getvalue().count(CLEAR_SCREEN) == 2
+
+
+def test_page_lines():
+    lines = [str(i) for i in range(25)]
+    assert page_lines(lines, 0, 10) == lines[:10] + ["   Page 1 of 3"]
+    assert page_lines(lines, 2, 10) == lines[20:] + ["   Page 3 of 3"]
+    assert page_lines([], 0, 10) == ["   Page 1 of 1"]
+
+
+def test_print_products_pages_on_a_terminal(monkeypatch):
+    renderer, terminal = terminal_renderer(monkeypatch, rows=7)
+    monkeypatch.setattr(main, "screen", renderer)
+    answers = iter(["", "q"])
+    monkeypatch.setattr("builtins.input", lambda _: next(answers))
+    main.print_products(main.setup_store())
+    output = terminal.getvalue()
+    assert "Page 1 of 3" in output and "Page 2 of 3" in output
+    assert "Page 3 of 3" not in output
+
+
+def test_get_order_pages_a_tall_catalog(monkeypatch):
+    renderer, terminal = terminal_renderer(monkeypatch, rows=7)
+    monkeypatch.setattr(main, "screen", renderer)
+    answers = iter(["", "", "3", "2", "1", "1", ""])
+    monkeypatch.setattr("builtins.input", lambda _: next(answers))
+    cart = main.get_order(main.setup_store())
+    assert [quantity for _, quantity in cart.items()] == [2, 1]
+    output = terminal.getvalue()
+    assert "Page 3 of 3" in output
+    # The products are listed once and never drawn again with the order
+    assert output.count("MacBook Air M2, Price") == 1
+    assert output.count(CLEAR_SCREEN) == 1
+    assert output.count("Your order so far") == 2
@@ -0,0 +1,61 @@
+import search
+from search import NameSearch, PrefixIndex, tokenize
+
+
+class Named:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_tokenize():
+    assert tokenize("Google Pixel-7, 128GB") == ["google", "pixel", "7", "128gb"]
+
+
+def test_prefix_index_keys_in_order(monkeypatch):
+    monkeypatch.setattr(search, "MERGE_THRESHOLD", 3)
+    index = PrefixIndex()
+    keys = ["pear", "apple", "pea", "peach", "banana", "pe", "plum", "apricot"]
+    for number, key in enumerate(keys):
+        index.add(key, number)
+        assert list(index.keys_with_prefix("pe")) == sorted(
+            key for key in keys[:number + 1] if key.startswith("pe"))
+    assert list(index.values_with_prefix("ap")) == [1, 7]
+    index.add("pea", 8)
+    assert index.get("pea") == [2, 8]
+    index.remove("pea", 2)
+    index.remove("pea", 8)
+    index.remove("pear", 0)
+    assert list(index.values_with_prefix("pe")) == [5, 3]
+    index.add("pear", 9)
+    assert list(index.values_with_prefix("pear")) == [9]
+    assert len(index) == 7
+
+
+def test_prefix_index_drops_empty_keys(monkeypatch):
+    monkeypatch.setattr(search, "MERGE_THRESHOLD", 0)
+    index = PrefixIndex()
+    for number in range(100):
+        index.add(f"key {number}", number)
+    for number in range(50):
+        index.remove(f"key {number}", number)
+    assert list(index.values_with_prefix("key")) == sorted(range(50, 100), key=str)
+    index.add("key 1", 1)
+    assert list(index.keys_with_prefix("key 1")) == ["key 1"] + [
+        f"key {number}" for number in sorted(range(50, 100), key=str) if str(number)[0] == "1"]
+    assert len(index) == 51
+
+
+def test_name_search():
+    products = [Named(name) for name in ("Google Pixel 7", "Pixel Buds", "Google Home",
+                                         "MacBook Air M2", "Pixelated Art Print")]
+    name_search = NameSearch(products)
+    assert name_search.search("PIXEL") == [products[0], products[1], products[4]]
+    assert name_search.search("goo pix") == [products[0]]
+    assert name_search.search("pix", limit=2) == [products[0], products[1]]
+    assert name_search.search("pix goo", accept=lambda product: product is not products[0]) == []
+    assert name_search.search("") == []
+    assert name_search.search_prefix("google") == [products[2], products[0]]
+    name_search.remove(products[0])
+    assert name_search.search_prefix("goo") == [products[2]]
+    name_search.add(products[0])
+    assert name_search.search("7") == [products[0]]
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import main
+from server import StoreServer
+
+
+async def send(port, *requests):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    answers = []
+    for request in requests:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        answers.append(json.loads(await reader.readline()))
+    writer.close()
+    await writer.wait_closed()
+    return answers
+
+
+def run_with_server(client):
+    async def run():
+        server = StoreServer(main.setup_store())
+        await server.start()
+        try:
+            return await client(server)
+        finally:
+            await server.close()
+    return asyncio.run(run())
+
+
+def test_list_and_totals():
+    answers = run_with_server(lambda server: send(server.port, {"command": "list"},
+                                                  {"command": "totals"}))
+    assert answers[0]["ok"]
+    assert answers[0]["result"][0]["description"] == \
+        "MacBook Air M2, Price: $1450, Quantity: 100, Promotion: Second Half price!"
+    assert answers[1]["result"] == {"total_quantity": 950, "product_types": 7,
+                                    "stock_value": 145000 + 125000 + 125000 + 10000}
+
+
+def test_validate_and_order():
+    answers = run_with_server(lambda server: send(
+        server.port,
+        {"command": "validate", "items": [["Shipping", 2]]},
+        {"command": "order", "items": [["MacBook Air M2", 2], ["Shipping", 1]]},
+        {"command": "order", "items": [["Nothing", 1]]},
+        {"command": "dance"}))
+    assert answers[0]["result"] == {
+        "valid": False, "message": "Shipping is a limited product. Only 1 allowed in one purchase"}
+    assert answers[1]["result"] == {"price": 2185.0, "message": "Order completed successfully."}
+    assert answers[2] == {"ok": False, "error": "Product Nothing is not in the store"}
+    assert answers[3] == {"ok": False, "error": "Unknown command dance"}
+
+
+def test_many_clients_do_not_oversell():
+    async def clients(server):
+        order = {"command": "order", "items": [["MacBook Air M2", 1]]}
+        answers = await asyncio.gather(*(send(server.port, order, order) for _ in range(200)))
+        return [answer for pair in answers for answer in pair], server.best_buy
+    answers, best_buy = run_with_server(clients)
+    assert sum(1 for answer in answers if answer["ok"]) == 100
+    assert best_buy.find_product("MacBook Air M2").get_quantity() == 0
+
+
+def test_failing_order_does_not_stop_the_server():
+    async def clients(server):
+        huge = {"command": "order", "items": [["Windows License", 10 ** 400]]}
+        pixel = {"command": "order", "items": [["Google Pixel 7", 1]]}
+        answers = await asyncio.gather(send(server.port, huge, pixel),
+                                       send(server.port, pixel))
+        return [answer for pair in answers for answer in pair], server.best_buy
+    answers, best_buy = run_with_server(clients)
+    assert not answers[0]["ok"]
+    assert answers[0]["error"].startswith("Request failed")
+    assert answers[1]["ok"] and answers[2]["ok"]
+    assert best_buy.find_product("Google Pixel 7").get_quantity() == 248
@@ -0,0 +1,133 @@
+import threading
+
+import pytest
+import products
+import promotions
+from sharded_store import ShardedStore
+from store import Store
+
+
+def product_list():
+    product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
+                    products.Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    products.Product("Google Pixel 7", price=500, quantity=250),
+                    products.ImmaterialProduct("Windows License", price=125),
+                    products.LimitedImmaterialProduct("Shipping", price=10, maximum=1),
+                    products.LimitedProduct("Rare coffee", price=100, maximum=3, quantity=100),
+                    ]
+    product_list[0].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    return product_list
+
+
+def test_reads_gather_all_shards():
+    sharded = ShardedStore(product_list(), shard_count=3)
+    try:
+        store = Store(product_list())
+        assert ([str(product) for product in sharded.get_all_products()]
+                == [str(product) for product in store.get_all_products()])
+        assert sharded.get_total_quantity() == store.get_total_quantity()
+        assert sharded.get_product_type_quantity() == store.get_product_type_quantity()
+        assert sharded.get_stock_value() == store.get_stock_value()
+        assert sharded.find_product("Shipping").get_price() == 10
+        assert sharded.find_product("Nothing") is None
+    finally:
+        sharded.close()
+
+
+def test_orders_match_store():
+    orders = [[("MacBook Air M2", 3), ("Shipping", 1)],
+              [("Google Pixel 7", 2), ("Bose QuietComfort Earbuds", 10), ("Google Pixel 7", 1)],
+              [("Rare coffee", 4)],
+              [("Nothing", 1)],
+              [("Windows License", 2), ("Bose QuietComfort Earbuds", 1000)],
+              [("Bose QuietComfort Earbuds", 490)],
+              [],
+              ["MacBook Air M2"]]
+    sharded = ShardedStore(product_list(), shard_count=3)
+    try:
+        store = Store(product_list())
+        expected = []
+        for items in orders:
+            shopping_list, message = store.resolve_shopping_list(items)
+            expected.append(store.order(shopping_list) if shopping_list is not None
+                            else (None, message))
+        assert [sharded.order(items) for items in orders] == expected
+        assert ([str(product) for product in sharded.get_all_products()]
+                == [str(product) for product in store.get_all_products()])
+    finally:
+        sharded.close()
+
+
+def test_order_many_matches_order():
+    orders = [[("MacBook Air M2", i % 7 + 1)] for i in range(40)]
+    orders += [[("Bose QuietComfort Earbuds", 100), ("MacBook Air M2", 1)],
+               [("Bose QuietComfort Earbuds", 450)], [("Shipping", 1)]]
+    first_sharded = ShardedStore(product_list(), shard_count=3)
+    second_sharded = ShardedStore(product_list(), shard_count=3)
+    try:
+        assert (first_sharded.order_many(orders)
+                == [second_sharded.order(items) for items in orders])
+        assert first_sharded.get_total_quantity() == second_sharded.get_total_quantity()
+    finally:
+        first_sharded.close()
+        second_sharded.close()
+
+
+def test_order_across_shards_is_atomic():
+    sharded = ShardedStore(product_list(), shard_count=3)
+    try:
+        first, other = "MacBook Air M2", "Bose QuietComfort Earbuds"
+        assert sharded.shard_of(first) != sharded.shard_of(other)
+        quantity = sharded.get_total_quantity()
+        price, message = sharded.order([(first, 1), (other, 100_000)])
+        assert price is None
+        assert sharded.get_total_quantity() == quantity
+        assert sharded.order([(first, 1), (other, 1)])[0] is not None
+    finally:
+        sharded.close()
+
+
+def test_add_and_remove_product():
+    sharded = ShardedStore(shard_count=2)
+    try:
+        sharded.add_products(product_list())
+        sharded.add_product(products.Product("MacBook Air M2", price=1450, quantity=5))
+        assert sharded.find_product("MacBook Air M2").get_quantity() == 105
+        sharded.remove_product(sharded.find_product("Google Pixel 7"))
+        assert sharded.find_product("Google Pixel 7") is None
+        assert sharded.get_product_type_quantity() == 5
+    finally:
+        sharded.close()
+
+
+def test_prepared_shards_are_aborted_when_a_shard_raises():
+    product_list_with_discount = product_list()
+    product_list_with_discount[3].set_promotion(promotions.PercentDiscount("30% off!",
+                                                                           percent=30))
+    sharded = ShardedStore(product_list_with_discount, shard_count=3)
+    try:
+        assert sharded.shard_of("MacBook Air M2") != sharded.shard_of("Windows License")
+        quantity = sharded.get_total_quantity()
+        with pytest.raises(OverflowError):
+            sharded.order([("MacBook Air M2", 5), ("Bose QuietComfort Earbuds", 5),
+                           ("Windows License", 10 ** 400)])
+        assert sharded.get_total_quantity() == quantity
+        assert sharded.order([("MacBook Air M2", 100)])[0] is not None
+    finally:
+        sharded.close()
+
+
+def test_orders_to_other_shards_do_not_wait():
+    sharded = ShardedStore(product_list(), shard_count=3)
+    try:
+        busy_shard = sharded.shard_of("Shipping")
+        assert busy_shard != sharded.shard_of("MacBook Air M2")
+        results = []
+        with sharded._shard_locks[busy_shard]:
+            order = threading.Thread(
+                target=lambda: results.append(sharded.order([("MacBook Air M2", 1)])))
+            order.start()
+            order.join(5)
+            assert results == [(1450, "Order completed successfully.")]
+    finally:
+        sharded.close()
@@ -1,4 +1,10 @@
+import random
+import sys
+import threading
+
+import pytest
 import products
+import promotions
 from store import Store
 
 class TestStore:
@@ -107,3 +113,250 @@ class TestStore:
             assert product in store3
         for product in store2.get_all_products():
             assert product in store3
+
+    def test_adding_stores_merges_equal_products(self):
+        store1 = Store([products.Product("MacBook Air M2", price=1450, quantity=100),
+                        products.ImmaterialProduct("Windows License", price=125)])
+        store2 = Store([products.Product("MacBook Air M2", price=1450, quantity=5),
+                        products.ImmaterialProduct("Windows License", price=125),
+                        products.Product("MacBook Air M2", price=1500, quantity=7)])
+        store3 = store1 + store2
+        assert store3.list_of_products == store1.list_of_products + [store2.list_of_products[2]]
+        assert store3.list_of_products[0].get_quantity() == 105
+        assert store3.get_total_quantity() == 112
+
+    def test_merge_stores_matches_adding_products(self):
+        def regional_store():
+            return Store([products.Product(f"Product {i % 50}", price=i % 70, quantity=i)
+                          for i in range(200)])
+        stores = [regional_store() for _ in range(4)]
+        reference_stores = [regional_store() for _ in range(4)]
+        merged = Store.merge_stores(*stores)
+        reference = Store([])
+        for reference_store in reference_stores:
+            for product in reference_store.list_of_products:
+                reference.add_product(product)
+        assert ([(product.name, product.get_price(), product.get_quantity())
+                 for product in merged.list_of_products]
+                == [(product.name, product.get_price(), product.get_quantity())
+                    for product in reference.list_of_products])
+        assert merged.get_total_quantity() == reference.get_total_quantity()
+        assert Store.merge_stores().list_of_products == []
+
+    def test_index_follows_add_and_remove(self):
+        store = Store([])
+        product1 = products.Product("MacBook Air M2", price=1450, quantity=100)
+        store.add_product(product1)
+        assert product1 in store
+        store.remove_product(product1)
+        assert product1 not in store
+        product2 = products.Product("MacBook Air M2", price=1450, quantity=10)
+        store.add_product(product2)
+        assert store.get_all_products() == [product2]
+        assert product1.get_quantity() == 100
+
+    def test_search(self):
+        store = self.setup()
+        mac, bose, pixel, windows, service, shipping, coffee = store.list_of_products
+        assert store.search("google pix") == [pixel]
+        assert store.search_prefix("mac") == [mac]
+        pixel.deactivate()
+        assert store.search("pixel") == []
+        pixel.activate()
+        store.remove_product(pixel)
+        assert store.search("pixel") == []
+        pixel2 = products.Product("Google Pixel 8", price=700, quantity=10)
+        store.add_product(pixel2)
+        assert store.search("Google") == [pixel2]
+
+    def test_price_queries(self):
+        store = self.setup()
+        mac, bose, pixel, windows, service, shipping, coffee = store.list_of_products
+        assert store.get_products_between(100, 400) == [coffee, windows, bose, service]
+        assert store.get_products_between(100, 400, limit=2) == [coffee, windows]
+        assert store.get_cheapest_products(2) == [shipping, coffee]
+        assert store.get_most_expensive_products(2) == [mac, pixel]
+        pixel.set_price(2000)
+        coffee.deactivate()
+        store.remove_product(shipping)
+        store.add_product(products.Product("Cheap cable", price=5, quantity=0))
+        assert store.get_cheapest_products(2) == [windows, bose]
+        assert store.get_most_expensive_products(2) == [pixel, mac]
+        assert store.get_products_between(100, 400) == [windows, bose, service]
+        # Activated with no stock: listed, but not in stock
+        mac.set_quantity(0)
+        mac.activate()
+        assert store.get_products_between(1450, 1450) == [mac]
+        assert store.get_cheapest_products(10)[-1] is pixel
+
+    def test_add_product_large_catalog(self):
+        store = Store()
+        for i in range(20000):
+            store.add_product(products.Product(f"Product {i}", price=i, quantity=1))
+        store.add_product(products.Product("Product 19999", price=19999, quantity=4))
+        assert len(store.list_of_products) == 20000
+        assert store.list_of_products[-1].get_quantity() == 5
+
+    def test_order_many_matches_order(self):
+        store1 = self.setup()
+        store2 = self.setup()
+        products1 = store1.get_all_products()
+        products2 = store2.get_all_products()
+        orders = [[(0, 60), (5, 1)], [(0, 60)], [(0, 40), (0, 1)], "wrong",
+                  [(6, 1), (3, 2), (6, 1)], [(1, 3), (1, 3)], [(2, 250)], [(2, 1)]]
+        results = store1.order_many([[(products1[i], q) for i, q in o]
+                                     if isinstance(o, list) else [o] for o in orders])
+        expected = [store2.order([(products2[i], q) for i, q in o])
+                    if isinstance(o, list) else store2.order([o]) for o in orders]
+        assert results == expected
+        assert results[1] == (None, 'there are only 40 pieces of MacBook Air M2. Cannot sell 60')
+        assert ([product.get_quantity() for product in products1[:3]] ==
+                [product.get_quantity() for product in products2[:3]])
+        assert store1.get_product_type_quantity() == store2.get_product_type_quantity()
+
+    def test_order_many_matches_order_when_stock_runs_out(self):
+        generator = random.Random(3)
+        store1 = self.setup()
+        store2 = self.setup()
+        products1 = store1.get_all_products()
+        products2 = store2.get_all_products()
+        orders = [[(generator.randrange(7), generator.randrange(-1, 40))
+                   for _ in range(generator.randrange(1, 4))] for _ in range(200)]
+        results = store1.order_many([[(products1[i], q) for i, q in o] for o in orders])
+        expected = [store2.order([(products2[i], q) for i, q in o]) for o in orders]
+        assert results == expected
+        assert ([str(product) for product in products1] ==
+                [str(product) for product in products2])
+
+    def test_order_many_gives_stock_back_on_errors(self):
+        class FailingPromotion(promotions.Promotion):
+            def apply_promotion(self, product, quantity):
+                raise OverflowError("price too large")
+        store = self.setup()
+        mac, bose, pixel = store.get_all_products()[:3]
+        pixel.set_promotion(FailingPromotion("Broken"))
+        with pytest.raises(OverflowError):
+            store.order_many([[(mac, 100)], [(bose, 1)], [(mac, 1)], [(pixel, 1)]])
+        assert (mac.get_quantity(), bose.get_quantity(), pixel.get_quantity()) == (100, 500, 250)
+
+    def test_order_in_parallel_does_not_oversell(self):
+        store = self.setup()
+        mac, bose, pixel = store.get_all_products()[:3]
+        # The price index is changed by the orders when products sell out
+        assert store.get_cheapest_products(1) == [store.find_product("Shipping")]
+        shopping_lists = []
+        for i in range(3000):
+            shopping_lists.append([(mac, 1), (bose, 1)] if i % 2 else [(bose, 1), (pixel, 1)])
+        results = store.order_in_parallel(shopping_lists, max_workers=8)
+        succeeded = [shopping_list for shopping_list, (price, _) in zip(shopping_lists, results)
+                     if price is not None]
+        sold = {product: sum(quantity for shopping_list in succeeded
+                             for item, quantity in shopping_list if item is product)
+                for product in (mac, bose, pixel)}
+        assert mac.get_quantity() == 100 - sold[mac] == 0
+        assert pixel.get_quantity() == 250 - sold[pixel] == 0
+        assert bose.get_quantity() == 500 - sold[bose] == 150
+        assert len(succeeded) == 350
+        assert store.get_most_expensive_products(10) == sorted(
+            store.get_all_products(), key=lambda product: -product.get_price())
+
+    def test_price_index_follows_parallel_orders(self):
+        # Switch threads often, so the orders run into each other
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for _ in range(5):
+                product_list = [products.Product(f"Product {i}", price=i % 100 + 1, quantity=1)
+                                for i in range(3000)]
+                store = Store(product_list)
+                assert len(store.get_cheapest_products(1)) == 1
+                results = store.order_in_parallel([[(product, 1)]
+                                                   for product in product_list[::2]],
+                                                  max_workers=16)
+                assert all(price is not None for price, _ in results)
+                assert store.get_products_between(0, 1000) == sorted(
+                    product_list[1::2], key=lambda product: product.get_price())
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+    def test_cached_product_list_follows_changes_from_other_threads(self):
+        store = self.setup()
+        mac = store.find_product("MacBook Air M2")
+        deactivation = threading.Thread(target=mac.deactivate)
+
+        class ChangingDict(dict):
+            def items(self):
+                items = list(super().items())
+                if deactivation.ident is None:
+                    # Another thread deactivates a product while the list is built
+                    deactivation.start()
+                    deactivation.join(0.1)
+                return items
+
+        store._active_products = ChangingDict(store._active_products)
+        store.get_all_products()
+        deactivation.join()
+        assert mac not in store.get_all_products()
+
+    def test_find_product(self):
+        store = self.setup()
+        assert store.find_product("Google Pixel 7") is store.get_all_products()[2]
+        store.remove_product(store.find_product("Google Pixel 7"))
+        assert store.find_product("Google Pixel 7") is None
+
+    def test_active_products_follow_product_changes(self):
+        store = self.setup()
+        mac, bose, pixel = store.get_all_products()[:3]
+        bose.deactivate()
+        assert store.get_all_products()[:2] == [mac, pixel]
+        assert store.get_product_type_quantity() == 6
+        store.order([(mac, 100)])
+        assert mac not in store.get_all_products()
+        bose.activate()
+        pixel.set_quantity(0)
+        assert store.get_all_products()[:2] == [bose, store.find_product("Windows License")]
+        assert store.get_product_type_quantity() == 5
+        mac.set_quantity(1)
+        assert store.get_all_products()[0] is mac
+        store.remove_product(mac)
+        mac.set_quantity(5)
+        assert mac not in store.get_all_products()
+
+    def test_price_change_keeps_catalog_index(self):
+        store = self.setup()
+        pixel = store.find_product("Google Pixel 7")
+        pixel.set_price(450)
+        store.add_product(products.Product("Google Pixel 7", price=450, quantity=10))
+        assert pixel.get_quantity() == 260
+        assert store.get_product_type_quantity() == 7
+
+    def test_stock_counters(self):
+        store = self.setup()
+        assert store.get_total_quantity() == 950
+        assert store.get_quantity_by_type() == {"Product": 850, "LimitedProduct": 100}
+        assert store.get_stock_value() == 145000 + 125000 + 125000 + 10000
+        mac, bose = store.get_all_products()[:2]
+        store.order([(mac, 10), (bose, 2)])
+        bose.set_quantity(600)
+        mac.set_price(1000)
+        assert store.get_total_quantity() == 1040
+        assert store.get_stock_value() == 90000 + 150000 + 125000 + 10000
+        store.remove_product(bose)
+        store.add_product(products.Product("Dell 1001", price=1000, quantity=10))
+        store.add_product(products.Product("Dell 1001", price=1000, quantity=10))
+        store.add_product(products.ImmaterialProduct("Windows License", price=125))
+        assert store.get_total_quantity() == 460
+        assert store.get_quantity_by_type() == {"Product": 360, "LimitedProduct": 100}
+        assert (store + self.setup()).get_total_quantity() == 460 + 950
+
+    def test_discarded_store_is_not_kept_alive(self):
+        import gc
+        import weakref
+        store = self.setup()
+        merged = store + Store([])
+        merged_reference = weakref.ref(merged)
+        del merged
+        gc.collect()
+        assert merged_reference() is None
+        store.get_all_products()[0].set_quantity(1)
+        assert store.get_total_quantity() == 851